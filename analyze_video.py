@@ -1,71 +1,252 @@
 import cv2
 import mediapipe as mp
+import os
 import sys
-import json
+import glob
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# 解析プロファイル設定はCloud Functions側と共通（functions/analysis_profile.py）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'functions'))
+from analysis_profile import get_analysis_profile
+from pose_pool import checkout_pose
+from analyze import iter_landmarks, IncrementalScorer
+from landmark_format import open_landmark_writer
+from motion_gate import ANALYSIS_MOTION_GATE
+from thread_tuning import available_cpus, tune_threads
 
 # MediaPipeの描画ユーティリティとPoseモデルを準備
 mp_drawing = mp.solutions.drawing_utils
 mp_pose = mp.solutions.pose
 
-def analyze_video(video_path):
+DEFAULT_OUTPUT_PATH = 'public/landmarks.json'
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.m4v', '.avi', '.mkv')
+
+def analyze_video(video_path, profile=None, output_path=DEFAULT_OUTPUT_PATH):
     """
-    動画ファイルを解析し、骨格情報をJSONファイルに出力します。
+    動画ファイルを解析し、骨格情報をファイルに出力します。
+
+    出力パスの拡張子が .lmk の場合はバイナリ形式、.lmq / .lmq.gz の場合はWeb再生用の量子化形式
+    （いずれも functions/landmark_format.py）、.jsonl の場合は1行1フレームのJSON Lines、
+    それ以外は従来どおりのJSONで保存します。
+    骨格情報は検出したフレームから順にファイルへ書き出すため、動画が長くてもメモリ使用量は増えず、
+    途中で止まった場合も .lmk / .lmq / .jsonl はそこまでの結果を読み込めます。
 
     Args:
         video_path (str): 解析したい動画ファイルのパス
+        profile (str | dict): 解析プロファイル（省略時は環境変数 ANALYSIS_PROFILE）
+        output_path (str): 出力するファイルのパス（.json / .jsonl / .lmk / .lmq / .lmq.gz）
+
+    Returns:
+        dict: frames（読み込んだフレーム数）/ detected_frames / fps / scores
+              （スコアは同じ推論結果から IncrementalScorer で集計）、動画が開けなかった場合はNone
     """
-    # Poseモデルを初期化
-    with mp_pose.Pose(
-        min_detection_confidence=0.5,  # 検出の信頼度の最小値
-        min_tracking_confidence=0.5) as pose: # 追跡の信頼度の最小値
-
-        # 動画ファイルを読み込む
-        cap = cv2.VideoCapture(video_path)
-
-        # 動画ファイルが正常に開けたか確認
-        if not cap.isOpened():
-            print(f"エラー: 動画ファイルが開けませんでした。パスを確認してください: {video_path}", file=sys.stderr)
-            return
-
-        frame_count = 0
-        all_landmarks = []
-        while cap.isOpened():
-            # 1フレームずつ読み込む
-            success, image = cap.read()
-            if not success:
-                # 動画の終わりに達したらループを抜ける
-                break
-
-            frame_count += 1
-
-            # パフォーマンス向上のため、画像を書き込み不可にして参照渡しにする
-            image.flags.writeable = False
-            
-            # MediaPipeが処理できるように、色の形式をBGRからRGBに変換
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            
-            # Poseモデルで画像（フレーム）を処理
-            results = pose.process(image_rgb)
-
-            # 検出された骨格情報をリストに追加
-            if results.pose_landmarks:
-                landmarks = [{'x': lm.x, 'y': lm.y, 'z': lm.z, 'visibility': lm.visibility} for lm in results.pose_landmarks.landmark]
-                all_landmarks.append({'frame': frame_count, 'landmarks': landmarks})
+    analysis_profile = get_analysis_profile(profile)
+    # OpenCVと推論のスレッド数をCPU割り当てに合わせる（プロセスで最初の1回だけ、Poseは1つずつ使う）
+    tune_threads(concurrent_poses=1)
+
+    # 動画ファイルを読み込む
+    cap = cv2.VideoCapture(video_path)
+
+    # 動画ファイルが正常に開けたか確認
+    if not cap.isOpened():
+        print(f"エラー: 動画ファイルが開けませんでした。パスを確認してください: {video_path}", file=sys.stderr)
+        return
 
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    frame_count = 0
+    scorer = IncrementalScorer(fps)
+    try:
+        # 出力するvisibilityまで新規インスタンスと一致させるため、Poseはプールを使わずに新規生成する（exact=True）
+        # デコード → 縮小 → 色変換 → 推論は Cloud Functions 側のスコアリングと共通の iter_landmarks で行う
+        with checkout_pose(analysis_profile, exact=True) as pose, \
+                open_landmark_writer(output_path, fps, width, height) as writer:
+            # 環境変数 ANALYSIS_MOTION_GATE が有効な場合は、動きのないフレームで直前の骨格情報を使い回す
+            frames = iter_landmarks(cap, pose, 1, analysis_profile['max_long_side'], motion_gate=ANALYSIS_MOTION_GATE)
+            for frame_index, landmarks in frames:
+                frame_count += 1
+                # 検出された骨格情報をフレームごとにファイルへ追記する（定期的にフラッシュ）
+                if landmarks is not None:
+                    writer.append_points(landmarks, frame_index)
+                    scorer.update(landmarks)
+            detected_frames = writer.frames
+    finally:
         # 使い終わったリソースを解放
         cap.release()
 
-        # 骨格情報をJSONファイルに保存
-        with open('public/landmarks.json', 'w') as f:
-            json.dump(all_landmarks, f, indent=2)
-        print("骨格情報が public/landmarks.json に保存されました。")
+    print(f"骨格情報が {output_path} に保存されました。")
+    return {'frames': frame_count, 'detected_frames': detected_frames, 'fps': fps, 'scores': scorer.scores()}
+
+
+def collect_videos(inputs):
+    """
+    ファイル・ディレクトリ・globパターンから動画ファイルを集める
+
+    Returns:
+        list[tuple]: (動画のパス, 出力ディレクトリ内での相対パス) のリスト。
+                     ディレクトリ指定の場合はサブディレクトリ構成を保つ
+    """
+    videos = []
+    seen = set()
+
+    def add(path, relative):
+        path = os.path.abspath(path)
+        if path not in seen and path.lower().endswith(VIDEO_EXTENSIONS):
+            seen.add(path)
+            videos.append((path, relative))
+
+    for pattern in inputs:
+        for match in sorted(glob.glob(pattern, recursive=True)) or [pattern]:
+            if os.path.isdir(match):
+                for root, _, names in os.walk(match):
+                    for name in sorted(names):
+                        path = os.path.join(root, name)
+                        add(path, os.path.relpath(path, match))
+            elif os.path.isfile(match):
+                add(match, os.path.basename(match))
+    return videos
+
+
+def batch_output_path(relative, output_dir, output_format):
+    """入力の相対パスから出力ファイルのパスを決める（拡張子を出力形式に置き換える）"""
+    return os.path.join(output_dir, os.path.splitext(relative)[0] + '.' + output_format)
+
+
+def is_up_to_date(video_path, output_path):
+    """出力が存在し、入力より新しければTrue（中断後の再実行で飛ばす）"""
+    try:
+        return os.path.getmtime(output_path) >= os.path.getmtime(video_path)
+    except OSError:
+        return False
+
+
+def _analyze_batch_item(video_path, output_path, profile, share=1):
+    """
+    1ファイル分を解析するワーカー関数（別プロセスで実行）
+
+    途中で止まった出力が最新扱いにならないよう、一時ファイルに書いてから置き換える。
+    失敗した場合は一時ファイルを削除する（出力先に書きかけのファイルを残さない）。
+    スレッド数はワーカー数（share）でCPUを分け合うように決める。
+    """
+    tune_threads(share, concurrent_poses=1)
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    # 拡張子（.lmq.gz など）はそのまま残して出力形式を変えない
+    partial_path = os.path.join(os.path.dirname(output_path), '.partial.' + os.path.basename(output_path))
+    start = time.perf_counter()
+    try:
+        try:
+            stats = analyze_video(video_path, profile=profile, output_path=partial_path)
+        except Exception as e:
+            return {'video': video_path, 'error': str(e)}
+        if stats is None:
+            return {'video': video_path, 'error': 'could not open video'}
+        os.replace(partial_path, output_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    stats.update({'video': video_path, 'output': output_path, 'seconds': time.perf_counter() - start})
+    return stats
+
+
+def analyze_batch(inputs, output_dir, output_format='json', workers=None, profile=None, force=False):
+    """
+    複数の動画をプロセスプールで並列に解析し、1入力につき1ファイルを出力
+
+    Args:
+        inputs: 動画ファイル・ディレクトリ・globパターンのリスト
+        output_dir: 出力先ディレクトリ
+        output_format: 出力形式（json / jsonl / lmk / lmq / lmq.gz）
+        workers: 並列プロセス数（省略時はCPU数。cgroupのCPU割り当てを考慮）
+        profile: 解析プロファイル
+        force: Trueの場合は出力が最新でも解析し直す
+
+    Returns:
+        dict: 集計結果（processed / skipped / failed / frames / video_seconds / wall_seconds）
+    """
+    jobs = []
+    skipped = 0
+    for video_path, relative in collect_videos(inputs):
+        output_path = batch_output_path(relative, output_dir, output_format)
+        if not force and is_up_to_date(video_path, output_path):
+            skipped += 1
+            continue
+        jobs.append((video_path, output_path))
+
+    workers = max(1, min(workers or available_cpus(), len(jobs) or 1))
+    results = []
+    start = time.perf_counter()
+    if workers == 1:
+        for video_path, output_path in jobs:
+            results.append(_analyze_batch_item(video_path, output_path, profile))
+    else:
+        # MediaPipeは内部スレッドを持つため、forkではなくspawnでワーカーを起動する
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [
+                executor.submit(_analyze_batch_item, video_path, output_path, profile, workers)
+                for video_path, output_path in jobs
+            ]
+            for future in as_completed(futures):
+                results.append(future.result())
+    wall_seconds = time.perf_counter() - start
+
+    failed = [result for result in results if 'error' in result]
+    done = [result for result in results if 'error' not in result]
+    for result in failed:
+        print(f"エラー: {result['video']}: {result['error']}", file=sys.stderr)
+    return {
+        'processed': len(done),
+        'skipped': skipped,
+        'failed': len(failed),
+        'workers': workers,
+        'frames': sum(result['frames'] for result in done),
+        'video_seconds': sum(result['frames'] / result['fps'] for result in done if result['fps']),
+        'wall_seconds': wall_seconds,
+    }
+
+
+def print_batch_summary(summary):
+    """バッチ処理のスループットを表示"""
+    wall = summary['wall_seconds']
+    print(
+        f"完了: {summary['processed']}件 / スキップ（最新）: {summary['skipped']}件 / 失敗: {summary['failed']}件 "
+        f"（{summary['workers']}プロセス）"
+    )
+    if summary['processed'] and wall > 0:
+        print(
+            f"合計 {summary['frames']}フレーム（動画 {summary['video_seconds']:.1f}秒）を {wall:.1f}秒で処理: "
+            f"{summary['frames'] / wall:.1f} フレーム/秒、実時間の {summary['video_seconds'] / wall:.2f} 倍"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='動画の骨格情報を抽出してファイルに保存')
+    parser.add_argument('inputs', nargs='*', help='動画ファイル・ディレクトリ・globパターン（省略時はスクリプト内の video_file）')
+    parser.add_argument('--output-dir', default='landmarks', help='バッチ処理の出力先ディレクトリ')
+    parser.add_argument('--format', choices=('json', 'jsonl', 'lmk', 'lmq', 'lmq.gz'), default='json', help='出力形式')
+    parser.add_argument('--workers', type=int, default=0, help='並列プロセス数（0 = CPU数）')
+    parser.add_argument('--profile', help='解析プロファイル（fast / balanced / default / accurate）')
+    parser.add_argument('--force', action='store_true', help='出力が最新でも解析し直す')
+    args = parser.parse_args()
+
+    if args.inputs:
+        summary = analyze_batch(args.inputs, args.output_dir, args.format, args.workers or None, args.profile, args.force)
+        print_batch_summary(summary)
+        sys.exit(1 if summary['failed'] else 0)
 
 
-if __name__ == '__main__':
     # --- ここをあなたの動画ファイルへのパスに変更してください ---
     video_file = '/Users/jin/Downloads/IMG_9127-1.mov'
     
     if video_file == 'ここにあなたの動画ファイルのフ/Users/jin/Downloads/IMG_9127-1.movルパスを記述してください.mp4':
         print("エラー: スクリプトを編集して、`video_file`変数をあなたの動画ファイルのパスに設定してください。", file=sys.stderr)
     else:
-        analyze_video(video_file)
\ No newline at end of file
+        analyze_video(video_file, profile=args.profile)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,381 @@
+"""
+姿勢推定パイプラインのベンチマーク
+
+使い方:
+    python bench/pose_benchmark.py
+    python bench/pose_benchmark.py --resolutions 640x360,1920x1080 --durations 5 --modes sequential,stages
+    python bench/pose_benchmark.py --clips-dir ~/clips --baseline bench/results/pose_bench_20260101T000000.json
+
+合成動画（bench/synthetic.py、乱数なしで毎回同じ内容）を解像度・長さごとに生成し、
+任意で実動画のディレクトリも加えて、解析モードごとに次を計測する:
+
+- 処理秒数（1回目 = Poseの生成や並列ワーカー起動を含むコールド、2回目以降の最速 = ウォーム）
+- 解析フレーム/秒と、動画の実時間に対する倍率
+- ピークRSS（ケースごとに別プロセスで実行して計測。並列モードはワーカーを含む）
+- スコア（モード間・過去の実行とのずれの確認用）
+- stages モードでは工程別のミリ秒（デコード+縮小+色変換 / 推論 / スコアリング）
+
+結果はJSON（bench/results/ または --output）に保存し、--baseline で過去の結果と比較できる。
+ネットワークは使わない（Poseモデルはmediapipeに同梱のものを使う）。
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'functions'))
+sys.path.insert(0, ROOT_DIR)
+
+DEFAULT_RESOLUTIONS = '640x360,1280x720,1920x1080'
+DEFAULT_DURATIONS = '5,20'
+DEFAULT_CLIP_DIR = os.path.join(BENCH_DIR, '.clips')
+DEFAULT_RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.m4v', '.avi', '.mkv')
+RESULT_MARKER = 'BENCH_RESULT '
+
+# 解析モード: analyze_kickboxing_form に渡す引数
+# （stages は工程別の計測、export / export_lmk は analyze_video.analyze_video のJSON / .lmk 出力）
+MODES = {
+    'sequential': {},
+    'stride2': {'frame_stride': 2},
+    'pipelined': {'pipelined': True},
+    'parallel': {'parallel_workers': max(2, os.cpu_count() or 1)},
+    'balanced': {'profile': 'balanced'},
+    'fast': {'profile': 'fast'},
+    'roi': {'roi_tracking': True},
+    'motion': {'motion_gate': True},
+    'stages': None,
+    'export': None,
+    'export_lmk': None,
+}
+# fast（model_complexity=0）はモデルをダウンロードするため、オフラインで動く既定からは外す
+DEFAULT_MODES = 'sequential,stride2,pipelined,parallel,balanced,roi,motion,stages,export,export_lmk'
+
+
+def peak_rss_mb():
+    """このプロセスと回収済みの子プロセスのピークRSS（MB）"""
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linuxでは ru_maxrss はKB単位
+    return round(max(self_kb, children_kb) / 1024, 1), round(self_kb / 1024, 1)
+
+
+def clip_info(video_path):
+    import cv2
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return {
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            'fps': cap.get(cv2.CAP_PROP_FPS),
+            'frames': int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0),
+        }
+    finally:
+        cap.release()
+
+
+def measure_stages(video_path, profile_name):
+    """デコード / 推論 / スコアリングを工程別に計測（順次解析と同じ処理）"""
+    import cv2
+    import analyze
+    from analysis_profile import get_analysis_profile
+    from pose_pool import checkout_pose
+
+    profile = get_analysis_profile(profile_name)
+    cap = cv2.VideoCapture(video_path)
+    stride = analyze.resolve_frame_stride(cap.get(cv2.CAP_PROP_FPS))
+    sample_fps = cap.get(cv2.CAP_PROP_FPS) / stride
+    decode_seconds = 0.0
+    inference_seconds = 0.0
+    frames = 0
+    buffer = analyze.LandmarkBuffer()
+    try:
+        with checkout_pose(profile) as pose:
+            iterator = analyze.iter_rgb_frames(cap, stride, profile['max_long_side'])
+            while True:
+                start = time.perf_counter()
+                item = next(iterator, None)
+                decode_seconds += time.perf_counter() - start
+                if item is None:
+                    break
+                frame_index, image_rgb = item
+                start = time.perf_counter()
+                results = pose.process(image_rgb)
+                inference_seconds += time.perf_counter() - start
+                frames += 1
+                if results.pose_landmarks:
+                    buffer.append(analyze.landmarks_to_array(results.pose_landmarks.landmark), frame_index)
+    finally:
+        cap.release()
+
+    start = time.perf_counter()
+    scores = analyze.compute_scores(buffer.landmarks, sample_fps)
+    scoring_seconds = time.perf_counter() - start
+
+    def per_frame(seconds):
+        return round(seconds * 1000 / frames, 3) if frames else None
+
+    return {
+        'seconds': decode_seconds + inference_seconds + scoring_seconds,
+        'frames': frames,
+        'detected_frames': buffer.size,
+        'scores': scores,
+        'stages_ms': {
+            'decode': round(decode_seconds * 1000, 1),
+            'inference': round(inference_seconds * 1000, 1),
+            'scoring': round(scoring_seconds * 1000, 3),
+        },
+        'stages_ms_per_frame': {
+            'decode': per_frame(decode_seconds),
+            'inference': per_frame(inference_seconds),
+        },
+    }
+
+
+def run_once(video_path, mode, profile_name):
+    """1回分の解析を実行し、(秒数, 結果dict) を返す"""
+    if mode == 'stages':
+        result = measure_stages(video_path, profile_name)
+        return result['seconds'], result
+
+    if mode in ('export', 'export_lmk'):
+        from analyze_video import analyze_video
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_path = os.path.join(temp_dir, 'landmarks.lmk' if mode == 'export_lmk' else 'landmarks.json')
+            start = time.perf_counter()
+            analyze_video(video_path, profile=profile_name, output_path=output_path)
+            elapsed = time.perf_counter() - start
+            output_bytes = os.path.getsize(output_path) if os.path.exists(output_path) else None
+        return elapsed, {'output_bytes': output_bytes}
+
+    from analyze import analyze_kickboxing_form
+    kwargs = dict(MODES[mode])
+    kwargs.setdefault('profile', profile_name)
+    start = time.perf_counter()
+    result = analyze_kickboxing_form(video_path, **kwargs)
+    elapsed = time.perf_counter() - start
+    if result['status'] != 'success':
+        raise RuntimeError(result.get('error_message', 'analysis failed'))
+    return elapsed, {'scores': result['scores']}
+
+
+def run_case(case):
+    """
+    1ケース（動画 × モード）を計測（--run-case で起動された子プロセス内で実行）
+
+    ピークRSSをケースごとに分けるため、親プロセスからは毎回別プロセスで呼ぶ。
+    """
+    import analyze
+
+    video_path = case['clip']
+    mode = case['mode']
+    info = clip_info(video_path)
+    runs = []
+    details = {}
+    for _ in range(max(1, case['repeat'])):
+        elapsed, details = run_once(video_path, mode, case['profile'])
+        runs.append(elapsed)
+
+    # 並列モードのワーカーを終了させ、子プロセスのRSSも集計に含める
+    if analyze._segment_executor is not None:
+        analyze._segment_executor.shutdown(wait=True)
+
+    if mode == 'stages':
+        sampled = details['frames']
+    else:
+        stride = analyze.resolve_frame_stride(info['fps'], (MODES.get(mode) or {}).get('frame_stride'))
+        sampled = math.ceil(info['frames'] / stride) if info['frames'] else 0
+    warm = min(runs[1:]) if len(runs) > 1 else None
+    best = warm if warm is not None else runs[0]
+    duration = info['frames'] / info['fps'] if info['fps'] else None
+    peak, peak_self = peak_rss_mb()
+
+    result = {
+        'clip': video_path,
+        'mode': mode,
+        'profile': case['profile'],
+        'video': info,
+        'cold_seconds': round(runs[0], 3),
+        'warm_seconds': round(warm, 3) if warm is not None else None,
+        'analyzed_frames': sampled,
+        'frames_per_second': round(sampled / best, 2) if best > 0 else None,
+        'realtime_factor': round(duration / best, 2) if duration and best > 0 else None,
+        'peak_rss_mb': peak,
+        'peak_rss_self_mb': peak_self,
+    }
+    result.update(details)
+    result.pop('seconds', None)
+    return result
+
+
+def spawn_case(case):
+    """ケースを子プロセスで実行して結果dictを返す（失敗時は error を含める）"""
+    env = dict(os.environ)
+    # キャッシュヒットで推論が省かれないようにする
+    env['LANDMARK_CACHE_ENABLED'] = 'false'
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--run-case', json.dumps(case)],
+        capture_output=True, text=True, env=env
+    )
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    error = (proc.stderr.strip().splitlines() or [f'exit code {proc.returncode}'])[-1]
+    return {'clip': case['clip'], 'mode': case['mode'], 'profile': case['profile'], 'error': error}
+
+
+def collect_clips(args):
+    """合成動画を生成し、--clips-dir の実動画と合わせて返す"""
+    from synthetic import ensure_clip
+
+    clips = []
+    for resolution in filter(None, args.resolutions.split(',')):
+        width, height = (int(value) for value in resolution.lower().split('x'))
+        for duration in filter(None, args.durations.split(',')):
+            clips.append(ensure_clip(args.clip_cache, width, height, float(duration), args.fps))
+    if args.clips_dir:
+        for name in sorted(os.listdir(args.clips_dir)):
+            if name.lower().endswith(VIDEO_EXTENSIONS):
+                clips.append(os.path.join(args.clips_dir, name))
+    return clips
+
+
+def environment_metadata():
+    import cv2
+    import numpy
+    try:
+        import mediapipe
+        mediapipe_version = mediapipe.__version__
+    except Exception:
+        mediapipe_version = None
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'hostname': platform.node(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'opencv': cv2.__version__,
+        'numpy': numpy.__version__,
+        'mediapipe': mediapipe_version,
+    }
+
+
+def compare_with_baseline(results, baseline_path):
+    """同じ動画・モード・プロファイルの結果を過去の実行と比較（速度比 > 1 = 速くなった）"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {
+        (os.path.basename(entry['clip']), entry['mode'], entry['profile']): entry
+        for entry in baseline.get('results', []) if 'error' not in entry
+    }
+    for entry in results:
+        before = previous.get((os.path.basename(entry['clip']), entry['mode'], entry['profile']))
+        if before is None or 'error' in entry:
+            continue
+        comparison = {}
+        for key in ('cold_seconds', 'warm_seconds'):
+            if entry.get(key) and before.get(key):
+                comparison[key.replace('_seconds', '_speedup')] = round(before[key] / entry[key], 2)
+        if entry.get('peak_rss_mb') and before.get('peak_rss_mb'):
+            comparison['peak_rss_delta_mb'] = round(entry['peak_rss_mb'] - before['peak_rss_mb'], 1)
+        if entry.get('scores') and before.get('scores'):
+            comparison['max_score_drift'] = max(
+                abs(entry['scores'][key] - before['scores'].get(key, 0)) for key in entry['scores']
+            )
+        entry['baseline'] = comparison
+
+
+def print_table(results):
+    print(f"{'clip':<34} {'mode':<11} {'cold s':>8} {'warm s':>8} {'frames/s':>9} {'x realtime':>10} {'RSS MB':>8}  notes")
+    for entry in results:
+        name = os.path.basename(entry['clip'])[:34]
+        if 'error' in entry:
+            print(f"{name:<34} {entry['mode']:<11} error: {entry['error']}")
+            continue
+        notes = []
+        if 'stages_ms_per_frame' in entry:
+            stages = entry['stages_ms_per_frame']
+            notes.append(f"decode={stages['decode']}ms/f infer={stages['inference']}ms/f "
+                         f"score={entry['stages_ms']['scoring']}ms")
+        if entry.get('output_bytes') is not None:
+            notes.append(f"output={entry['output_bytes'] / 1024:.0f}KB")
+        if 'baseline' in entry:
+            notes.append(' '.join(f"{key}={value}" for key, value in entry['baseline'].items()))
+        warm = entry['warm_seconds']
+        print(
+            f"{name:<34} {entry['mode']:<11} {entry['cold_seconds']:>8.3f} "
+            f"{warm if warm is not None else '-':>8} {entry['frames_per_second'] or 0:>9.1f} "
+            f"{entry['realtime_factor'] or 0:>10.2f} {entry['peak_rss_mb']:>8.1f}  {' '.join(notes)}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='姿勢推定パイプラインのベンチマーク')
+    parser.add_argument('--resolutions', default=DEFAULT_RESOLUTIONS, help='合成動画の解像度（カンマ区切り、空 = 生成しない）')
+    parser.add_argument('--durations', default=DEFAULT_DURATIONS, help='合成動画の長さ（秒、カンマ区切り）')
+    parser.add_argument('--fps', type=float, default=30, help='合成動画のfps')
+    parser.add_argument('--clips-dir', help='追加で計測する実動画のディレクトリ')
+    parser.add_argument('--clip-cache', default=DEFAULT_CLIP_DIR, help='合成動画の保存先')
+    parser.add_argument('--modes', default=DEFAULT_MODES, help=f"計測するモード（{','.join(MODES)}）")
+    parser.add_argument('--profile', default='default', help='基準の解析プロファイル')
+    parser.add_argument('--repeat', type=int, default=2, help='ケースごとの実行回数（2回目以降がウォーム）')
+    parser.add_argument('--output', help='結果JSONの保存先（省略時は bench/results/ に日時付きで保存）')
+    parser.add_argument('--baseline', help='比較する過去の結果JSON')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(RESULT_MARKER + json.dumps(run_case(json.loads(args.run_case))))
+        return
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    for mode in modes:
+        if mode not in MODES:
+            parser.error(f"unknown mode: {mode}")
+
+    clips = collect_clips(args)
+    if not clips:
+        parser.error('no clips to benchmark')
+
+    results = []
+    for clip in clips:
+        for mode in modes:
+            case = {'clip': clip, 'mode': mode, 'profile': args.profile, 'repeat': args.repeat}
+            print(f"▶ {os.path.basename(clip)} / {mode}", file=sys.stderr)
+            results.append(spawn_case(case))
+
+    if args.baseline:
+        compare_with_baseline(results, args.baseline)
+
+    print_table(results)
+
+    output_path = args.output
+    if output_path is None:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%dT%H%M%S')
+        output_path = os.path.join(DEFAULT_RESULTS_DIR, f"pose_bench_{stamp}.json")
+    with open(output_path, 'w') as f:
+        json.dump({'meta': environment_metadata(), 'results': results}, f, indent=2, ensure_ascii=False)
+    print(f"結果を {output_path} に保存しました。")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+解析プロファイルごとの速度とスコアのずれを比較するハーネス
+
+使い方:
+    python bench/profile_tradeoff.py clip1.mp4 clip2.mov
+    python bench/profile_tradeoff.py --profiles fast,balanced --reference default clips/*.mp4
+
+各プロファイルで analyze_kickboxing_form を実行し、処理時間と
+基準プロファイル（デフォルト: default）とのスコア差（最大絶対誤差）を表示する。
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'functions'))
+from analysis_profile import ANALYSIS_PROFILES
+from analyze import analyze_kickboxing_form
+
+
+def run_profile(video_path, profile_name):
+    """1本の動画を1プロファイルで解析し、(処理秒数, スコアdict) を返す"""
+    start = time.perf_counter()
+    result = analyze_kickboxing_form(video_path, profile=profile_name)
+    elapsed = time.perf_counter() - start
+    if result['status'] != 'success':
+        raise RuntimeError(result.get('error_message', 'analysis failed'))
+    return elapsed, result['scores']
+
+
+def compare_profiles(video_paths, profile_names, reference):
+    """
+    各動画・各プロファイルの速度とスコアのずれを集計
+
+    Returns:
+        list[dict]: プロファイルごとの集計結果
+    """
+    names = [reference] + [name for name in profile_names if name != reference]
+    per_profile = {name: {'seconds': 0.0, 'max_drift': 0.0, 'runs': []} for name in names}
+
+    for video_path in video_paths:
+        reference_scores = None
+        for name in names:
+            elapsed, scores = run_profile(video_path, name)
+            if name == reference:
+                reference_scores = scores
+            drift = max(abs(scores[key] - reference_scores[key]) for key in scores)
+            entry = per_profile[name]
+            entry['seconds'] += elapsed
+            entry['max_drift'] = max(entry['max_drift'], drift)
+            entry['runs'].append({'video': video_path, 'seconds': round(elapsed, 3), 'scores': scores, 'drift': drift})
+
+    reference_seconds = per_profile[reference]['seconds']
+    summary = []
+    for name in names:
+        entry = per_profile[name]
+        summary.append({
+            'profile': name,
+            'settings': ANALYSIS_PROFILES[name],
+            'seconds': round(entry['seconds'], 3),
+            'speedup': round(reference_seconds / entry['seconds'], 2) if entry['seconds'] > 0 else None,
+            'max_drift': round(entry['max_drift'], 1),
+            'runs': entry['runs'],
+        })
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='解析プロファイルの速度/スコア差を比較')
+    parser.add_argument('videos', nargs='+', help='比較に使う動画ファイル')
+    parser.add_argument('--profiles', default=','.join(ANALYSIS_PROFILES), help='比較するプロファイル（カンマ区切り）')
+    parser.add_argument('--reference', default='default', help='スコア差の基準にするプロファイル')
+    parser.add_argument('--json', dest='json_path', help='結果をJSONで保存するパス')
+    args = parser.parse_args()
+
+    profile_names = [name.strip() for name in args.profiles.split(',') if name.strip()]
+    for name in profile_names + [args.reference]:
+        if name not in ANALYSIS_PROFILES:
+            parser.error(f"unknown profile: {name}")
+
+    summary = compare_profiles(args.videos, profile_names, args.reference)
+
+    print(f"{'profile':<10} {'seconds':>9} {'speedup':>8} {'max_drift':>10}  settings")
+    for entry in summary:
+        settings = entry['settings']
+        print(
+            f"{entry['profile']:<10} {entry['seconds']:>9.3f} {entry['speedup'] or 0:>7.2f}x "
+            f"{entry['max_drift']:>10.1f}  long_side={settings['max_long_side'] or 'full'} "
+            f"complexity={settings['model_complexity']} smooth={settings['smooth_landmarks']}"
+        )
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'reference': args.reference, 'profiles': summary}, f, indent=2, ensure_ascii=False)
+        print(f"結果を {args.json_path} に保存しました。")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+ベンチマーク用の合成動画を生成
+
+人型のシルエット（頭・胴体・手足）がパンチとキックの動きをする動画を描画する。
+乱数を使わないため、同じ引数なら常に同じフレームが生成される。
+MediaPipe Poseが人物として検出できる程度の形にしてある。
+"""
+
+import math
+import os
+import cv2
+import numpy as np
+
+BACKGROUND = (180, 200, 210)
+SKIN = (140, 170, 220)
+SHIRT = (60, 60, 200)
+PANTS = (90, 50, 30)
+
+
+def draw_figure(t, width, height):
+    """時刻t（秒）のフレームを描画（BGR）"""
+    image = np.full((height, width, 3), BACKGROUND, dtype=np.uint8)
+    scale = height / 480
+    center_x = width // 2 + int(40 * scale * math.sin(t * 2.1))
+
+    def point(x, y):
+        return (int(center_x + x * scale), int(y * scale))
+
+    def thickness(value):
+        return max(1, int(value * scale))
+
+    hip_y, shoulder_y = 290, 170
+    kick = max(0.0, math.sin(t * 3.9)) * 90
+    punch = max(0.0, math.sin(t * 6.3)) * 90
+
+    cv2.rectangle(image, point(-45, shoulder_y), point(45, hip_y), SHIRT, -1)
+    # 脚（右脚がキック）
+    cv2.line(image, point(-25, hip_y), point(-40, 380), PANTS, thickness(28))
+    cv2.line(image, point(-40, 380), point(-45, 460), PANTS, thickness(24))
+    cv2.line(image, point(25, hip_y), point(60 + kick * 0.5, 380 - kick), PANTS, thickness(28))
+    cv2.line(image, point(60 + kick * 0.5, 380 - kick), point(70 + kick, 460 - kick * 1.6), PANTS, thickness(24))
+    # 腕（右腕がパンチ）
+    cv2.line(image, point(-45, shoulder_y + 10), point(-75, 235), SHIRT, thickness(22))
+    cv2.line(image, point(-75, 235), point(-40 - punch * 0.3, 185 - punch * 0.2), SKIN, thickness(18))
+    cv2.line(image, point(45, shoulder_y + 10), point(85 + punch * 0.4, 225), SHIRT, thickness(22))
+    cv2.line(image, point(85 + punch * 0.4, 225), point(60 + punch, 180), SKIN, thickness(18))
+    # 頭
+    cv2.circle(image, point(0, 120), thickness(36), SKIN, -1)
+    cv2.circle(image, point(-12, 112), thickness(4), (30, 30, 30), -1)
+    cv2.circle(image, point(12, 112), thickness(4), (30, 30, 30), -1)
+    return image
+
+
+def write_clip(path, width, height, seconds, fps=30, static_seconds=0.0):
+    """
+    合成動画をmp4で書き出す
+
+    Args:
+        path: 出力パス
+        width / height: 解像度
+        seconds: 動きのある部分の長さ（秒）
+        fps: フレームレート
+        static_seconds: 前後に付ける静止部分の長さ（秒、各側）
+    """
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"cannot write clip: {path}")
+    try:
+        static_frames = int(round(static_seconds * fps))
+        active_frames = int(round(seconds * fps))
+        still = draw_figure(0.0, width, height)
+        for _ in range(static_frames):
+            writer.write(still)
+        for i in range(active_frames):
+            writer.write(draw_figure(i / fps, width, height))
+        for _ in range(static_frames):
+            writer.write(still)
+    finally:
+        writer.release()
+
+
+def ensure_clip(directory, width, height, seconds, fps=30, static_seconds=0.0):
+    """未生成の場合のみ合成動画を作成し、そのパスを返す"""
+    os.makedirs(directory, exist_ok=True)
+    name = f"synthetic_{width}x{height}_{seconds:g}s_{fps:g}fps"
+    if static_seconds:
+        name += f"_static{static_seconds:g}s"
+    path = os.path.join(directory, name + '.mp4')
+    if not os.path.exists(path):
+        write_clip(path, width, height, seconds, fps, static_seconds)
+    return path
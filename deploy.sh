@@ -28,7 +28,7 @@ gcloud run deploy $SERVICE_NAME \
   --timeout=540s \
   --max-instances=10 \
   --update-secrets DIFY_API_KEY=DIFY_API_KEY:prod \
-  --set-env-vars DIFY_API_ENDPOINT=https://api.dify.ai/v1/chat-messages \
+  --set-env-vars DIFY_API_ENDPOINT=https://api.dify.ai/v1/chat-messages,LANDMARK_CACHE_ENABLED=true,LANDMARK_CACHE_MAX_MB=64 \
   --project=$PROJECT_ID
 
 echo "✅ デプロイ完了！"
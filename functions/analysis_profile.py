@@ -0,0 +1,132 @@
+"""
+解析プロファイル設定
+
+姿勢推定の速度と精度のトレードオフをまとめて切り替えるための設定。
+functions/analyze.py と analyze_video.py の両方から使用する。
+
+- max_long_side: 推論前にフレームの長辺をこのピクセル数まで縮小（0 = 縮小しない）
+- model_complexity: MediaPipe Poseのモデル（0 = lite, 1 = full, 2 = heavy）
+- smooth_landmarks: フレーム間のランドマーク平滑化
+"""
+
+import os
+import cv2
+import mediapipe as mp
+from thread_tuning import ThreadedPose, tune_threads
+
+
+# プロファイル定義（default は従来と同じ挙動）
+ANALYSIS_PROFILES = {
+    'fast': {
+        'max_long_side': 480,
+        'model_complexity': 0,
+        'smooth_landmarks': True,
+    },
+    'balanced': {
+        'max_long_side': 720,
+        'model_complexity': 1,
+        'smooth_landmarks': True,
+    },
+    'default': {
+        'max_long_side': 0,
+        'model_complexity': 1,
+        'smooth_landmarks': True,
+    },
+    'accurate': {
+        'max_long_side': 0,
+        'model_complexity': 2,
+        'smooth_landmarks': True,
+    },
+}
+
+DEFAULT_PROFILE_NAME = 'default'
+
+
+def get_analysis_profile(profile=None):
+    """
+    解析プロファイルを取得
+
+    Args:
+        profile: プロファイル名、設定dict、またはNone
+                 Noneの場合は環境変数 ANALYSIS_PROFILE（未設定なら default）
+
+    環境変数 ANALYSIS_MAX_LONG_SIDE / POSE_MODEL_COMPLEXITY / POSE_SMOOTH_LANDMARKS
+    が設定されていれば、プロファイル名から選んだ値を個別に上書きする。
+
+    Returns:
+        dict: name / max_long_side / model_complexity / smooth_landmarks
+
+    Raises:
+        ValueError: 未知のプロファイル名、または不正なmodel_complexity
+    """
+    if isinstance(profile, dict):
+        resolved = dict(ANALYSIS_PROFILES[DEFAULT_PROFILE_NAME])
+        resolved.update(profile)
+        resolved.setdefault('name', 'custom')
+    else:
+        name = profile or os.environ.get('ANALYSIS_PROFILE', DEFAULT_PROFILE_NAME)
+        if name not in ANALYSIS_PROFILES:
+            raise ValueError(f"Unknown analysis profile: {name} (available: {', '.join(ANALYSIS_PROFILES)})")
+        resolved = dict(ANALYSIS_PROFILES[name], name=name)
+
+        # 名前で選んだ場合のみ環境変数による個別上書きを適用
+        if os.environ.get('ANALYSIS_MAX_LONG_SIDE'):
+            resolved['max_long_side'] = int(os.environ['ANALYSIS_MAX_LONG_SIDE'])
+        if os.environ.get('POSE_MODEL_COMPLEXITY'):
+            resolved['model_complexity'] = int(os.environ['POSE_MODEL_COMPLEXITY'])
+        if os.environ.get('POSE_SMOOTH_LANDMARKS'):
+            resolved['smooth_landmarks'] = os.environ['POSE_SMOOTH_LANDMARKS'].lower() in ('1', 'true', 'yes')
+
+    if resolved['model_complexity'] not in (0, 1, 2):
+        raise ValueError(f"model_complexity must be 0, 1 or 2: {resolved['model_complexity']}")
+    resolved['max_long_side'] = max(0, int(resolved['max_long_side'] or 0))
+    return resolved
+
+
+def create_pose(profile):
+    """
+    プロファイルに従ってMediaPipe Poseを生成
+
+    Args:
+        profile: get_analysis_profile() の戻り値
+
+    推論スレッド数は thread_tuning.tune_threads() で決めた値を使う。
+
+    Returns:
+        mp.solutions.pose.Pose: withブロックで使えるPoseインスタンス
+    """
+    return ThreadedPose(
+        inference_threads=tune_threads()['inference_threads'],
+        model_complexity=profile['model_complexity'],
+        smooth_landmarks=profile['smooth_landmarks'],
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5
+    )
+
+
+def downscale_frame(image, max_long_side):
+    """
+    フレームの長辺がmax_long_side以下になるよう縮小（BGRのまま）
+
+    色変換より前に縮小することで、cvtColorとPose内部のリサイズを小さい画像で済ませる。
+    ランドマークは正規化座標なので、縦横比を保てば結果の座標系は変わらない。
+
+    Args:
+        image: OpenCVのフレーム（HxWx3）
+        max_long_side: 長辺の上限ピクセル数（0以下なら縮小しない）
+
+    Returns:
+        numpy.ndarray: 縮小後（または元）のフレーム
+    """
+    if not max_long_side or max_long_side <= 0:
+        return image
+    height, width = image.shape[:2]
+    long_side = max(height, width)
+    if long_side <= max_long_side:
+        return image
+    scale = max_long_side / long_side
+    return cv2.resize(
+        image,
+        (max(1, int(round(width * scale))), max(1, int(round(height * scale)))),
+        interpolation=cv2.INTER_AREA
+    )
@@ -5,152 +5,833 @@
 メインの解析プログラムからロジックを移植したものです。
 """
 
-import cv2
-import mediapipe as mp
+import os
 import math
+import time
+import logging
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+import cv2
+import numpy as np
+from analysis_profile import get_analysis_profile, downscale_frame
+from pose_pool import checkout_pose
+from landmark_format import open_landmark_writer, landmarks_to_array
+from roi_tracking import ANALYSIS_ROI_MAX_AREA, ANALYSIS_ROI_PADDING, ANALYSIS_ROI_TRACKING, ROI_RESET_SHIFT, RoiTracker
+from stage_timer import StageTimer
+from thread_tuning import tune_threads
+from motion_gate import (ANALYSIS_MOTION_GATE, ANALYSIS_MOTION_THRESHOLD, ANALYSIS_MOTION_PIXEL_DIFF,
+                         ANALYSIS_MOTION_MAX_SKIP, ANALYSIS_MOTION_MIN_STATIC, MotionGate)
+import landmark_cache
+
+logger = logging.getLogger(__name__)
+
+
+# フレーム間引き設定（環境変数で上書き可能）
+# ANALYSIS_FRAME_STRIDE: Nフレームごとに1フレームだけ解析（1 = 全フレーム）
+# ANALYSIS_TARGET_FPS: 解析する目標fps（0 = 無効。設定時はstrideより優先）
+ANALYSIS_FRAME_STRIDE = int(os.environ.get('ANALYSIS_FRAME_STRIDE', '1'))
+ANALYSIS_TARGET_FPS = float(os.environ.get('ANALYSIS_TARGET_FPS', '0'))
+
+# デコード/推論のパイプライン設定
+# ANALYSIS_PIPELINED: true の場合、デコードを別スレッドで行い推論と並行させる
+# ANALYSIS_QUEUE_SIZE: デコード済みフレームを溜めるキューの上限（メモリ上限）
+ANALYSIS_PIPELINED = os.environ.get('ANALYSIS_PIPELINED', 'false').lower() in ('1', 'true', 'yes')
+ANALYSIS_QUEUE_SIZE = int(os.environ.get('ANALYSIS_QUEUE_SIZE', '8'))
 
+# 区間分割による並列解析の設定
+# ANALYSIS_PARALLEL_WORKERS: 並列に解析するプロセス数（0または1 = 並列化しない）
+# ANALYSIS_SEGMENT_OVERLAP: 区間の手前に余分に解析する解析フレーム数（追跡・平滑化の助走）
+# ANALYSIS_MIN_SEGMENT_FRAMES: 1区間あたりの最小解析フレーム数（短い動画は分割しない）
+ANALYSIS_PARALLEL_WORKERS = int(os.environ.get('ANALYSIS_PARALLEL_WORKERS', '0'))
+ANALYSIS_SEGMENT_OVERLAP = int(os.environ.get('ANALYSIS_SEGMENT_OVERLAP', '15'))
+ANALYSIS_MIN_SEGMENT_FRAMES = int(os.environ.get('ANALYSIS_MIN_SEGMENT_FRAMES', '60'))
 
-def calculate_distance(point1, point2):
-    """2点間の距離を計算"""
-    return math.sqrt(
-        (point1['x'] - point2['x'])**2 + 
-        (point1['y'] - point2['y'])**2 + 
-        (point1['z'] - point2['z'])**2
+# 解析の計算時間の上限（秒、0 = 無制限）
+# 超えた時点で推論を打ち切り、それまでのフレームで算出した暫定スコアを返す（負荷が高い時の最悪レイテンシを抑える）
+ANALYSIS_TIME_BUDGET_SECONDS = float(os.environ.get('ANALYSIS_TIME_BUDGET_SECONDS', '0'))
+
+# MediaPipe Poseのランドマーク数と1点あたりの値（x, y, z, visibility）
+NUM_LANDMARKS = 33
+LANDMARK_DIMS = 4
+
+# スコアリングで使うランドマーク番号
+LEFT_SHOULDER, RIGHT_SHOULDER = 11, 12
+LEFT_WRIST, RIGHT_WRIST = 15, 16
+LEFT_HIP, RIGHT_HIP = 23, 24
+LEFT_ANKLE, RIGHT_ANKLE = 27, 28
+
+
+def resolve_frame_stride(fps, frame_stride=None, target_fps=None):
+    """
+    解析に使うフレーム間隔（stride）を決定
+
+    target_fpsが指定されていれば元動画のfpsから間隔を計算し、
+    なければframe_strideをそのまま使う。どちらも未指定なら環境変数の値。
+
+    Args:
+        fps: 元動画のfps
+        frame_stride: 固定の間引き間隔（1 = 全フレーム）
+        target_fps: 解析の目標fps
+
+    Returns:
+        int: 1以上のフレーム間隔
+    """
+    if frame_stride is None:
+        frame_stride = ANALYSIS_FRAME_STRIDE
+    if target_fps is None:
+        target_fps = ANALYSIS_TARGET_FPS
+
+    if target_fps and target_fps > 0 and fps and fps > 0:
+        return max(1, int(round(fps / target_fps)))
+    return max(1, int(frame_stride))
+
+
+class LandmarkBuffer:
+    """
+    検出したランドマークを (frames, 33, 4) のfloat32配列に蓄積するバッファ
+
+    解析ループ内でdictやリストを作らないよう、配列を事前確保して行を埋める。
+    容量が足りなくなった場合のみ倍に拡張する。
+    """
+
+    def __init__(self, capacity=256):
+        capacity = max(1, int(capacity))
+        self._data = np.zeros((capacity, NUM_LANDMARKS, LANDMARK_DIMS), dtype=np.float32)
+        self._frames = np.zeros(capacity, dtype=np.int32)
+        self.size = 0
+        # 時間の上限で途中までしか詰めなかった場合True（extract_landmarks の deadline）
+        self.truncated = False
+
+    def _grow(self):
+        capacity = self._data.shape[0] * 2
+        data = np.zeros((capacity, NUM_LANDMARKS, LANDMARK_DIMS), dtype=np.float32)
+        frames = np.zeros(capacity, dtype=np.int32)
+        data[:self.size] = self._data[:self.size]
+        frames[:self.size] = self._frames[:self.size]
+        self._data = data
+        self._frames = frames
+
+    def append(self, landmarks, frame_index):
+        """(33, 4) のランドマーク配列を1行として追加"""
+        if self.size == self._data.shape[0]:
+            self._grow()
+        self._data[self.size] = landmarks
+        self._frames[self.size] = frame_index
+        self.size += 1
+
+    @property
+    def landmarks(self):
+        """検出済みフレームのランドマーク配列 (frames, 33, 4)"""
+        return self._data[:self.size]
+
+    @property
+    def frame_indices(self):
+        """各行に対応する元動画のフレーム番号"""
+        return self._frames[:self.size]
+
+
+def _finalize_scores(frames, max_speed, avg_guard, max_kick, avg_rotation):
+    """集計値（最大・平均）をスコア（0-100点）に換算"""
+    punch_speed_score = 0
+    guard_stability_score = 0
+    kick_height_score = 0
+    core_rotation_score = 0
+
+    if frames > 0:
+        if frames > 1:
+            punch_speed_score = min(100, max(0, max_speed * 100))
+        guard_stability_score = max(0, min(100, 100 - (avg_guard * 500)))
+        kick_height_score = min(100, max(0, max_kick * 500))
+        ideal_angle = 45
+        distance = abs(avg_rotation - ideal_angle)
+        core_rotation_score = max(0, min(100, 100 - (distance * 2)))
+
+    return {
+        "punch_speed": round(punch_speed_score, 1),
+        "guard_stability": round(guard_stability_score, 1),
+        "kick_height": round(kick_height_score, 1),
+        "core_rotation": round(core_rotation_score, 1)
+    }
+
+
+def _core_rotation_angles(lm):
+    """左肩-左腰-右腰の角度（2D、度）をフレームごとに計算"""
+    vec1 = lm[:, LEFT_SHOULDER, :2] - lm[:, LEFT_HIP, :2]
+    vec2 = lm[:, RIGHT_HIP, :2] - lm[:, LEFT_HIP, :2]
+    mag = np.sqrt(np.sum(vec1 ** 2, axis=1)) * np.sqrt(np.sum(vec2 ** 2, axis=1))
+    dot = np.sum(vec1 * vec2, axis=1)
+    cos_angle = np.clip(np.divide(dot, mag, out=np.zeros_like(dot), where=mag != 0), -1.0, 1.0)
+    return np.where(mag != 0, np.degrees(np.arccos(cos_angle)), 0.0)
+
+
+def _guard_heights(lm):
+    """手首と肩の高さの差（左右平均）をフレームごとに計算"""
+    return (
+        np.abs(lm[:, LEFT_WRIST, 1] - lm[:, LEFT_SHOULDER, 1]) +
+        np.abs(lm[:, RIGHT_WRIST, 1] - lm[:, RIGHT_SHOULDER, 1])
+    ) / 2
+
+
+def _kick_heights(lm):
+    """腰と足首の高さの差（左右の大きい方）をフレームごとに計算"""
+    return np.maximum(
+        lm[:, LEFT_HIP, 1] - lm[:, LEFT_ANKLE, 1],
+        lm[:, RIGHT_HIP, 1] - lm[:, RIGHT_ANKLE, 1]
+    )
+
+
+def compute_scores(landmarks, sample_fps):
+    """
+    ランドマーク配列からスコア（0-100点）を一括計算
+
+    Args:
+        landmarks: 検出フレームのみを時系列順に並べた (frames, 33, 4) 配列
+        sample_fps: 連続する解析フレーム間の時間の逆数（パンチ速度の換算に使用）
+
+    Returns:
+        dict: punch_speed / guard_stability / kick_height / core_rotation
+    """
+    lm = np.asarray(landmarks, dtype=np.float64)
+    frames = lm.shape[0]
+    if frames == 0:
+        return _finalize_scores(0, 0.0, 0.0, 0.0, 0.0)
+
+    # パンチ速度: 検出フレーム間の手首の移動量（3D）の大きい方 × fps
+    max_speed = 0.0
+    if frames > 1:
+        wrists = lm[:, [LEFT_WRIST, RIGHT_WRIST], :3]
+        distances = np.sqrt(np.sum(np.diff(wrists, axis=0) ** 2, axis=2))
+        max_speed = float(np.max(distances)) * sample_fps
+
+    return _finalize_scores(
+        frames,
+        max_speed,
+        # ガード姿勢: 手首と肩の高さの差（左右平均）の平均
+        float(np.mean(_guard_heights(lm))),
+        # キック高さ: 腰と足首の高さの差（左右の大きい方）の最大値
+        float(np.max(_kick_heights(lm))),
+        # コア回転: 左肩-左腰-右腰の角度（2D）の平均
+        float(np.mean(_core_rotation_angles(lm)))
     )
 
 
-def calculate_angle(point1, center, point2):
-    """3点で角度を計算（度）"""
-    vec1_x = point1['x'] - center['x']
-    vec1_y = point1['y'] - center['y']
-    vec2_x = point2['x'] - center['x']
-    vec2_y = point2['y'] - center['y']
+class IncrementalScorer:
+    """
+    フレームごとにランドマークを受け取り、最大値・合計だけを保持してスコアを計算する
+
+    compute_scores と同じ計算式で、メモリ使用量はフレーム数によらない。
+    scores() はいつ呼んでもよく、その時点までのフレームでの暫定スコアを返す
+    （平均の計算順序だけが異なるため、一括計算とは丸め誤差程度の差が出ることがある）。
+    モーションゲートで使い回した結果（直前と同じ配列）は、同じ姿勢を保っていたフレームとして
+    直前のフレームの値をそのまま加算する（一括計算に同じランドマークを並べた場合と同じ結果になる）。
+    """
+
+    def __init__(self, sample_fps):
+        self.sample_fps = sample_fps
+        self.frames = 0
+        self._previous_wrists = None
+        self._max_distance = 0.0
+        self._guard_sum = 0.0
+        self._max_kick = -math.inf
+        self._rotation_sum = 0.0
+        self._previous = None
+        self._previous_values = None
+
+    def update(self, landmarks):
+        """検出フレーム1枚分の (33, 4) ランドマークを追加"""
+        if landmarks is self._previous:
+            # 使い回したフレーム: 手首の移動量は0で、ガード・コア回転は直前と同じ値
+            guard, rotation = self._previous_values
+            self._guard_sum += guard
+            self._rotation_sum += rotation
+            self.frames += 1
+            return
+        lm = np.asarray(landmarks, dtype=np.float64).reshape(1, NUM_LANDMARKS, LANDMARK_DIMS)
+        wrists = lm[0, [LEFT_WRIST, RIGHT_WRIST], :3]
+        if self._previous_wrists is not None:
+            distance = float(np.max(np.sqrt(np.sum((wrists - self._previous_wrists) ** 2, axis=1))))
+            self._max_distance = max(self._max_distance, distance)
+        self._previous_wrists = wrists
+        guard = float(_guard_heights(lm)[0])
+        rotation = float(_core_rotation_angles(lm)[0])
+        self._guard_sum += guard
+        self._max_kick = max(self._max_kick, float(_kick_heights(lm)[0]))
+        self._rotation_sum += rotation
+        self.frames += 1
+        self._previous = landmarks
+        self._previous_values = (guard, rotation)
+
+    def scores(self):
+        """ここまでのフレームでのスコア（暫定値）"""
+        if self.frames == 0:
+            return _finalize_scores(0, 0.0, 0.0, 0.0, 0.0)
+        return _finalize_scores(
+            self.frames,
+            self._max_distance * self.sample_fps,
+            self._guard_sum / self.frames,
+            self._max_kick,
+            self._rotation_sum / self.frames
+        )
+
+
+def iter_rgb_frames(cap, stride, max_long_side, start_index=0, end_index=None, timer=None):
+    """
+    解析対象フレームを (フレーム番号, RGB画像) として順に返す
+
+    strideごとに1フレームだけデコードし、残りはcap.grab()で読み飛ばす。
+    縮小は色変換の前に一度だけ行う。
+    start_index / end_index を指定すると、その範囲 [start, end) のフレームだけを返す。
+    timer（StageTimer）を指定すると、フレームごとのデコード（読み飛ばしを含む）を 'decode'、
+    縮小と色変換を 'color' として記録する。
+    """
+    frame_index = 0
+    if start_index > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_index)
+        frame_index = start_index
+    while cap.isOpened():
+        if end_index is not None and frame_index >= end_index:
+            break
+        start = time.perf_counter()
+        success, image = cap.read()
+        if not success:
+            break
+        
+        current_index = frame_index
+        frame_index += 1
+        
+        # 次の解析フレームまではデコードせずに読み飛ばす
+        for _ in range(stride - 1):
+            if not cap.grab():
+                break
+            frame_index += 1
+        decoded = time.perf_counter()
+        
+        # 色変換の前に一度だけ縮小する
+        image = downscale_frame(image, max_long_side)
+        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        image_rgb.flags.writeable = False
+        if timer is not None:
+            timer.add_frame('decode', decoded - start)
+            timer.add_frame('color', time.perf_counter() - decoded)
+        yield current_index, image_rgb
+
+
+def iter_rgb_frames_threaded(cap, stride, max_long_side, queue_size=None, start_index=0, end_index=None,
+                             timer=None):
+    """
+    iter_rgb_frames をデコードスレッドで先読みするパイプライン版
+
+    デコードスレッドが色変換済みフレームを上限付きキューに詰め、
+    呼び出し側（メインスレッド）は推論だけを行う。キューが満杯の間は
+    デコードスレッドが待機するため、メモリ使用量は queue_size フレーム分で頭打ちになる。
+    OpenCVはデコード中にGILを解放するので、デコードと推論がほぼ重なる。
+    """
+    if queue_size is None:
+        queue_size = ANALYSIS_QUEUE_SIZE
+    frame_queue = queue.Queue(maxsize=max(1, queue_size))
+    stop_event = threading.Event()
+    end_of_stream = object()
+    errors = []
+
+    def put(item):
+        # 呼び出し側が途中で止めた場合に永久に待たないよう、タイムアウト付きで詰める
+        while not stop_event.is_set():
+            try:
+                frame_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def decode():
+        try:
+            for item in iter_rgb_frames(cap, stride, max_long_side, start_index, end_index, timer):
+                if not put(item):
+                    return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            put(end_of_stream)
+
+    decoder = threading.Thread(target=decode, name='frame-decoder', daemon=True)
+    decoder.start()
+    try:
+        while True:
+            item = frame_queue.get()
+            if item is end_of_stream:
+                break
+            yield item
+        if errors:
+            raise errors[0]
+    finally:
+        stop_event.set()
+        decoder.join()
+
+
+def iter_landmarks(cap, pose, stride, max_long_side, pipelined=False, start_index=0, end_index=None,
+                   roi_tracking=False, motion_gate=False, timer=None):
+    """
+    デコード → 色変換 → 推論を行い、解析フレームごとに (フレーム番号, ランドマーク) を返す
+
+    スコアリング・ランドマーク出力・キャッシュはすべてこのジェネレータの結果を使うため、
+    1回の推論で全員分をまかなえる。人物が検出されなかったフレームはランドマークがNoneになる。
+
+    Args:
+        cap: cv2.VideoCapture（呼び出し側で解放する）
+        pose: MediaPipe Poseインスタンス
+        stride: フレーム間隔
+        max_long_side: 推論前に縮小する長辺の上限
+        pipelined: デコードを別スレッドで並行実行するか
+        start_index / end_index: 解析するフレーム範囲 [start, end)
+        roi_tracking: 前フレームの選手の周囲だけを切り出して推論するか（roi_tracking.RoiTracker）
+        motion_gate: 動きのないフレームは推論せず、直前の結果を使い回すか（motion_gate.MotionGate）
+        timer: StageTimer。デコード・色変換に加え、推論を 'inference'、モーションゲートの判定を 'motion_gate' として記録する
+               （パイプライン版ではデコード・色変換は別スレッドでの時間になる）
+
+    Yields:
+        tuple: (フレーム番号, (33, 4) のfloat32配列 or None)
+               使い回したフレームでは直前と同じ配列オブジェクトを返す（呼び出し側で書き換えないこと）
+    """
+    tracker = RoiTracker() if roi_tracking else None
+    gate = MotionGate() if motion_gate else None
+    previous = None
+    if pipelined:
+        frames = iter_rgb_frames_threaded(cap, stride, max_long_side, start_index=start_index, end_index=end_index,
+                                          timer=timer)
+    else:
+        frames = iter_rgb_frames(cap, stride, max_long_side, start_index, end_index, timer)
     
-    dot_product = vec1_x * vec2_x + vec1_y * vec2_y
-    mag1 = math.sqrt(vec1_x**2 + vec1_y**2)
-    mag2 = math.sqrt(vec2_x**2 + vec2_y**2)
+    try:
+        for frame_index, image_rgb in frames:
+            if gate is not None:
+                start = time.perf_counter()
+                static = gate.is_static(image_rgb)
+                if timer is not None:
+                    timer.add_frame('motion_gate', time.perf_counter() - start)
+                if static:
+                    # 最後に推論したフレームから動きがなければ推論しない
+                    yield frame_index, previous
+                    continue
+            
+            start = time.perf_counter()
+            if tracker is not None:
+                previous = tracker.process(pose, image_rgb)
+            else:
+                results = pose.process(image_rgb)
+                previous = landmarks_to_array(results.pose_landmarks.landmark) if results.pose_landmarks else None
+            if timer is not None:
+                timer.add_frame('inference', time.perf_counter() - start)
+            yield frame_index, previous
+    finally:
+        frames.close()
+
+
+def extract_landmarks(cap, pose, stride, max_long_side, pipelined=False,
+                      start_index=0, end_index=None, capacity=256, writer=None, roi_tracking=False,
+                      motion_gate=False, timer=None, deadline=None):
+    """
+    開いた動画からランドマークを抽出してLandmarkBufferに詰める
+
+    Args:
+        cap / pose / stride / max_long_side / pipelined / start_index / end_index / roi_tracking / motion_gate / timer:
+            iter_landmarks と同じ
+        capacity: バッファの初期容量
+        writer: landmark_format のライター。指定すると同じ推論結果をファイルにも書き出す
+        deadline: time.monotonic() の打ち切り時刻。過ぎたらそこで止めて buffer.truncated を True にする
+
+    Returns:
+        LandmarkBuffer: 検出できたフレームのランドマーク
+    """
+    buffer = LandmarkBuffer(capacity)
+    frames = iter_landmarks(cap, pose, stride, max_long_side, pipelined,
+                            start_index, end_index, roi_tracking, motion_gate, timer)
+    try:
+        for frame_index, landmarks in frames:
+            if landmarks is not None:
+                buffer.append(landmarks, frame_index)
+                if writer is not None:
+                    writer.append_points(landmarks, frame_index)
+            if deadline is not None and time.monotonic() >= deadline:
+                buffer.truncated = True
+                break
+    finally:
+        frames.close()
+    return buffer
+
+
+def plan_segments(total_frames, stride, workers, overlap=None, min_frames=None):
+    """
+    動画を並列解析用の区間に分割
+
+    区間の境界は解析フレーム（strideの倍数）に揃えるため、
+    各区間の結果を連結すると全体を順に解析した場合と同じフレーム列になる。
+
+    Args:
+        total_frames: 動画の総フレーム数
+        stride: フレーム間隔
+        workers: 最大区間数
+        overlap: 区間の手前に助走として解析する解析フレーム数
+        min_frames: 1区間あたりの最小解析フレーム数
+
+    Returns:
+        list[tuple]: (助走開始フレーム, 区間開始フレーム, 区間終了フレーム or None) のリスト
+    """
+    if overlap is None:
+        overlap = ANALYSIS_SEGMENT_OVERLAP
+    if min_frames is None:
+        min_frames = ANALYSIS_MIN_SEGMENT_FRAMES
     
-    if mag1 == 0 or mag2 == 0:
-        return 0
+    sampled_frames = math.ceil(total_frames / stride) if total_frames > 0 else 0
+    count = min(workers, sampled_frames // max(1, min_frames))
+    if count <= 1:
+        return [(0, 0, None)]
     
-    cos_angle = dot_product / (mag1 * mag2)
-    cos_angle = max(-1.0, min(1.0, cos_angle))
-    angle = math.acos(cos_angle)
-    return math.degrees(angle)
+    per_segment = math.ceil(sampled_frames / count)
+    segments = []
+    for i in range(count):
+        start = i * per_segment * stride
+        if start >= total_frames:
+            break
+        # 最後の区間は終端まで読む（CAP_PROP_FRAME_COUNT が不正確な場合も取りこぼさない）
+        end = (i + 1) * per_segment * stride if i < count - 1 else None
+        warmup_start = max(0, start - overlap * stride)
+        segments.append((warmup_start, start, end))
+    return segments
 
 
-def analyze_kickboxing_form(video_path):
+def _analyze_segment(video_path, profile, stride, warmup_start, start, end, roi_tracking=False, motion_gate=False,
+                     share=1, deadline=None):
+    """
+    1区間を解析するワーカー関数（別プロセスで実行）
+
+    助走区間も推論して追跡状態を整え、結果からは取り除いて返す。
+    工程ごとの所要時間（StageTimer.state()）と、deadline で途中で打ち切ったかも合わせて返す。
+    スレッド数は同時に動くワーカー数（share）でCPUを分け合うように決める。
+    deadline は time.monotonic() の時刻（同じホストのプロセス間で共通の時計）で、過ぎたら推論をやめて
+    ワーカーを次の動画の区間に空ける。
+    """
+    # 区間ごとにPoseを1つずつ使う
+    tune_threads(share, concurrent_poses=1)
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"動画ファイルが開けませんでした: {video_path}")
+    timer = StageTimer()
+    try:
+        with checkout_pose(profile) as pose:
+            buffer = extract_landmarks(
+                cap, pose, stride, profile['max_long_side'],
+                start_index=warmup_start, end_index=end, roi_tracking=roi_tracking, motion_gate=motion_gate,
+                timer=timer, deadline=deadline
+            )
+    finally:
+        cap.release()
+    keep = buffer.frame_indices >= start
+    return buffer.landmarks[keep].copy(), buffer.frame_indices[keep].copy(), timer.state(), buffer.truncated
+
+
+_segment_executor = None
+_segment_executor_workers = 0
+_segment_executor_lock = threading.Lock()
+
+
+def get_segment_executor(workers=None):
+    """
+    区間解析用のプロセスプールを取得（プロセス内で使い回す）
+
+    MediaPipeは内部スレッドを持つためforkではなくspawnで起動する。
+    ワーカープロセスはそれぞれ自分のPoseプールを持ち、次の動画でも温まった状態で使われる。
+    プールの大きさは最初に作成したときの workers（省略時は ANALYSIS_PARALLEL_WORKERS）で固定し、
+    動画ごとの区間数では作り直さない（作り直すと温まったワーカーを捨て、別スレッドが投入中のプールを止めてしまう）。
+    ワーカープロセスが異常終了してプールが使えなくなった場合だけ作り直す。
+
+    Returns:
+        tuple: (ProcessPoolExecutor, ワーカー数)
+    """
+    global _segment_executor, _segment_executor_workers
+    with _segment_executor_lock:
+        if _segment_executor is None or getattr(_segment_executor, '_broken', False):
+            if _segment_executor is not None:
+                logger.warning("⚠️ 区間解析のプロセスプールが異常終了したため作り直します")
+            _segment_executor_workers = max(1, workers or ANALYSIS_PARALLEL_WORKERS)
+            _segment_executor = ProcessPoolExecutor(
+                max_workers=_segment_executor_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _segment_executor, _segment_executor_workers
+
+
+def analyze_segments_parallel(video_path, profile, stride, segments, deadline=None, roi_tracking=False,
+                              motion_gate=False, timer=None, workers=None):
+    """
+    区間ごとにプロセスプールで解析し、フレーム順に連結
+
+    先頭から連続して解析できた区間だけを使う。途中の区間が失敗した場合も、時間の上限と同じく
+    そこまでの結果で打ち切る（先頭の区間から失敗した場合は例外を送出する）。
+
+    Args:
+        deadline: time.monotonic() の打ち切り時刻。それまでに終わった先頭からの連続した区間だけを使う
+                  （ワーカーにも渡し、実行中の区間も時刻を過ぎたら止める）
+        workers: プロセスプールを初めて作成する場合のワーカー数（get_segment_executor）
+        roi_tracking: 各区間で選手の周囲を切り出して推論するか
+        motion_gate: 各区間で動きのないフレームの推論を省くか
+        timer: StageTimer。使った区間のワーカーで計測した工程ごとの時間を合算する
+
+    Returns:
+        tuple: (ランドマーク配列 (frames, 33, 4), フレーム番号配列, 打ち切ったか)
+    """
+    executor, pool_workers = get_segment_executor(workers)
+    futures = [
+        executor.submit(_analyze_segment, video_path, profile, stride, warmup_start, start, end,
+                        roi_tracking, motion_gate, pool_workers, deadline)
+        for warmup_start, start, end in segments
+    ]
+    timeout = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+    wait(futures, timeout=timeout)
+    parts = []
+    truncated = False
+    for i, future in enumerate(futures):
+        if not future.done():
+            truncated = True
+            break
+        try:
+            part = future.result()
+        except Exception as e:
+            if not parts:
+                raise
+            logger.warning(f"⚠️ 区間{i + 1}/{len(futures)}の解析に失敗したため、それより前の区間で打ち切ります: {str(e)}")
+            truncated = True
+            break
+        parts.append(part)
+        if part[3]:
+            # この区間はワーカー側で時間の上限により途中で止まっている
+            truncated = True
+            break
+    if timer is not None:
+        for part in parts:
+            timer.merge(part[2])
+    for future in futures[len(parts):]:
+        # 開始前の区間は取り消す（実行中の区間は deadline を過ぎたところでワーカー側で止まる）
+        future.cancel()
+    if not parts:
+        return (np.zeros((0, NUM_LANDMARKS, LANDMARK_DIMS), dtype=np.float32),
+                np.zeros(0, dtype=np.int32), truncated)
+    landmarks = np.concatenate([part[0] for part in parts], axis=0)
+    frame_indices = np.concatenate([part[1] for part in parts], axis=0)
+    return landmarks, frame_indices, truncated
+
+
+def _landmark_cache_key(content_hash, analysis_profile, frame_stride, target_fps, roi_tracking, motion_gate):
+    """ランドマークの結果に影響する設定をすべて含めたキャッシュキーを作成"""
+    settings = {
+        'max_long_side': analysis_profile['max_long_side'],
+        'model_complexity': analysis_profile['model_complexity'],
+        'smooth_landmarks': analysis_profile['smooth_landmarks'],
+        'frame_stride': ANALYSIS_FRAME_STRIDE if frame_stride is None else frame_stride,
+        'target_fps': ANALYSIS_TARGET_FPS if target_fps is None else target_fps,
+    }
+    if roi_tracking:
+        # 既存のキャッシュキーを変えないよう、有効な場合だけ含める
+        settings['roi_tracking'] = [ANALYSIS_ROI_PADDING, ANALYSIS_ROI_MAX_AREA, ROI_RESET_SHIFT]
+    if motion_gate:
+        settings['motion_gate'] = [ANALYSIS_MOTION_THRESHOLD, ANALYSIS_MOTION_PIXEL_DIFF, ANALYSIS_MOTION_MAX_SKIP,
+                                   ANALYSIS_MOTION_MIN_STATIC]
+    return landmark_cache.make_cache_key(content_hash, settings)
+
+
+def _video_metadata(cap):
+    """ランドマーク出力のヘッダーに書く (fps, 幅, 高さ)"""
+    return (
+        cap.get(cv2.CAP_PROP_FPS),
+        int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+    )
+
+
+def _export_landmarks(export_path, metadata, landmarks, frame_indices):
+    """抽出済みのランドマーク配列をまとめて書き出す（並列解析・キャッシュヒット時）"""
+    with open_landmark_writer(export_path, *metadata) as writer:
+        for frame_index, row in zip(np.asarray(frame_indices).tolist(), landmarks):
+            writer.append_points(row, frame_index)
+
+
+def analyze_kickboxing_form(video_path, frame_stride=None, target_fps=None, profile=None,
+                            pipelined=None, parallel_workers=None, content_hash=None,
+                            max_duration_seconds=None, cap=None, export_path=None,
+                            time_budget_seconds=None, roi_tracking=None, motion_gate=None, timer=None):
     """
     動画を解析してキックボクシングのスコアを算出
+
+    Args:
+        video_path: 動画ファイルのパス
+        frame_stride: Nフレームごとに解析（省略時は環境変数 ANALYSIS_FRAME_STRIDE）
+        target_fps: 解析の目標fps（省略時は環境変数 ANALYSIS_TARGET_FPS）
+        profile: 解析プロファイル名または設定dict（省略時は環境変数 ANALYSIS_PROFILE）
+        pipelined: デコードを別スレッドで並行実行するか（省略時は環境変数 ANALYSIS_PIPELINED）
+        parallel_workers: 区間分割して並列解析するプロセス数（省略時は環境変数 ANALYSIS_PARALLEL_WORKERS）
+        content_hash: 動画の内容ハッシュ（GCSのmd5_hash/crc32c）。指定するとランドマークキャッシュを使う
+        max_duration_seconds: 動画の長さの上限。超えていれば推論せずに error_code=duration_exceeded を返す
+                              （ストリーミング取り込みでは事前チェックができないため、ここで判定する）
+        cap: 呼び出し側で開いた cv2.VideoCapture（同じファイルを二度開かないため）。
+             渡した場合はこの関数内で解放する
+        export_path: 指定するとスコアリングと同じ推論結果のランドマークをこのパスに書き出す
+                     （形式は拡張子で判定: .json / .jsonl / .lmk / .lmq / .lmq.gz）
+        time_budget_seconds: 計算時間の上限（省略時は環境変数 ANALYSIS_TIME_BUDGET_SECONDS、0 = 無制限）。
+                             超えた場合はそこまでのフレームでのスコアを partial=True で返す
+        roi_tracking: 前フレームの選手の周囲だけを切り出して推論するか（省略時は環境変数 ANALYSIS_ROI_TRACKING）
+        motion_gate: 動きのないフレームは推論せず直前の結果を使い回すか（省略時は環境変数 ANALYSIS_MOTION_GATE）
+        timer: 工程ごとの所要時間を記録する StageTimer（省略時は新しく作る）。
+               呼び出し側のダウンロードなどと同じタイマーに記録したい場合に渡す
+
+    間引いたフレームはcap.grab()でデコードせずに読み飛ばす。
+    パンチ速度はサンプリング間隔（stride / fps 秒）で割るため、
+    全フレーム解析時とスコアの尺度が変わらない。
+    ランドマークはループ内で配列に詰めるだけにし、スコアは最後に一括計算する。
+    Poseはプロセス内のプールから借りるため、ウォームインスタンスではモデル読み込みが発生しない。
+    並列解析では各区間のランドマークを連結してから採点するため、
+    区間の境界をまたぐパンチ速度も順次解析と同じように計算される。
+    キャッシュにヒットした場合は動画を開かずにスコアリングだけを行う。
+    export_path を指定すると、スコアリング・キャッシュと同じ1回の推論からランドマークも書き出す。
+    順次解析ではスコアを IncrementalScorer でフレームごとに集計し、
+    ランドマーク配列はキャッシュに保存する場合だけ保持する。
+    途中で打ち切った結果（partial）はキャッシュに保存しない。
+    戻り値の timings には工程ごとの合計時間と、フレーム単位の工程（decode / color / inference / scoring など）の
+    1フレームあたりの p50 / p95 / 最大（ミリ秒）が入る。
     """
     
-    punch_speeds = []
-    guard_positions = []
-    kick_heights = []
-    core_rotations = []
+    if timer is None:
+        timer = StageTimer()
+    # プロセスで最初の解析の前にOpenCVと推論のスレッド数を決める（2回目以降は何もしない）
+    tune_threads()
+    if time_budget_seconds is None:
+        time_budget_seconds = ANALYSIS_TIME_BUDGET_SECONDS
+    deadline = time.monotonic() + time_budget_seconds if time_budget_seconds and time_budget_seconds > 0 else None
     
-    mp_pose = mp.solutions.pose
+    analysis_profile = get_analysis_profile(profile)
+    if roi_tracking is None:
+        roi_tracking = ANALYSIS_ROI_TRACKING
+    if motion_gate is None:
+        motion_gate = ANALYSIS_MOTION_GATE
     
-    with mp_pose.Pose(
-        min_detection_confidence=0.5,
-        min_tracking_confidence=0.5
-    ) as pose:
-        
-        cap = cv2.VideoCapture(video_path)
-        
-        if not cap.isOpened():
+    cache_key = None
+    if content_hash:
+        cache_key = _landmark_cache_key(content_hash, analysis_profile, frame_stride, target_fps, roi_tracking, motion_gate)
+        with timer.stage('cache_lookup'):
+            cached = landmark_cache.load(cache_key)
+        if cached is not None:
+            if export_path:
+                # ヘッダー用のメタデータだけを読む（デコードはしない）
+                with timer.stage('export'):
+                    meta_cap = cap if cap is not None else cv2.VideoCapture(video_path)
+                    _export_landmarks(export_path, _video_metadata(meta_cap), cached['landmarks'], cached['frame_indices'])
+                    meta_cap.release()
+            if cap is not None:
+                cap.release()
+            with timer.stage('scoring'):
+                scores = compute_scores(cached['landmarks'], cached['sample_fps'])
             return {
-                "status": "failure",
-                "error_message": f"動画ファイルが開けませんでした: {video_path}"
+                "status": "success",
+                "scores": scores,
+                "error_message": None,
+                "cache_hit": True,
+                "partial": False,
+                "timings": timer.summary()
             }
-        
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_count = 0
-        prev_hand_positions = {"left": None, "right": None}
-        
-        while cap.isOpened():
-            success, image = cap.read()
-            if not success:
-                break
-            
-            frame_count += 1
-            image.flags.writeable = False
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            results = pose.process(image_rgb)
-            
-            if results.pose_landmarks:
-                landmarks = results.pose_landmarks.landmark
-                
-                left_wrist = {'x': landmarks[15].x, 'y': landmarks[15].y, 'z': landmarks[15].z}
-                right_wrist = {'x': landmarks[16].x, 'y': landmarks[16].y, 'z': landmarks[16].z}
-                left_shoulder = {'x': landmarks[11].x, 'y': landmarks[11].y, 'z': landmarks[11].z}
-                right_shoulder = {'x': landmarks[12].x, 'y': landmarks[12].y, 'z': landmarks[12].z}
-                left_hip = {'x': landmarks[23].x, 'y': landmarks[23].y, 'z': landmarks[23].z}
-                right_hip = {'x': landmarks[24].x, 'y': landmarks[24].y, 'z': landmarks[24].z}
-                
-                # パンチ速度
-                if prev_hand_positions["left"] and prev_hand_positions["right"]:
-                    left_distance = calculate_distance(left_wrist, prev_hand_positions["left"])
-                    right_distance = calculate_distance(right_wrist, prev_hand_positions["right"])
-                    max_distance = max(left_distance, right_distance)
-                    speed = max_distance * fps
-                    punch_speeds.append(speed)
-                
-                prev_hand_positions["left"] = left_wrist
-                prev_hand_positions["right"] = right_wrist
-                
-                # ガード姿勢
-                left_guard_height = abs(left_wrist['y'] - left_shoulder['y'])
-                right_guard_height = abs(right_wrist['y'] - right_shoulder['y'])
-                avg_guard_height = (left_guard_height + right_guard_height) / 2
-                guard_positions.append(avg_guard_height)
-                
-                # キック高さ
-                left_ankle = {'x': landmarks[27].x, 'y': landmarks[27].y, 'z': landmarks[27].z}
-                right_ankle = {'x': landmarks[28].x, 'y': landmarks[28].y, 'z': landmarks[28].z}
-                max_kick_height = max(
-                    left_hip['y'] - left_ankle['y'],
-                    right_hip['y'] - right_ankle['y']
-                )
-                kick_heights.append(max_kick_height)
-                
-                # コア回転
-                shoulder_angle = calculate_angle(left_shoulder, left_hip, right_hip)
-                core_rotations.append(shoulder_angle)
-        
+    
+    if cap is None:
+        cap = cv2.VideoCapture(video_path)
+    
+    if not cap.isOpened():
         cap.release()
+        return {
+            "status": "failure",
+            "error_message": f"動画ファイルが開けませんでした: {video_path}"
+        }
     
-    # スコアリング（0-100点）
-    punch_speed_score = 0
-    if punch_speeds:
-        max_speed = max(punch_speeds)
-        punch_speed_score = min(100, max(0, max_speed * 100))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    stride = resolve_frame_stride(fps, frame_stride, target_fps)
+    # サンプリングしたフレーム間の実時間に合わせた速度換算係数
+    sample_fps = fps / stride
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
     
-    guard_stability_score = 0
-    if guard_positions:
-        avg_guard = sum(guard_positions) / len(guard_positions)
-        guard_stability_score = max(0, min(100, 100 - (avg_guard * 500)))
+    if max_duration_seconds and fps > 0 and total_frames / fps > max_duration_seconds:
+        cap.release()
+        return {
+            "status": "failure",
+            "error_code": "duration_exceeded",
+            "error_message": f"video duration too long: {total_frames / fps:.2f}s > {max_duration_seconds}s"
+        }
     
-    kick_height_score = 0
-    if kick_heights:
-        max_kick = max(kick_heights)
-        kick_height_score = min(100, max(0, max_kick * 500))
+    if parallel_workers is None:
+        parallel_workers = ANALYSIS_PARALLEL_WORKERS
+    segments = plan_segments(total_frames, stride, parallel_workers) if parallel_workers > 1 else []
     
-    core_rotation_score = 0
-    if core_rotations:
-        avg_rotation = sum(core_rotations) / len(core_rotations)
-        ideal_angle = 45
-        distance = abs(avg_rotation - ideal_angle)
-        core_rotation_score = max(0, min(100, 100 - (distance * 2)))
+    metadata = _video_metadata(cap)
+    if len(segments) > 1:
+        cap.release()
+        landmarks, frame_indices, partial = analyze_segments_parallel(
+            video_path, analysis_profile, stride, segments, deadline, roi_tracking, motion_gate, timer,
+            parallel_workers
+        )
+        if export_path:
+            with timer.stage('export'):
+                _export_landmarks(export_path, metadata, landmarks, frame_indices)
+        with timer.stage('scoring'):
+            scores = compute_scores(landmarks, sample_fps)
+    else:
+        if pipelined is None:
+            pipelined = ANALYSIS_PIPELINED
+        scorer = IncrementalScorer(sample_fps)
+        # ランドマーク配列はキャッシュに保存する場合だけ保持する
+        buffer = LandmarkBuffer(total_frames // stride + 1 if total_frames > 0 else 256) if cache_key else None
+        writer = open_landmark_writer(export_path, *metadata) if export_path else None
+        partial = False
+        try:
+            # ランドマークを書き出す場合はvisibilityも含めて新規インスタンスと同じ結果にする
+            with checkout_pose(analysis_profile, exact=bool(export_path)) as pose:
+                frames = iter_landmarks(
+                    cap, pose, stride, analysis_profile['max_long_side'], pipelined,
+                    roi_tracking=roi_tracking, motion_gate=motion_gate, timer=timer
+                )
+                try:
+                    for frame_index, landmarks in frames:
+                        if landmarks is not None:
+                            start = time.perf_counter()
+                            scorer.update(landmarks)
+                            if buffer is not None:
+                                buffer.append(landmarks, frame_index)
+                            scored = time.perf_counter()
+                            timer.add_frame('scoring', scored - start)
+                            if writer is not None:
+                                writer.append_points(landmarks, frame_index)
+                                timer.add_frame('export', time.perf_counter() - scored)
+                        if deadline is not None and time.monotonic() >= deadline:
+                            partial = True
+                            break
+                finally:
+                    frames.close()
+        finally:
+            cap.release()
+            if writer is not None:
+                writer.close()
+        scores = scorer.scores()
+        if buffer is not None:
+            landmarks = buffer.landmarks
+            frame_indices = buffer.frame_indices
+    
+    if partial:
+        logger.warning(f"⏱️ 計算時間の上限（{time_budget_seconds}秒）に達したため、途中までのフレームでスコアを算出しました")
+    elif cache_key:
+        with timer.stage('cache_store'):
+            landmark_cache.store(cache_key, landmarks, frame_indices, sample_fps)
     
+    # スコアリング（0-100点）
     return {
         "status": "success",
-        "scores": {
-            "punch_speed": round(punch_speed_score, 1),
-            "guard_stability": round(guard_stability_score, 1),
-            "kick_height": round(kick_height_score, 1),
-            "core_rotation": round(core_rotation_score, 1)
-        },
-        "error_message": None
+        "scores": scores,
+        "error_message": None,
+        "cache_hit": False,
+        "partial": partial,
+        "timings": timer.summary()
     }
-
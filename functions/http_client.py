@@ -0,0 +1,112 @@
+"""
+Dify・LINE 呼び出し用の共有HTTPクライアント
+
+requests.post をそのまま呼ぶと毎回新しいセッションが作られ、呼び出しのたびに
+api.dify.ai / api.line.me とのTCP・TLSハンドシェイクをやり直すことになる。
+ホストごとにコネクションプール（urllib3）を1つ持ち、ウォームなインスタンスでは
+ジョブをまたいで keep-alive の接続を使い回す。
+
+- コネクションプールとリトライ設定を持つ HTTPAdapter はホストごとにプロセスで共有する（urllib3のプールはスレッドセーフ）
+- requests.Session はスレッドセーフではないため、スレッドごとに作成して共有の HTTPAdapter をマウントする
+- タイムアウトを指定しない呼び出しには (接続, 読み取り) の既定値を設定する
+- リトライは接続の確立に失敗した場合のみ（サーバーに届いていないため、POSTでも二重送信にならない）。
+  ステータスコードによるリトライは呼び出し側（Difyの503/429、LINEの tenacity）で行う
+- pool_stats() で、ホストごとのリクエスト数と新規接続数（＝接続を使い回せなかった回数）を確認できる
+"""
+
+import os
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# HTTP_CONNECT_TIMEOUT: 接続のタイムアウト（秒）
+# HTTP_READ_TIMEOUT: 読み取りのタイムアウト（秒）
+# HTTP_POOL_MAXSIZE: ホストごとに保持する接続数の上限
+# HTTP_CONNECT_RETRIES: 接続の確立に失敗した場合のリトライ回数
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '30'))
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', '4'))
+HTTP_CONNECT_RETRIES = int(os.environ.get('HTTP_CONNECT_RETRIES', '2'))
+
+_adapters = {}
+_adapters_lock = threading.Lock()
+_local = threading.local()
+
+
+def _make_adapter():
+    retries = Retry(
+        total=HTTP_CONNECT_RETRIES,
+        connect=HTTP_CONNECT_RETRIES,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=0.3,
+        allowed_methods=None,
+        raise_on_status=False,
+    )
+    # pool_block=False: 上限を超えて同時に呼ばれた場合は一時的な接続を作る（待たせない）
+    return HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retries, pool_block=False)
+
+
+def _adapter_for(origin):
+    with _adapters_lock:
+        adapter = _adapters.get(origin)
+        if adapter is None:
+            adapter = _make_adapter()
+            _adapters[origin] = adapter
+        return adapter
+
+
+def get_session(url):
+    """url のホスト用のセッション（呼び出したスレッド専用、コネクションプールはプロセスで共有）"""
+    parts = urlsplit(url)
+    origin = f"{parts.scheme}://{parts.netloc}"
+    sessions = getattr(_local, 'sessions', None)
+    if sessions is None:
+        sessions = _local.sessions = {}
+    session = sessions.get(origin)
+    if session is None:
+        session = requests.Session()
+        session.mount(f"{origin}/", _adapter_for(origin))
+        sessions[origin] = session
+    return session
+
+
+def request(method, url, **kwargs):
+    """共有のコネクションプールを使ってリクエスト（引数は requests.request と同じ）"""
+    kwargs.setdefault('timeout', (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    return get_session(url).request(method, url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def pool_stats():
+    """
+    ホストごとの接続の使い回し状況
+
+    Returns:
+        dict: {origin: {'requests', 'new_connections', 'reused'}}（プロセス起動からの累計）
+    """
+    with _adapters_lock:
+        adapters = dict(_adapters)
+    stats = {}
+    for origin, adapter in adapters.items():
+        manager = adapter.poolmanager
+        requests_count = 0
+        new_connections = 0
+        for key in manager.pools.keys():
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            requests_count += pool.num_requests
+            new_connections += pool.num_connections
+        stats[origin] = {
+            'requests': requests_count,
+            'new_connections': new_connections,
+            'reused': max(0, requests_count - new_connections),
+        }
+    return stats
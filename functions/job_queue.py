@@ -0,0 +1,465 @@
+"""
+動画解析ジョブのキューとワーカープール
+
+キューモード（VIDEO_QUEUE_MODE=true）では、HTTPエンドポイント（app）はイベントを検証して
+ジョブをキューに積むだけで応答し、ダウンロード・解析・Dify・LINEはワーカーがキューから取り出して実行する。
+受け付けと処理を分けることで、それぞれの処理量を別々に増減できる。
+
+ワーカーは受け付け用とは別のプロセス（main.run_video_queue_worker）で動かす。
+Cloud Run のリクエスト課金（CPUはリクエストの処理中だけ割り当て）では、応答を返した後のバックグラウンドの
+スレッドはCPUを絞られてほとんど進まないため、HTTPサービスの中ではワーカーを動かさない（VIDEO_QUEUE_WORKERS=0）。
+HTTPサービスの中で動かす場合は、CPUを常に割り当てる設定（--no-cpu-throttling）にすること。
+
+キューの実装（VIDEO_QUEUE_BACKEND）:
+- firestore: Firestoreのコレクション（本番用。複数インスタンスで共有できる）
+- sqlite: SQLiteファイル（ローカル実行用。同じファイルを使うプロセス間で共有できる）
+- memory: プロセス内（ローカル実行・動作確認用）
+
+取り出し（lease）:
+- ジョブを取り出したワーカーは VIDEO_QUEUE_LEASE_SECONDS 秒の貸し出し期限を持ち、処理中は定期的に延長する
+- 処理が終われば ack、例外で失敗すれば nack（VIDEO_QUEUE_MAX_ATTEMPTS 回までキューに戻す）。
+  再実行したい失敗は、handler が例外を送出して知らせる（戻り値は ack の result として記録するだけ）
+- ワーカーが落ちて期限が切れたジョブは、別のワーカーが取り出し直す
+- 貸し出しごとにトークンを発行し、期限切れ後に他のワーカーへ渡ったジョブを元のワーカーが ack / nack しても無視する
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta, timezone
+
+try:
+    from google.cloud import firestore
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    from google.api_core.exceptions import AlreadyExists
+except ImportError:
+    # ローカル実行（memory / sqlite）ではFirestoreは不要
+    firestore = None
+
+logger = logging.getLogger(__name__)
+
+# VIDEO_QUEUE_MODE: true の場合、app はジョブをキューに積んで応答し、処理はワーカーが行う
+# VIDEO_QUEUE_BACKEND: firestore / sqlite / memory
+# VIDEO_QUEUE_COLLECTION: firestore の場合のコレクション名
+# VIDEO_QUEUE_SQLITE_PATH: sqlite の場合のファイルパス
+# VIDEO_QUEUE_WORKERS: HTTPサービス（app）の中で動かすワーカー数（既定の 0 は受け付けのみ。1以上はCPUの常時割り当てが必要）
+# VIDEO_QUEUE_LEASE_SECONDS: 取り出したジョブの貸し出し期限（処理中は1/3ごとに延長する）
+# VIDEO_QUEUE_MAX_ATTEMPTS: 失敗したジョブを再実行する最大回数
+# VIDEO_QUEUE_POLL_SECONDS: キューが空の場合に次に確認するまでの秒数
+VIDEO_QUEUE_MODE = os.environ.get('VIDEO_QUEUE_MODE', 'false').lower() in ('1', 'true', 'yes')
+VIDEO_QUEUE_BACKEND = os.environ.get('VIDEO_QUEUE_BACKEND', 'firestore').lower()
+VIDEO_QUEUE_COLLECTION = os.environ.get('VIDEO_QUEUE_COLLECTION', 'video_queue')
+VIDEO_QUEUE_SQLITE_PATH = os.environ.get('VIDEO_QUEUE_SQLITE_PATH', '/tmp/video_queue.sqlite3')
+VIDEO_QUEUE_WORKERS = int(os.environ.get('VIDEO_QUEUE_WORKERS', '0'))
+VIDEO_QUEUE_LEASE_SECONDS = float(os.environ.get('VIDEO_QUEUE_LEASE_SECONDS', '600'))
+VIDEO_QUEUE_MAX_ATTEMPTS = int(os.environ.get('VIDEO_QUEUE_MAX_ATTEMPTS', '3'))
+VIDEO_QUEUE_POLL_SECONDS = float(os.environ.get('VIDEO_QUEUE_POLL_SECONDS', '2'))
+
+# 取り出したジョブ（token は ack / nack / renew のときに本人確認に使う）
+Lease = namedtuple('Lease', ['job_id', 'payload', 'attempts', 'token'])
+
+
+def _new_token():
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex}"
+
+
+class MemoryQueue:
+    """プロセス内のキュー（ローカル実行・動作確認用）"""
+
+    def __init__(self, max_attempts=None):
+        self.max_attempts = VIDEO_QUEUE_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def enqueue(self, job_id, payload):
+        """ジョブを積む（同じjob_idが既にあれば積まずにFalse）"""
+        with self._lock:
+            if job_id in self._jobs:
+                return False
+            self._jobs[job_id] = {'payload': payload, 'status': 'queued', 'attempts': 0,
+                                  'token': None, 'lease_expires': None}
+            return True
+
+    def lease(self, lease_seconds):
+        """取り出せるジョブ（待機中または貸し出し期限切れ）を1件取り出す。なければNone"""
+        now = time.time()
+        with self._lock:
+            for job_id, job in self._jobs.items():
+                claimable = job['status'] == 'queued' or (job['status'] == 'leased' and job['lease_expires'] < now)
+                if not claimable:
+                    continue
+                if job['attempts'] >= self.max_attempts:
+                    job.update(status='failed', token=None, lease_expires=None, error='lease expired too many times')
+                    continue
+                job.update(status='leased', token=_new_token(), lease_expires=now + lease_seconds,
+                           attempts=job['attempts'] + 1)
+                return Lease(job_id, job['payload'], job['attempts'], job['token'])
+        return None
+
+    def _owned(self, lease):
+        job = self._jobs.get(lease.job_id)
+        if job is None or job['status'] != 'leased' or job['token'] != lease.token:
+            return None
+        return job
+
+    def renew(self, lease, lease_seconds):
+        with self._lock:
+            job = self._owned(lease)
+            if job is None:
+                return False
+            job['lease_expires'] = time.time() + lease_seconds
+            return True
+
+    def ack(self, lease, result=None):
+        with self._lock:
+            job = self._owned(lease)
+            if job is None:
+                return False
+            job.update(status='done', token=None, lease_expires=None, result=result)
+            return True
+
+    def nack(self, lease, error):
+        with self._lock:
+            job = self._owned(lease)
+            if job is None:
+                return False
+            status = 'failed' if job['attempts'] >= self.max_attempts else 'queued'
+            job.update(status=status, token=None, lease_expires=None, error=error)
+            return True
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return counts
+
+
+class SqliteQueue:
+    """SQLiteファイルのキュー（ローカル実行用）。操作ごとに接続し、取り出しは BEGIN IMMEDIATE で排他する"""
+
+    def __init__(self, path=None, max_attempts=None):
+        self.path = VIDEO_QUEUE_SQLITE_PATH if path is None else path
+        self.max_attempts = VIDEO_QUEUE_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS video_queue (
+                    job_id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_token TEXT,
+                    lease_expires REAL,
+                    enqueued_at REAL NOT NULL,
+                    result TEXT,
+                    error TEXT
+                )
+            """)
+
+    @contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, job_id, payload):
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO video_queue (job_id, payload, status, enqueued_at) VALUES (?, ?, 'queued', ?)",
+                (job_id, json.dumps(payload), time.time()),
+            )
+            return cursor.rowcount == 1
+
+    def lease(self, lease_seconds):
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                "UPDATE video_queue SET status = 'failed', lease_token = NULL, lease_expires = NULL, "
+                "error = 'lease expired too many times' "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            )
+            row = conn.execute(
+                "SELECT job_id, payload, attempts FROM video_queue "
+                "WHERE status = 'queued' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY enqueued_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            job_id, payload, attempts = row
+            token = _new_token()
+            conn.execute(
+                "UPDATE video_queue SET status = 'leased', lease_token = ?, lease_expires = ?, attempts = ? "
+                "WHERE job_id = ?",
+                (token, now + lease_seconds, attempts + 1, job_id),
+            )
+            conn.execute('COMMIT')
+            return Lease(job_id, json.loads(payload), attempts + 1, token)
+
+    def _update_owned(self, lease, assignments, params):
+        with self._connection() as conn:
+            cursor = conn.execute(
+                f"UPDATE video_queue SET {assignments} "
+                "WHERE job_id = ? AND status = 'leased' AND lease_token = ?",
+                (*params, lease.job_id, lease.token),
+            )
+            return cursor.rowcount == 1
+
+    def renew(self, lease, lease_seconds):
+        return self._update_owned(lease, 'lease_expires = ?', (time.time() + lease_seconds,))
+
+    def ack(self, lease, result=None):
+        return self._update_owned(
+            lease, "status = 'done', lease_token = NULL, lease_expires = NULL, result = ?",
+            (json.dumps(result, ensure_ascii=False, default=str),),
+        )
+
+    def nack(self, lease, error):
+        status = 'failed' if lease.attempts >= self.max_attempts else 'queued'
+        return self._update_owned(
+            lease, 'status = ?, lease_token = NULL, lease_expires = NULL, error = ?', (status, error)
+        )
+
+    def stats(self):
+        with self._connection() as conn:
+            return dict(conn.execute('SELECT status, COUNT(*) FROM video_queue GROUP BY status').fetchall())
+
+
+class FirestoreQueue:
+    """
+    Firestoreのコレクションのキュー（本番用）
+
+    取り出しは、待機中（status == 'queued'）と貸し出し期限切れ（lease_expires_at < 現在）の候補を
+    単一フィールドのクエリで探し、トランザクションで読み直して取り出せる場合だけ貸し出す
+    （複合インデックスは不要）。完了・失敗したジョブは lease_expires_at を None にして候補から外す。
+    """
+
+    def __init__(self, collection=None, max_attempts=None, client=None):
+        self.db = client or firestore.Client()
+        self.collection = self.db.collection(VIDEO_QUEUE_COLLECTION if collection is None else collection)
+        self.max_attempts = VIDEO_QUEUE_MAX_ATTEMPTS if max_attempts is None else max_attempts
+
+    def enqueue(self, job_id, payload):
+        try:
+            self.collection.document(job_id).create({
+                'payload': payload,
+                'status': 'queued',
+                'attempts': 0,
+                'lease_token': None,
+                'lease_expires_at': None,
+                'enqueued_at': firestore.SERVER_TIMESTAMP,
+                'updated_at': firestore.SERVER_TIMESTAMP
+            })
+            return True
+        except AlreadyExists:
+            return False
+
+    def _candidates(self, now, limit=10):
+        queued = self.collection.where(filter=FieldFilter('status', '==', 'queued')).limit(limit).stream()
+        expired = self.collection.where(filter=FieldFilter('lease_expires_at', '<', now)).limit(limit).stream()
+        seen = set()
+        for snapshot in list(queued) + list(expired):
+            if snapshot.id not in seen:
+                seen.add(snapshot.id)
+                yield snapshot.reference
+
+    def lease(self, lease_seconds):
+        now = datetime.now(timezone.utc)
+        token = _new_token()
+
+        @firestore.transactional
+        def claim(transaction, doc_ref):
+            snapshot = doc_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None
+            job = snapshot.to_dict()
+            expires = job.get('lease_expires_at')
+            claimable = job.get('status') == 'queued' or (
+                job.get('status') == 'leased' and expires is not None and expires < now
+            )
+            if not claimable:
+                return None
+            attempts = job.get('attempts', 0)
+            if attempts >= self.max_attempts:
+                transaction.update(doc_ref, {
+                    'status': 'failed',
+                    'lease_token': None,
+                    'lease_expires_at': None,
+                    'error': 'lease expired too many times',
+                    'updated_at': firestore.SERVER_TIMESTAMP
+                })
+                return None
+            transaction.update(doc_ref, {
+                'status': 'leased',
+                'lease_token': token,
+                'lease_expires_at': now + timedelta(seconds=lease_seconds),
+                'attempts': attempts + 1,
+                'leased_at': firestore.SERVER_TIMESTAMP,
+                'updated_at': firestore.SERVER_TIMESTAMP
+            })
+            return Lease(doc_ref.id, job.get('payload'), attempts + 1, token)
+
+        for doc_ref in self._candidates(now):
+            lease = claim(self.db.transaction(), doc_ref)
+            if lease is not None:
+                return lease
+        return None
+
+    def _update_owned(self, lease, fields):
+        doc_ref = self.collection.document(lease.job_id)
+
+        @firestore.transactional
+        def update(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return False
+            job = snapshot.to_dict()
+            if job.get('status') != 'leased' or job.get('lease_token') != lease.token:
+                return False
+            transaction.update(doc_ref, {**fields, 'updated_at': firestore.SERVER_TIMESTAMP})
+            return True
+
+        return update(self.db.transaction())
+
+    def renew(self, lease, lease_seconds):
+        return self._update_owned(lease, {
+            'lease_expires_at': datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)
+        })
+
+    def ack(self, lease, result=None):
+        return self._update_owned(lease, {
+            'status': 'done',
+            'lease_token': None,
+            'lease_expires_at': None,
+            'result': result,
+            'completed_at': firestore.SERVER_TIMESTAMP
+        })
+
+    def nack(self, lease, error):
+        return self._update_owned(lease, {
+            'status': 'failed' if lease.attempts >= self.max_attempts else 'queued',
+            'lease_token': None,
+            'lease_expires_at': None,
+            'error': error
+        })
+
+    def stats(self):
+        counts = {}
+        for status in ('queued', 'leased'):
+            query = self.collection.where(filter=FieldFilter('status', '==', status)).count()
+            counts[status] = query.get()[0][0].value
+        return counts
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """VIDEO_QUEUE_BACKEND のキュー（プロセスで1つ）"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            if VIDEO_QUEUE_BACKEND == 'memory':
+                _queue = MemoryQueue()
+            elif VIDEO_QUEUE_BACKEND == 'sqlite':
+                _queue = SqliteQueue()
+            elif VIDEO_QUEUE_BACKEND == 'firestore':
+                _queue = FirestoreQueue()
+            else:
+                raise ValueError(f"unknown VIDEO_QUEUE_BACKEND: {VIDEO_QUEUE_BACKEND}")
+        return _queue
+
+
+class QueueWorkerPool:
+    """
+    キューからジョブを取り出して handler(lease) を実行するワーカースレッド群
+
+    handler が例外を送出した場合は nack（再実行）、戻り値を返した場合は ack する。
+    lease.token は、処理中のジョブを別のワーカーが引き継いでよいかの判定などに使える。
+
+    使い方:
+        pool = QueueWorkerPool(get_queue(), handler, workers=2)
+        pool.start()
+        ...
+        pool.stop()
+    """
+
+    def __init__(self, queue, handler, workers=None, lease_seconds=None, poll_seconds=None):
+        self.queue = queue
+        self.handler = handler
+        self.workers = VIDEO_QUEUE_WORKERS if workers is None else workers
+        self.lease_seconds = VIDEO_QUEUE_LEASE_SECONDS if lease_seconds is None else lease_seconds
+        self.poll_seconds = VIDEO_QUEUE_POLL_SECONDS if poll_seconds is None else poll_seconds
+        self._stop = threading.Event()
+        self._threads = []
+        self.processed = 0
+        self.failed = 0
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"video-queue-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"🧰 キューワーカーを起動: {self.workers}スレッド（{type(self.queue).__name__}）")
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _heartbeat(self, lease, done):
+        """処理が終わるまで貸し出し期限の1/3ごとに延長する"""
+        while not done.wait(self.lease_seconds / 3):
+            try:
+                if not self.queue.renew(lease, self.lease_seconds):
+                    logger.warning(f"⚠️ 貸し出しを延長できませんでした（他のワーカーに渡った可能性）: {lease.job_id}")
+                    return
+            except Exception as e:
+                logger.warning(f"⚠️ 貸し出しの延長に失敗: {lease.job_id}: {str(e)}")
+
+    def run_once(self):
+        """1件取り出して処理する。キューが空ならFalse"""
+        lease = self.queue.lease(self.lease_seconds)
+        if lease is None:
+            return False
+        logger.info(f"📥 ジョブ取り出し: {lease.job_id}（{lease.attempts}回目）")
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(lease, done), daemon=True)
+        heartbeat.start()
+        try:
+            result = self.handler(lease)
+        except Exception as e:
+            done.set()
+            self.failed += 1
+            logger.error(f"❌ ジョブ処理エラー: {lease.job_id}: {str(e)}")
+            self.queue.nack(lease, str(e))
+            return True
+        done.set()
+        self.processed += 1
+        if not self.queue.ack(lease, result):
+            logger.warning(f"⚠️ ジョブの完了を記録できませんでした（貸し出し期限切れ）: {lease.job_id}")
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if not self.run_once():
+                    self._stop.wait(self.poll_seconds)
+            except Exception as e:
+                logger.error(f"❌ キューワーカーエラー: {str(e)}")
+                self._stop.wait(self.poll_seconds)
@@ -0,0 +1,85 @@
+"""
+ジョブの状態のFirestore書き込みをまとめる
+
+process_video の1回の実行では、処理中のマーク（トランザクション）のあとに、通知済みフラグ・LINE送信失敗・
+完了（解析結果・セリフ・所要時間）をそれぞれ別々に書き込んでいた。書き込みごとに往復が1回かかり、課金も1回ずつ発生する。
+JobStateWriter は書き込む内容をドキュメントごとに溜めておき、永続化が必要な状態遷移の時点で
+WriteBatch の1回の commit にまとめて書き込む（同じドキュメントへの複数の更新は1件の merge set になる）。
+
+使い方:
+    writer = JobStateWriter(db)
+    writer.set(job_ref, {'line_send_failed': True})       # 溜めるだけ
+    writer.set(job_ref, {'status': 'completed'}, durable=True)  # 溜めた内容とまとめて書き込む
+
+AsyncClient の場合は flush_async() を使い（durable=True は使えない）、使い終わったら close_async_client() で閉じる。
+"""
+
+import inspect
+from google.cloud import firestore
+
+
+class JobStateWriter:
+    """ドキュメントごとの merge set を溜めて、WriteBatch で1回にまとめて書き込む"""
+
+    def __init__(self, client):
+        self.client = client
+        # {ドキュメントのパス: (DocumentReference, フィールド)}
+        self._pending = {}
+        self.commits = 0
+
+    def set(self, doc_ref, fields, durable=False):
+        """
+        doc_ref に merge set するフィールドを追加（同じフィールドは後から追加した値で上書き）
+
+        Args:
+            durable: True の場合、溜めた内容とまとめてすぐに書き込む（プロセスが落ちても失われてはいけない状態遷移）
+        """
+        entry = self._pending.get(doc_ref.path)
+        if entry is None:
+            self._pending[doc_ref.path] = (doc_ref, dict(fields))
+        else:
+            entry[1].update(fields)
+        if durable:
+            self.flush()
+
+    @property
+    def pending(self):
+        return bool(self._pending)
+
+    def _batch(self):
+        """溜めた内容の WriteBatch（updated_at を付ける）。溜めた内容は破棄する"""
+        batch = self.client.batch()
+        for doc_ref, fields in self._pending.values():
+            batch.set(doc_ref, {**fields, 'updated_at': firestore.SERVER_TIMESTAMP}, merge=True)
+        self._pending = {}
+        self.commits += 1
+        return batch
+
+    def flush(self):
+        """溜めた内容を1回の commit で書き込む（何も溜まっていなければ何もしない）"""
+        if self._pending:
+            self._batch().commit()
+
+    async def flush_async(self):
+        """flush の AsyncClient 版"""
+        if self._pending:
+            await self._batch().commit()
+
+
+async def close_async_client(client):
+    """
+    firestore.AsyncClient を閉じる（gRPCチャネルを含む）
+
+    AsyncClient.close() が閉じるのはRESTの場合のHTTPセッションだけで、gRPC（aio）のチャネルは開いたまま残る。
+    チャネルはイベントループに紐づくため、ジョブ（asyncio.run）ごとにクライアントを作る場合は、
+    ループを閉じる前にトランスポートも閉じる。一度もリクエストしていなければチャネルは作られていないので何もしない。
+    """
+    closed = client.close()
+    if inspect.isawaitable(closed):
+        await closed
+    api = getattr(client, '_firestore_api_internal', None)
+    transport = getattr(api, 'transport', None)
+    if transport is not None:
+        closed = transport.close()
+        if inspect.isawaitable(closed):
+            await closed
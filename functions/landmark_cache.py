@@ -0,0 +1,193 @@
+"""
+ランドマークキャッシュ（動画の内容ハッシュで検索）
+
+同じ動画が再送された場合（タイムアウト後の再送やLINE側の再配信など）に
+MediaPipeの推論をやり直さないよう、抽出済みのランドマーク配列を保存しておく。
+
+- キー: GCSオブジェクトの内容ハッシュ（md5 / crc32c）+ 解析設定
+- 形式: NumPyの .npz（float32のランドマーク配列とフレーム番号・fps）
+- ローカル: LANDMARK_CACHE_DIR に保存し、LANDMARK_CACHE_MAX_MB を超えたら古い順（LRU）に削除
+- GCS: LANDMARK_CACHE_BUCKET を設定した場合はバケットにも保存し、ローカルにない場合に参照
+
+既定では無効（LANDMARK_CACHE_ENABLED=true で有効にする）。Cloud Run の /tmp はメモリ上のファイルシステムで、
+保存したキャッシュはインスタンスのメモリ上限に含まれ、動画のダウンロードや解析と取り合いになる。
+有効にする場合は、メモリの割り当てに合わせて LANDMARK_CACHE_MAX_MB を決める（deploy.sh ではメモリ2Giに対して64MB）。
+"""
+
+import os
+import io
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LANDMARK_CACHE_ENABLED = os.environ.get('LANDMARK_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+LANDMARK_CACHE_DIR = os.environ.get('LANDMARK_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'landmark_cache'))
+LANDMARK_CACHE_MAX_MB = float(os.environ.get('LANDMARK_CACHE_MAX_MB', '64'))
+LANDMARK_CACHE_BUCKET = os.environ.get('LANDMARK_CACHE_BUCKET', '')  # 空 = ローカルのみ
+LANDMARK_CACHE_PREFIX = os.environ.get('LANDMARK_CACHE_PREFIX', 'landmark_cache/')
+
+# 保存形式を変えた場合はバージョンを上げて古いキャッシュを無効化する
+CACHE_FORMAT_VERSION = 1
+
+_lock = threading.Lock()
+_storage_client = None
+
+
+def _get_bucket():
+    """キャッシュ用バケットを取得（未設定ならNone）"""
+    global _storage_client
+    if not LANDMARK_CACHE_BUCKET:
+        return None
+    if _storage_client is None:
+        from google.cloud import storage
+        _storage_client = storage.Client()
+    return _storage_client.bucket(LANDMARK_CACHE_BUCKET)
+
+
+def make_cache_key(content_hash, settings):
+    """
+    内容ハッシュと解析設定からキャッシュキーを作成
+
+    Args:
+        content_hash: GCSオブジェクトのmd5_hashまたはcrc32c（base64文字列）
+        settings: ランドマークに影響する解析設定（プロファイル・間引き設定など）
+
+    Returns:
+        str: 16進のキャッシュキー
+    """
+    material = json.dumps(
+        {'hash': content_hash, 'settings': settings, 'version': CACHE_FORMAT_VERSION},
+        sort_keys=True
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def _local_path(key):
+    return os.path.join(LANDMARK_CACHE_DIR, f"{key}.npz")
+
+
+def _serialize(landmarks, frame_indices, sample_fps):
+    buf = io.BytesIO()
+    np.savez(
+        buf,
+        landmarks=np.asarray(landmarks, dtype=np.float32),
+        frame_indices=np.asarray(frame_indices, dtype=np.int32),
+        sample_fps=np.float64(sample_fps)
+    )
+    return buf.getvalue()
+
+
+def _deserialize(data):
+    with np.load(io.BytesIO(data)) as npz:
+        return {
+            'landmarks': npz['landmarks'],
+            'frame_indices': npz['frame_indices'],
+            'sample_fps': float(npz['sample_fps'])
+        }
+
+
+def _write_local(key, data):
+    os.makedirs(LANDMARK_CACHE_DIR, exist_ok=True)
+    # 途中で落ちても壊れたファイルが残らないよう、一時ファイルに書いてから置き換える
+    fd, temp_path = tempfile.mkstemp(dir=LANDMARK_CACHE_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, _local_path(key))
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    _evict_local()
+
+
+def _evict_local():
+    """ローカルキャッシュが上限を超えていたら、最終利用が古い順に削除"""
+    budget = LANDMARK_CACHE_MAX_MB * 1024 * 1024
+    with _lock:
+        try:
+            entries = []
+            for name in os.listdir(LANDMARK_CACHE_DIR):
+                if not name.endswith('.npz'):
+                    continue
+                path = os.path.join(LANDMARK_CACHE_DIR, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        except FileNotFoundError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= budget:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+
+def load(key):
+    """
+    キャッシュからランドマークを読み込む
+
+    Returns:
+        dict: landmarks / frame_indices / sample_fps、見つからなければNone
+    """
+    if not LANDMARK_CACHE_ENABLED:
+        return None
+
+    path = _local_path(key)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        # 最終利用時刻を更新（LRU）
+        os.utime(path)
+        return _deserialize(data)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"⚠️ ランドマークキャッシュの読み込みに失敗（破棄します）: {str(e)}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    try:
+        bucket = _get_bucket()
+        if bucket is None:
+            return None
+        blob = bucket.blob(f"{LANDMARK_CACHE_PREFIX}{key}.npz")
+        if not blob.exists():
+            return None
+        data = blob.download_as_bytes()
+        entry = _deserialize(data)
+        _write_local(key, data)
+        return entry
+    except Exception as e:
+        logger.warning(f"⚠️ GCSのランドマークキャッシュ取得に失敗: {str(e)}")
+        return None
+
+
+def store(key, landmarks, frame_indices, sample_fps):
+    """
+    ランドマークをキャッシュに保存（失敗しても解析処理は止めない）
+    """
+    if not LANDMARK_CACHE_ENABLED:
+        return
+
+    try:
+        data = _serialize(landmarks, frame_indices, sample_fps)
+        _write_local(key, data)
+        bucket = _get_bucket()
+        if bucket is not None:
+            bucket.blob(f"{LANDMARK_CACHE_PREFIX}{key}.npz").upload_from_string(
+                data, content_type='application/octet-stream'
+            )
+    except Exception as e:
+        logger.warning(f"⚠️ ランドマークキャッシュの保存に失敗: {str(e)}")
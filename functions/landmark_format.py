@@ -0,0 +1,591 @@
+"""
+ランドマークのバイナリ形式（.lmk）
+
+analyze_video.py が出力していた JSON（フレームごと・点ごとのdict、indent=2）は
+動画が長いと数MBになり、読み込み側のパースにも時間がかかる。
+.lmk は (frames, 33, 4) のfloat32配列をそのまま並べた形式で、
+np.memmap で読み込めばパースせずに配列として扱える。
+
+レイアウト（リトルエンディアン）:
+    ヘッダー 32バイト: magic 'LMK1' / version(uint16) / header_size(uint16) /
+                       frames(uint32) / landmarks(uint16) / dims(uint16) /
+                       fps(float64) / width(uint32) / height(uint32)
+    レコード × frames: frame(int32, 0始まりのフレーム番号) + landmarks(float32 × 33 × 4)
+
+レコードは固定長なので、ヘッダーのフレーム数が未確定でも
+ファイルサイズからフレーム数を求められる（追記しながら書く用途にも使える）。
+
+open_landmark_writer() は1フレームずつ追記するストリーミング出力で、
+.lmk / .lmq / .jsonl（1行1フレーム）/ .json（従来形式）に対応する。
+定期的にフラッシュするため、途中で処理が落ちても .lmk / .lmq / .jsonl はそこまでの分を読める。
+
+.lmq（Web再生用の量子化形式）:
+    ヘッダー 32バイト: magic 'LMQ1' / version(uint16) / header_size(uint16) /
+                       frames(uint32) / landmarks(uint16) / reserved(uint16) /
+                       fps(float32) / width(uint32) / height(uint32) / coord_scale(float32)
+    レコード × frames（234バイト）: 前フレームからのフレーム番号の差(uint16) +
+                       x, y, z を coord_scale 倍して丸めたint16の差分 × 33 +
+                       visibility を255倍して丸めたuint8の差分 × 33 + 詰め物1バイト
+    差分は16bit/8bitで桁あふれさせたまま保存し、復元側も同じ幅の累積和で戻す。
+    隣接フレームの差分は小さい値に偏るため、gzip（.lmq.gz）で大きく縮む。
+    ブラウザ側のデコーダーは src/landmarks.js。
+"""
+
+import os
+import sys
+import gzip
+import json
+import struct
+import numpy as np
+
+# ストリーミング出力でファイルにフラッシュする間隔（フレーム数）
+LANDMARK_FLUSH_FRAMES = int(os.environ.get('LANDMARK_FLUSH_FRAMES', '30'))
+
+MAGIC = b'LMK1'
+FORMAT_VERSION = 1
+HEADER_STRUCT = struct.Struct('<4sHHIHHdII')
+HEADER_SIZE = HEADER_STRUCT.size
+
+# MediaPipe Poseのランドマーク数と1点あたりの値（x, y, z, visibility）
+NUM_LANDMARKS = 33
+LANDMARK_DIMS = 4
+LANDMARK_KEYS = ('x', 'y', 'z', 'visibility')
+
+FRAME_DTYPE = np.dtype([
+    ('frame', '<i4'),
+    ('landmarks', '<f4', (NUM_LANDMARKS, LANDMARK_DIMS)),
+])
+
+# 量子化形式（.lmq）
+QUANT_MAGIC = b'LMQ1'
+QUANT_FORMAT_VERSION = 1
+QUANT_HEADER_STRUCT = struct.Struct('<4sHHIHHfIIf')
+QUANT_HEADER_SIZE = QUANT_HEADER_STRUCT.size
+# 正規化座標1.0あたりの値（±2.0の範囲を約0.00006刻みで表す）
+COORD_SCALE = 16384
+VISIBILITY_SCALE = 255
+QUANT_DTYPE = np.dtype([
+    ('frame_delta', '<u2'),
+    ('coords', '<i2', (NUM_LANDMARKS, 3)),
+    ('visibility', 'u1', (NUM_LANDMARKS,)),
+    ('pad', 'u1'),
+])
+
+
+def landmarks_to_array(landmarks):
+    """MediaPipeのランドマークリスト（33点）を (33, 4) のfloat32配列に変換"""
+    row = np.empty((NUM_LANDMARKS, LANDMARK_DIMS), dtype=np.float32)
+    for i, lm in enumerate(landmarks):
+        row[i, 0] = lm.x
+        row[i, 1] = lm.y
+        row[i, 2] = lm.z
+        row[i, 3] = lm.visibility
+    return row
+
+
+def is_binary_path(path):
+    """出力パスの拡張子がバイナリ形式（.lmk）か"""
+    return os.path.splitext(path)[1].lower() == '.lmk'
+
+
+def is_jsonl_path(path):
+    """出力パスの拡張子がJSON Lines形式（.jsonl）か"""
+    return os.path.splitext(path)[1].lower() == '.jsonl'
+
+
+def is_quantized_path(path):
+    """出力パスの拡張子が量子化形式（.lmq / .lmq.gz）か"""
+    return path.lower().endswith(('.lmq', '.lmq.gz'))
+
+
+def pack_header(frames, fps, width=0, height=0):
+    """ヘッダー32バイトを作成"""
+    return HEADER_STRUCT.pack(
+        MAGIC, FORMAT_VERSION, HEADER_SIZE, frames,
+        NUM_LANDMARKS, LANDMARK_DIMS, float(fps or 0), int(width), int(height)
+    )
+
+
+def unpack_header(data):
+    """
+    ヘッダーを解析
+
+    Raises:
+        ValueError: .lmk形式でない、または対応していないバージョンの場合
+    """
+    if len(data) < HEADER_SIZE:
+        raise ValueError('landmark file is truncated')
+    magic, version, header_size, frames, landmarks, dims, fps, width, height = HEADER_STRUCT.unpack(data[:HEADER_SIZE])
+    if magic != MAGIC:
+        raise ValueError('not a landmark file')
+    if version != FORMAT_VERSION or landmarks != NUM_LANDMARKS or dims != LANDMARK_DIMS:
+        raise ValueError(f"unsupported landmark file: version={version} shape=({landmarks}, {dims})")
+    return {
+        'header_size': header_size,
+        'frames': frames,
+        'fps': fps,
+        'width': width,
+        'height': height,
+    }
+
+
+def write_landmarks(path, landmarks, frame_indices, fps, width=0, height=0):
+    """
+    ランドマーク配列を .lmk 形式で書き出す
+
+    Args:
+        path: 出力パス
+        landmarks: (frames, 33, 4) の配列
+        frame_indices: 各行に対応する0始まりのフレーム番号
+        fps: 元動画のfps
+        width / height: 元動画の解像度（正規化座標を画素に戻す場合に使用）
+    """
+    landmarks = np.asarray(landmarks, dtype=np.float32).reshape(-1, NUM_LANDMARKS, LANDMARK_DIMS)
+    records = np.empty(landmarks.shape[0], dtype=FRAME_DTYPE)
+    records['frame'] = frame_indices
+    records['landmarks'] = landmarks
+    with open(path, 'wb') as f:
+        f.write(pack_header(records.shape[0], fps, width, height))
+        f.write(records.tobytes())
+
+
+def load_landmarks(path, mmap=True):
+    """
+    .lmk ファイルを読み込む
+
+    Args:
+        path: .lmk ファイルのパス
+        mmap: Trueの場合は np.memmap で読み込む（必要な部分だけがディスクから読まれる）
+
+    Returns:
+        dict: landmarks (frames, 33, 4) / frame_indices / fps / width / height
+              末尾に書きかけのレコードがある場合は、完全なレコードまでを返す
+    """
+    with open(path, 'rb') as f:
+        header = unpack_header(f.read(HEADER_SIZE))
+    size = os.path.getsize(path)
+    frames = max(0, (size - header['header_size']) // FRAME_DTYPE.itemsize)
+
+    if frames == 0:
+        records = np.empty(0, dtype=FRAME_DTYPE)
+    elif mmap:
+        records = np.memmap(path, dtype=FRAME_DTYPE, mode='r', offset=header['header_size'], shape=(frames,))
+    else:
+        records = np.fromfile(path, dtype=FRAME_DTYPE, count=frames, offset=header['header_size'])
+
+    return {
+        'landmarks': records['landmarks'],
+        'frame_indices': records['frame'],
+        'fps': header['fps'],
+        'width': header['width'],
+        'height': header['height'],
+    }
+
+
+def _json_frame(frame_index, points):
+    return {
+        'frame': frame_index + 1,
+        'landmarks': [dict(zip(LANDMARK_KEYS, point)) for point in points],
+    }
+
+
+def to_json_frames(landmarks, frame_indices):
+    """
+    従来の landmarks.json と同じ形のリストに変換
+
+    Returns:
+        list: [{'frame': 1始まりのフレーム番号, 'landmarks': [{'x', 'y', 'z', 'visibility'}, ...]}, ...]
+    """
+    return [
+        _json_frame(frame_index, row)
+        for frame_index, row in zip(np.asarray(frame_indices).tolist(), np.asarray(landmarks).tolist())
+    ]
+
+
+def load_jsonl(path):
+    """
+    .jsonl ファイル（1行目がメタデータ、2行目以降が1行1フレーム）を読み込む
+
+    Returns:
+        dict: load_landmarks と同じ形。書きかけの最終行は無視する
+    """
+    meta = {}
+    landmarks = []
+    frame_indices = []
+    with open(path) as f:
+        for number, line in enumerate(f):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if number == 0 and 'frame' not in record:
+                meta = record
+                continue
+            landmarks.append([[point[key] for key in LANDMARK_KEYS] for point in record['landmarks']])
+            frame_indices.append(record['frame'] - 1)
+    return {
+        'landmarks': np.array(landmarks, dtype=np.float32).reshape(-1, NUM_LANDMARKS, LANDMARK_DIMS),
+        'frame_indices': np.array(frame_indices, dtype=np.int32),
+        'fps': meta.get('fps', 0.0),
+        'width': meta.get('width', 0),
+        'height': meta.get('height', 0),
+    }
+
+
+class BinaryLandmarkWriter:
+    """
+    .lmk ファイルに1フレームずつ追記するライター
+
+    flush_every フレーム分のレコードだけを確保して使い回すため、メモリ使用量は動画の長さによらない。
+    close() でヘッダーのフレーム数を確定させる（閉じられなかった場合もファイルサイズから読める）。
+    """
+
+    def __init__(self, path, fps, width=0, height=0, flush_every=None):
+        self.path = path
+        self.frames = 0
+        self._records = np.empty(max(1, flush_every or LANDMARK_FLUSH_FRAMES), dtype=FRAME_DTYPE)
+        self._pending = 0
+        self._header = (fps, width, height)
+        self._file = open(path, 'wb')
+        self._file.write(pack_header(0, fps, width, height))
+
+    def append(self, landmarks, frame_index):
+        """MediaPipeのランドマークリスト（33点）を1フレームとして追加"""
+        row = self._records[self._pending]['landmarks']
+        for i, lm in enumerate(landmarks):
+            row[i] = (lm.x, lm.y, lm.z, lm.visibility)
+        self._commit(frame_index)
+
+    def append_points(self, points, frame_index):
+        """(33, 4) の配列を1フレームとして追加"""
+        self._records[self._pending]['landmarks'] = points
+        self._commit(frame_index)
+
+    def _commit(self, frame_index):
+        self._records[self._pending]['frame'] = frame_index
+        self._pending += 1
+        self.frames += 1
+        if self._pending == self._records.shape[0]:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self._file.write(self._records[:self._pending].tobytes())
+            self._pending = 0
+        self._file.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        fps, width, height = self._header
+        self._file.seek(0)
+        self._file.write(pack_header(self.frames, fps, width, height))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class JsonLinesLandmarkWriter:
+    """
+    .jsonl ファイルに1行1フレームで追記するライター
+
+    1行目はメタデータ（fps / width / height）、2行目以降は従来形式の1フレーム分のdict。
+    """
+
+    def __init__(self, path, fps, width=0, height=0, flush_every=None):
+        self.path = path
+        self.frames = 0
+        self._flush_every = max(1, flush_every or LANDMARK_FLUSH_FRAMES)
+        self._file = open(path, 'w')
+        self._file.write(json.dumps({'fps': fps, 'width': width, 'height': height}) + '\n')
+
+    def _write_frame(self, frame):
+        self._file.write(json.dumps(frame, separators=(',', ':')) + '\n')
+
+    def append(self, landmarks, frame_index):
+        """MediaPipeのランドマークリスト（33点）を1フレームとして追加"""
+        self.append_points([(lm.x, lm.y, lm.z, lm.visibility) for lm in landmarks], frame_index)
+
+    def append_points(self, points, frame_index):
+        """(33, 4) の配列を1フレームとして追加"""
+        self._write_frame(_json_frame(frame_index, np.asarray(points).tolist()))
+        self.frames += 1
+        if self.frames % self._flush_every == 0:
+            self._file.flush()
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class JsonLandmarkWriter(JsonLinesLandmarkWriter):
+    """
+    従来形式の landmarks.json（indent=2 の配列）を1フレームずつ書き出すライター
+
+    json.dump(frames, f, indent=2) と同じバイト列になる。配列が閉じるまではJSONとして読めないため、
+    途中結果を使いたい場合は .jsonl か .lmk を使う。
+    """
+
+    def __init__(self, path, fps, width=0, height=0, flush_every=None):
+        self.path = path
+        self.frames = 0
+        self._flush_every = max(1, flush_every or LANDMARK_FLUSH_FRAMES)
+        self._file = open(path, 'w')
+        self._file.write('[')
+
+    def _write_frame(self, frame):
+        separator = ',\n  ' if self.frames else '\n  '
+        self._file.write(separator + json.dumps(frame, indent=2).replace('\n', '\n  '))
+
+    def close(self):
+        if not self._file.closed:
+            self._file.write('\n]' if self.frames else ']')
+            self._file.close()
+
+
+def quantize(landmarks):
+    """
+    (frames, 33, 4) のランドマークを量子化
+
+    Returns:
+        tuple: (座標 int16 (frames, 33, 3), visibility uint8 (frames, 33))
+    """
+    landmarks = np.asarray(landmarks, dtype=np.float32).reshape(-1, NUM_LANDMARKS, LANDMARK_DIMS)
+    coords = np.clip(np.rint(landmarks[..., :3] * COORD_SCALE), -32768, 32767).astype(np.int16)
+    visibility = np.clip(np.rint(landmarks[..., 3] * VISIBILITY_SCALE), 0, 255).astype(np.uint8)
+    return coords, visibility
+
+
+def pack_quantized_header(frames, fps, width=0, height=0):
+    """量子化形式のヘッダー32バイトを作成"""
+    return QUANT_HEADER_STRUCT.pack(
+        QUANT_MAGIC, QUANT_FORMAT_VERSION, QUANT_HEADER_SIZE, frames,
+        NUM_LANDMARKS, 0, float(fps or 0), int(width), int(height), float(COORD_SCALE)
+    )
+
+
+def _frame_deltas(frame_indices, previous=0):
+    deltas = np.diff(np.asarray(frame_indices, dtype=np.int64), prepend=previous)
+    if deltas.size and (deltas.min() < 0 or deltas.max() > 0xFFFF):
+        raise ValueError('frame indices must be increasing with gaps below 65536')
+    return deltas.astype(np.uint16)
+
+
+def encode_quantized(landmarks, frame_indices, fps, width=0, height=0):
+    """
+    ランドマーク配列を量子化・差分化した .lmq 形式のバイト列に変換
+
+    Returns:
+        bytes: ヘッダーとレコード（gzipはかけない）
+    """
+    coords, visibility = quantize(landmarks)
+    records = np.zeros(coords.shape[0], dtype=QUANT_DTYPE)
+    records['frame_delta'] = _frame_deltas(frame_indices)
+    # 16bit/8bitの桁あふれをそのまま残す（復元時の累積和で元に戻る）
+    records['coords'] = np.diff(coords, axis=0, prepend=np.zeros((1, NUM_LANDMARKS, 3), dtype=np.int16))
+    records['visibility'] = np.diff(visibility, axis=0, prepend=np.zeros((1, NUM_LANDMARKS), dtype=np.uint8))
+    return pack_quantized_header(records.shape[0], fps, width, height) + records.tobytes()
+
+
+def decode_quantized(data):
+    """
+    .lmq 形式のバイト列を復元（gzip圧縮されていれば展開する）
+
+    Returns:
+        dict: load_landmarks と同じ形。書きかけの末尾レコードは無視する
+    """
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+    if len(data) < QUANT_HEADER_SIZE:
+        raise ValueError('landmark file is truncated')
+    magic, version, header_size, _, landmarks, _, fps, width, height, scale = QUANT_HEADER_STRUCT.unpack(
+        data[:QUANT_HEADER_SIZE]
+    )
+    if magic != QUANT_MAGIC:
+        raise ValueError('not a quantized landmark file')
+    if version != QUANT_FORMAT_VERSION or landmarks != NUM_LANDMARKS:
+        raise ValueError(f"unsupported quantized landmark file: version={version} landmarks={landmarks}")
+
+    frames = max(0, (len(data) - header_size) // QUANT_DTYPE.itemsize)
+    records = np.frombuffer(data, dtype=QUANT_DTYPE, count=frames, offset=header_size)
+    coords = np.cumsum(records['coords'], axis=0, dtype=np.int16)
+    visibility = np.cumsum(records['visibility'], axis=0, dtype=np.uint8)
+    result = np.empty((frames, NUM_LANDMARKS, LANDMARK_DIMS), dtype=np.float32)
+    result[..., :3] = coords / np.float32(scale)
+    result[..., 3] = visibility / np.float32(VISIBILITY_SCALE)
+    return {
+        'landmarks': result,
+        'frame_indices': np.cumsum(records['frame_delta'], dtype=np.int64).astype(np.int32),
+        'fps': float(fps),
+        'width': width,
+        'height': height,
+    }
+
+
+def load_quantized(path):
+    """.lmq / .lmq.gz ファイルを読み込む"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if path.lower().endswith('.gz'):
+        # 書きかけのgzipでも、フラッシュ済みの部分までは展開する
+        decompressor = gzip.zlib.decompressobj(16 + gzip.zlib.MAX_WBITS)
+        data = decompressor.decompress(data)
+    return decode_quantized(data)
+
+
+class QuantizedLandmarkWriter:
+    """
+    .lmq / .lmq.gz ファイルに1フレームずつ追記するライター
+
+    直前フレームの量子化値だけを保持して差分を書くため、メモリ使用量は動画の長さによらない。
+    .gz の場合はフラッシュごとに同期フラッシュするため、途中までのファイルも展開できる。
+    """
+
+    def __init__(self, path, fps, width=0, height=0, flush_every=None):
+        self.path = path
+        self.frames = 0
+        self._records = np.zeros(max(1, flush_every or LANDMARK_FLUSH_FRAMES), dtype=QUANT_DTYPE)
+        self._pending = 0
+        self._header = (fps, width, height)
+        self._previous_frame = 0
+        self._previous_coords = np.zeros((NUM_LANDMARKS, 3), dtype=np.int16)
+        self._previous_visibility = np.zeros(NUM_LANDMARKS, dtype=np.uint8)
+        self._compressed = path.lower().endswith('.gz')
+        self._file = gzip.open(path, 'wb') if self._compressed else open(path, 'wb')
+        self._file.write(pack_quantized_header(0, fps, width, height))
+        self._points = np.zeros((NUM_LANDMARKS, LANDMARK_DIMS), dtype=np.float32)
+
+    def append(self, landmarks, frame_index):
+        """MediaPipeのランドマークリスト（33点）を1フレームとして追加"""
+        for i, lm in enumerate(landmarks):
+            self._points[i] = (lm.x, lm.y, lm.z, lm.visibility)
+        self.append_points(self._points, frame_index)
+
+    def append_points(self, points, frame_index):
+        """(33, 4) の配列を1フレームとして追加"""
+        coords, visibility = quantize(points)
+        record = self._records[self._pending]
+        record['frame_delta'] = _frame_deltas([frame_index], self._previous_frame)[0]
+        record['coords'] = coords[0] - self._previous_coords
+        record['visibility'] = visibility[0] - self._previous_visibility
+        self._previous_frame = frame_index
+        self._previous_coords = coords[0]
+        self._previous_visibility = visibility[0]
+        self._pending += 1
+        self.frames += 1
+        if self._pending == self._records.shape[0]:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self._file.write(self._records[:self._pending].tobytes())
+            self._pending = 0
+        if self._compressed:
+            self._file.flush(gzip.zlib.Z_SYNC_FLUSH)
+        else:
+            self._file.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        if not self._compressed:
+            # ヘッダーのフレーム数を確定（gzipは書き戻せないため、読み込み側はデータ長から求める）
+            fps, width, height = self._header
+            self._file.seek(0)
+            self._file.write(pack_quantized_header(self.frames, fps, width, height))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_landmark_writer(path, fps, width=0, height=0, flush_every=None):
+    """
+    出力パスの拡張子に応じたストリーミングライターを作成
+
+    Returns:
+        .lmk → BinaryLandmarkWriter / .lmq(.gz) → QuantizedLandmarkWriter /
+        .jsonl → JsonLinesLandmarkWriter / それ以外 → JsonLandmarkWriter
+    """
+    if is_binary_path(path):
+        return BinaryLandmarkWriter(path, fps, width, height, flush_every)
+    if is_quantized_path(path):
+        return QuantizedLandmarkWriter(path, fps, width, height, flush_every)
+    if is_jsonl_path(path):
+        return JsonLinesLandmarkWriter(path, fps, width, height, flush_every)
+    return JsonLandmarkWriter(path, fps, width, height, flush_every)
+
+
+def read_landmark_file(path, fps=0, width=0, height=0):
+    """
+    拡張子に応じてランドマークファイルを読み込む
+
+    Args:
+        path: .lmk / .lmq(.gz) / .jsonl / .json ファイル
+        fps / width / height: 従来形式のJSONには含まれないため、その場合に使う値
+
+    Returns:
+        dict: landmarks / frame_indices / fps / width / height
+    """
+    if is_binary_path(path):
+        return load_landmarks(path)
+    if is_quantized_path(path):
+        return load_quantized(path)
+    if is_jsonl_path(path):
+        return load_jsonl(path)
+    with open(path) as f:
+        frames = json.load(f)
+    landmarks = np.array(
+        [[[point[key] for key in LANDMARK_KEYS] for point in frame['landmarks']] for frame in frames],
+        dtype=np.float32
+    ).reshape(-1, NUM_LANDMARKS, LANDMARK_DIMS)
+    frame_indices = np.array([frame['frame'] - 1 for frame in frames], dtype=np.int32)
+    return {'landmarks': landmarks, 'frame_indices': frame_indices, 'fps': fps, 'width': width, 'height': height}
+
+
+def write_landmark_file(path, data):
+    """read_landmark_file の結果を、拡張子に応じた形式で書き出す"""
+    with open_landmark_writer(path, data['fps'], data['width'], data['height']) as writer:
+        for frame_index, points in zip(np.asarray(data['frame_indices']).tolist(), data['landmarks']):
+            writer.append_points(points, frame_index)
+
+
+def convert_to_json(binary_path, json_path, indent=2):
+    """.lmk / .lmq / .jsonl ファイルを従来形式のJSONに変換"""
+    data = read_landmark_file(binary_path)
+    with open(json_path, 'w') as f:
+        json.dump(to_json_frames(data['landmarks'], data['frame_indices']), f, indent=indent)
+
+
+def convert_from_json(json_path, binary_path, fps=0, width=0, height=0):
+    """従来形式のJSONを .lmk / .lmq ファイルに変換（JSONにはfpsが含まれないため引数で指定）"""
+    write_landmark_file(binary_path, read_landmark_file(json_path, fps, width, height))
+
+
+if __name__ == '__main__':
+    # 使い方: python functions/landmark_format.py 入力 出力 [fps]
+    # 形式は拡張子で判定（.lmk / .lmq / .lmq.gz / .jsonl / .json）
+    if len(sys.argv) < 3:
+        print("使い方: python landmark_format.py <input> <output> [fps]（.lmk / .lmq / .lmq.gz / .jsonl / .json）", file=sys.stderr)
+        sys.exit(1)
+    source, destination = sys.argv[1], sys.argv[2]
+    write_landmark_file(destination, read_landmark_file(source, fps=float(sys.argv[3]) if len(sys.argv) > 3 else 0))
+    print(f"{source} を {destination} に変換しました。")
@@ -13,6 +13,7 @@ Cloud Functions: 動画解析 + Dify + LINE連携（要塞化版）
 
 import os
 import json
+import asyncio
 import tempfile
 import base64
 import requests
@@ -20,13 +21,22 @@ import logging
 import hashlib
 import traceback
 import time
+import threading
 import cv2
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from google.cloud import storage, firestore
 from google.cloud.secretmanager_v1 import SecretManagerServiceClient
+from google.api_core.exceptions import NotFound
 from tenacity import retry, stop_after_attempt, wait_exponential, RetryError
 from analyze import analyze_kickboxing_form
 from rate_limiter import check_rate_limit
+from video_stream import VIDEO_STREAMING_INGEST, BlobFifoStream
+from video_probe import probe_blob
+from stage_timer import StageTimer
+import http_client
+from secret_cache import SecretCache
+from job_state import JobStateWriter, close_async_client
+from job_queue import VIDEO_QUEUE_MODE, VIDEO_QUEUE_WORKERS, VIDEO_QUEUE_LEASE_SECONDS, QueueWorkerPool, get_queue
 # gcloud_authはCloud Run環境では不要（デフォルト認証を使用）
 # from gcloud_auth import (
 #     get_storage_client_with_auth,
@@ -108,10 +118,52 @@ def access_secret_version(secret_id, project_id, version_id="prod"):
         logger.error(f"Secret Manager読み込みエラー ({secret_id}, version={version_id}): {str(e)}")
         raise
 
+
+def _fetch_secret_with_fallback(secret_id):
+    """Secret Managerから prod → latest の順に試行してシークレットを取得（取得できなければ例外）"""
+    for version_id in ["prod", "latest"]:
+        try:
+            value = access_secret_version(secret_id, PROJECT_ID, version_id=version_id).strip()
+            if value:
+                logger.info(f"✅ {secret_id}取得成功（エイリアス/バージョン: {version_id}）")
+                return value
+        except Exception as e:
+            logger.warning(f"⚠️ エイリアス/バージョン{version_id}の取得に失敗: {str(e)}")
+            continue
+    raise RuntimeError(f"{secret_id} could not be loaded from Secret Manager")
+
+
+# Secret Managerの値のプロセス内キャッシュ（LINE送信のたびにSecret Managerを呼ばない）
+_secret_cache = SecretCache(_fetch_secret_with_fallback)
+
+
+def get_line_channel_access_token():
+    """LINEアクセストークン（キャッシュ済みの値）。取得できなければNone"""
+    try:
+        return _secret_cache.get("LINE_CHANNEL_ACCESS_TOKEN")
+    except Exception as e:
+        logger.error(f"❌ LINEアクセストークンの取得エラー: {str(e)}")
+        return None
+
+
+def invalidate_line_channel_access_token():
+    """LINE APIが401を返した場合に呼び、次の送信でSecret Managerから取得し直す"""
+    _secret_cache.invalidate("LINE_CHANNEL_ACCESS_TOKEN")
+
 # --- Load Secrets at Runtime ---
 # プロジェクトIDを環境変数から取得（Cloud Run環境では自動設定される）
 PROJECT_ID = os.environ.get('GOOGLE_CLOUD_PROJECT') or os.environ.get('GCP_PROJECT') or 'aikaapp-584fa'
 
+# 動画の制限（ファイルサイズ・長さ）
+MAX_VIDEO_SIZE_BYTES = 100 * 1024 * 1024  # 100MB
+MAX_VIDEO_DURATION_SECONDS = 20
+
+# 解析後の通知処理（Dify・LINE・Firestore）
+# PROCESS_VIDEO_ASYNC_NOTIFY: true の場合、asyncioで依存関係のない処理を重ねて実行する（deliver_results_async）
+# LINE_MAX_ATTEMPTS: LINE送信の最大試行回数
+PROCESS_VIDEO_ASYNC_NOTIFY = os.environ.get('PROCESS_VIDEO_ASYNC_NOTIFY', 'false').lower() in ('1', 'true', 'yes')
+LINE_MAX_ATTEMPTS = 5
+
 # --- ASCIIサニタイズ関数（ヘッダー衛生管理）---
 def sanitize_api_key(api_key):
     """
@@ -208,7 +260,18 @@ else:
 
 
 # --- AIKA返答整形関数 ---
-def format_aika_response(raw_message, scores, user_id):
+def get_user_gender(user_id):
+    """user_profiles からユーザーの性別を取得（取得できなければ 'unknown'）"""
+    try:
+        user_profile = get_firestore_client().collection('user_profiles').document(user_id).get()
+        if user_profile.exists:
+            return user_profile.to_dict().get('gender', 'unknown')
+    except:
+        pass
+    return 'unknown'
+
+
+def format_aika_response(raw_message, scores, user_id, user_gender=None):
     """
     Difyの返答をツンデレ口調で整形
     - 簡潔化・重複除去
@@ -217,17 +280,12 @@ def format_aika_response(raw_message, scores, user_id):
     - 改善点・励ましの言葉を追加
     - 男性に厳しく、女性に優しく
     - ジムへの動線を追加
+    
+    user_gender を渡した場合は user_profiles を読まずにその値を使う（先読み済みの場合）
     """
     try:
-        # ユーザーの性別を取得（デフォルトは不明）
-        db = get_firestore_client()
-        user_gender = 'unknown'
-        try:
-            user_profile = db.collection('user_profiles').document(user_id).get()
-            if user_profile.exists:
-                user_gender = user_profile.to_dict().get('gender', 'unknown')
-        except:
-            pass
+        if user_gender is None:
+            user_gender = get_user_gender(user_id)
         
         # 総合戦闘力を計算
         total_power = (
@@ -316,7 +374,7 @@ def format_aika_response(raw_message, scores, user_id):
         return raw_message
 
 # --- MCP連携関数 ---
-def call_dify_via_mcp(scores, user_id):
+def call_dify_via_mcp(scores, user_id, format_message=True):
     """
     MCPスタイルでDify APIを呼び出してAIKAのセリフを生成
     
@@ -326,6 +384,8 @@ def call_dify_via_mcp(scores, user_id):
     Args:
         scores: 解析スコア（dict）
         user_id: ユーザーID
+        format_message: Falseの場合は format_aika_response で整形せず、Difyの返答（またはフォールバック文）をそのまま返す
+                        （呼び出し側で先読みした性別を使って整形する場合）
     
     Returns:
         str: AIKAのセリフ、エラーの場合はNone
@@ -436,14 +496,13 @@ def call_dify_via_mcp(scores, user_id):
                         logger.error(f"❌ [診断] ヘッダー '{k}' に非ASCII文字検出: {invalid_chars}")
                         raise ValueError(f'Header {k} contains non-ASCII characters')
                 
-                # requests.postをjson=payloadで使用（latin-1対策）
+                # http_client.post（共有のkeep-alive接続）をjson=payloadで使用（latin-1対策）
                 # ヘッダーはASCIIのみ、json=payloadで自動的にContent-Typeが設定される
                 logger.info(f"🔍 [診断] リクエスト送信: url={api_url}, headers={list(headers.keys())}")
-                response = requests.post(
+                response = http_client.post(
                     api_url,
                     headers=headers,
-                    json=payload,
-                    timeout=30
+                    json=payload
                 )
                 logger.info(f"🔍 [診断] レスポンス受信: status={response.status_code}")
                 
@@ -548,8 +607,14 @@ def call_dify_via_mcp(scores, user_id):
             # フォールバック: スコアから直接メッセージを生成
             logger.info("📝 フォールバック: スコアから直接メッセージを生成します")
             fallback_message = f"動画を解析したわ。スコア: パンチ{scores.get('punch_speed', 0):.0f}、ガード{scores.get('guard_stability', 0):.0f}、キック{scores.get('kick_height', 0):.0f}、体幹{scores.get('core_rotation', 0):.0f}。"
+            if not format_message:
+                return fallback_message
             return format_aika_response(fallback_message, scores, user_id)
         
+        if not format_message:
+            logger.info(f"✅ Dify MCP成功: {raw_message[:50]}...")
+            return raw_message
+        
         # Difyの返答を整形（ツンデレ口調、簡潔化、戦闘力明示など）
         formatted_message = format_aika_response(raw_message, scores, user_id)
         
@@ -584,22 +649,8 @@ def send_line_message_simple(user_id, message):
         bool: 成功した場合True、失敗した場合False（例外は発生させない）
     """
     try:
-        # Secret ManagerからLINEアクセストークンを取得（prodエイリアスを使用）
-        # フォールバックとしてlatestも試行
-        LINE_CHANNEL_ACCESS_TOKEN = None
-        for version_id in ["prod", "latest"]:
-            try:
-                LINE_CHANNEL_ACCESS_TOKEN = access_secret_version(
-                    "LINE_CHANNEL_ACCESS_TOKEN",
-                    PROJECT_ID,
-                    version_id=version_id
-                ).strip()
-                if LINE_CHANNEL_ACCESS_TOKEN:
-                    logger.info(f"✅ LINEアクセストークン取得成功（エイリアス/バージョン: {version_id}）")
-                    break
-            except Exception as e:
-                logger.warning(f"⚠️ エイリアス/バージョン{version_id}の取得に失敗: {str(e)}")
-                continue
+        # LINEアクセストークンを取得（プロセス内キャッシュ、なければSecret Managerから prod → latest の順に試行）
+        LINE_CHANNEL_ACCESS_TOKEN = get_line_channel_access_token()
         
         if not LINE_CHANNEL_ACCESS_TOKEN:
             logger.error("❌ LINEアクセストークンが取得できませんでした（全バージョン試行済み）")
@@ -629,13 +680,16 @@ def send_line_message_simple(user_id, message):
             ]
         }
         
-        response = requests.post(url, headers=headers, json=data, timeout=30)
+        response = http_client.post(url, headers=headers, json=data)
         response.raise_for_status()
         logger.info(f"✅ LINEメッセージ送信成功: {user_id}")
         return True
         
     except Exception as e:
         logger.error(f"❌ LINEメッセージ送信エラー: {str(e)}")
+        if isinstance(e, requests.exceptions.HTTPError) and e.response is not None and e.response.status_code == 401:
+            # ローテーションされた可能性があるため、キャッシュを破棄して次の送信で取得し直す
+            invalidate_line_channel_access_token()
         return False
 
 
@@ -644,7 +698,7 @@ def send_line_message_simple(user_id, message):
     wait=wait_exponential(multiplier=1, min=4, max=10),
     reraise=True
 )
-def send_line_message_with_retry(user_id, message, unique_id):
+def send_line_message_with_retry(user_id, message, unique_id, track_notification=True):
     """
     LINE Messaging APIでメッセージを送信（指数関数的バックオフ・リトライ付き）
     
@@ -657,27 +711,15 @@ def send_line_message_with_retry(user_id, message, unique_id):
         user_id: ユーザーID
         message: 送信するメッセージ
         unique_id: 冪等性確保のためのユニークID
+        track_notification: Falseの場合は通知済みフラグの確認・設定を行わない
+                            （呼び出し側で先読みし、結果の書き込みとまとめて設定する場合）
     
     Returns:
         bool: 成功した場合True
     """
     try:
-        # Secret ManagerからLINEアクセストークンを取得（prodエイリアスを使用）
-        # フォールバックとしてlatestも試行
-        LINE_CHANNEL_ACCESS_TOKEN = None
-        for version_id in ["prod", "latest"]:
-            try:
-                LINE_CHANNEL_ACCESS_TOKEN = access_secret_version(
-                    "LINE_CHANNEL_ACCESS_TOKEN",
-                    PROJECT_ID,
-                    version_id=version_id
-                ).strip()
-                if LINE_CHANNEL_ACCESS_TOKEN:
-                    logger.info(f"✅ LINEアクセストークン取得成功（エイリアス/バージョン: {version_id}）")
-                    break
-            except Exception as e:
-                logger.warning(f"⚠️ エイリアス/バージョン{version_id}の取得に失敗: {str(e)}")
-                continue
+        # LINEアクセストークンを取得（プロセス内キャッシュ、なければSecret Managerから prod → latest の順に試行）
+        LINE_CHANNEL_ACCESS_TOKEN = get_line_channel_access_token()
         
         if not LINE_CHANNEL_ACCESS_TOKEN:
             logger.error("❌ LINEアクセストークンが取得できませんでした（全バージョン試行済み）")
@@ -689,8 +731,8 @@ def send_line_message_with_retry(user_id, message, unique_id):
         
         # 【冪等性確保】既に通知済みかチェック
         db = get_firestore_client()
-        notification_doc = db.collection('video_jobs').document(unique_id).get()
-        if notification_doc.exists:
+        notification_doc = db.collection('video_jobs').document(unique_id).get() if track_notification else None
+        if notification_doc is not None and notification_doc.exists:
             notification_data = notification_doc.to_dict()
             if notification_data.get('notification_sent', False):
                 logger.info(f"⏭️ 既に通知済み: {unique_id}")
@@ -716,16 +758,16 @@ def send_line_message_with_retry(user_id, message, unique_id):
             ]
         }
         
-        response = requests.post(url, headers=headers, json=data, timeout=30)
+        response = http_client.post(url, headers=headers, json=data)
         response.raise_for_status()
         
         # 【冪等性確保】通知済みフラグを設定
-        db = get_firestore_client()
-        db.collection('video_jobs').document(unique_id).update({
-            'notification_sent': True,
-            'notification_sent_at': firestore.SERVER_TIMESTAMP,
-            'updated_at': firestore.SERVER_TIMESTAMP
-        })
+        if track_notification:
+            db.collection('video_jobs').document(unique_id).update({
+                'notification_sent': True,
+                'notification_sent_at': firestore.SERVER_TIMESTAMP,
+                'updated_at': firestore.SERVER_TIMESTAMP
+            })
         
         logger.info(f"✅ LINEメッセージ送信成功: {user_id}")
         return True
@@ -733,6 +775,8 @@ def send_line_message_with_retry(user_id, message, unique_id):
     except requests.exceptions.HTTPError as e:
         if e.response.status_code == 401:
             logger.error(f"❌ LINE認証エラー（401）: トークンが無効です")
+            # ローテーションされた可能性があるため、キャッシュを破棄して次の試行で取得し直す
+            invalidate_line_channel_access_token()
         elif e.response.status_code == 400:
             logger.error(f"❌ LINEリクエストエラー（400）: {e.response.text}")
         else:
@@ -758,6 +802,227 @@ def send_line_message_with_retry(user_id, message, unique_id):
         raise
 
 
+def deliver_line_message(user_id, message, unique_id, track_notification=True):
+    """
+    LINEでメッセージを送信（最初はリトライ版、失敗したら簡易版で最大 LINE_MAX_ATTEMPTS 回まで試行）
+    
+    Args:
+        user_id: LINEユーザーID
+        message: 送信するメッセージ
+        unique_id: 冪等性確保のためのユニークID
+        track_notification: send_line_message_with_retry に渡す（通知済みフラグの確認・設定を行うか）
+    
+    Returns:
+        bool: 送信できた場合True
+    """
+    for line_attempt in range(1, LINE_MAX_ATTEMPTS + 1):
+        try:
+            if line_attempt == 1:
+                # 最初はリトライ版を試行
+                send_line_message_with_retry(user_id, message, unique_id, track_notification)
+                logger.info(f"✅ LINE送信成功（リトライ版）: user_id={user_id}")
+                return True
+            else:
+                # 2回目以降は簡易版を試行
+                if send_line_message_simple(user_id, message):
+                    logger.info(f"✅ LINE送信成功（簡易版・試行{line_attempt}回目）: user_id={user_id}")
+                    return True
+                else:
+                    logger.warning(f"⚠️ LINE送信失敗（簡易版・試行{line_attempt}回目）")
+                    if line_attempt < LINE_MAX_ATTEMPTS:
+                        time.sleep(2 * line_attempt)  # 指数バックオフ
+                    continue
+        except Exception as send_error:
+            logger.error(f"❌ LINE送信エラー（試行{line_attempt}回目）: {str(send_error)}")
+            if line_attempt < LINE_MAX_ATTEMPTS:
+                time.sleep(2 * line_attempt)  # 指数バックオフ
+                continue
+            else:
+                logger.error(f"❌ LINE送信が全て失敗しました（{LINE_MAX_ATTEMPTS}回試行）")
+    return False
+
+
+def deliver_results(processing_doc_ref, unique_id, user_id, scores, timer):
+    """
+    解析結果からAIKAのセリフを生成し、LINEで送信してFirestoreに保存（順次実行）
+    
+    Args:
+        processing_doc_ref: ジョブのFirestoreドキュメント
+        unique_id: 冪等性確保のためのユニークID
+        user_id: LINEユーザーID
+        scores: 解析スコア
+        timer: 工程ごとの所要時間を記録する StageTimer
+    """
+    # 5. MCPスタイルでDify APIに送信してAIKAのセリフを生成
+    logger.info(f"📁 Dify API呼び出し開始: user_id={user_id}")
+    with timer.stage('dify'):
+        aika_message = call_dify_via_mcp(scores, user_id)
+    
+    if not aika_message:
+        logger.warning("⚠️ Dify MCPからメッセージが取得できませんでした")
+        # デフォルトメッセージを使用（整形関数を通す）
+        aika_message = format_aika_response("動画を解析しました。", scores, user_id)
+    
+    # 整形済みメッセージをそのまま使用（既にformat_aika_responseで整形済み）
+    full_message = aika_message
+    
+    # 送信失敗・完了は、送信後にまとめて1回で書き込む（通知済みフラグだけは送信直後に書き込む）
+    db = get_firestore_client()
+    notification_ref = db.collection('video_jobs').document(unique_id)
+    writer = JobStateWriter(db)
+    
+    # 6. LINE Messaging APIでユーザーに送信（指数関数的バックオフ・リトライ付き）
+    # 【冪等性確保】既に通知済みかチェック（フラグの設定は下の書き込みで行う）
+    with timer.stage('firestore'):
+        try:
+            notification_doc = notification_ref.get()
+            notified = notification_doc.exists and notification_doc.to_dict().get('notification_sent', False)
+        except Exception as e:
+            logger.warning(f"⚠️ 通知済みフラグの取得に失敗しました: {str(e)}")
+            notified = False
+    if notified:
+        logger.info(f"⏭️ 既に通知済み: {unique_id}")
+        line_sent = True
+    else:
+        logger.info(f"📁 LINE送信開始: user_id={user_id}")
+        line_started = time.perf_counter()
+        line_sent = deliver_line_message(user_id, full_message, unique_id, track_notification=False)
+        timer.add('line', time.perf_counter() - line_started)
+        if line_sent:
+            # 後の処理で落ちて再実行されても二重に送信しないよう、送信できたらすぐに書き込む
+            with timer.stage('firestore'):
+                writer.set(notification_ref, {
+                    'notification_sent': True,
+                    'notification_sent_at': firestore.SERVER_TIMESTAMP
+                }, durable=True)
+    
+    # LINE送信が失敗した場合でも、Firestoreには結果を保存（後で再送信可能）
+    if not line_sent:
+        logger.error(f"❌ CRITICAL: LINE送信に失敗しました。user_id={user_id}, unique_id={unique_id}")
+        # 送信失敗フラグを記録
+        writer.set(processing_doc_ref, {
+            'line_send_failed': True,
+            'line_send_error': 'All retry attempts failed',
+            'line_send_attempts': LINE_MAX_ATTEMPTS
+        })
+    
+    # 【データ整合性】Firestoreを更新（分析結果とステータス、通知結果とまとめて1回で書き込む）
+    logger.info(f"📁 Firestore更新開始: unique_id={unique_id}")
+    with timer.stage('firestore'):
+        writer.set(processing_doc_ref, {
+            'status': 'completed',
+            'analysis_result': scores,
+            'aika_message': aika_message,
+            'full_message': full_message,
+            # 工程ごとの所要時間（この書き込み自体は含まない）
+            'timings': timer.summary(),
+            'completed_at': firestore.SERVER_TIMESTAMP
+        }, durable=True)
+
+
+async def deliver_results_async(processing_doc_ref, unique_id, user_id, scores, timer):
+    """
+    deliver_results の asyncio 版（PROCESS_VIDEO_ASYNC_NOTIFY=true の場合に使用）
+    
+    互いに依存しない処理を同時に実行し、ネットワーク待ちを重ねる:
+    - Dify API呼び出し（整形前の返答）
+    - 性別の取得（user_profiles）と通知済みフラグの取得（video_jobs）
+    LINE送信はセリフの整形後に行い、通知済みフラグは送信直後に、結果は最後にまとめて書き込む（JobStateWriter）。
+    Dify・LINEは requests を使う同期処理のため、asyncio.to_thread でスレッド上で実行する。
+    
+    Args:
+        processing_doc_ref: ジョブのFirestoreドキュメント（同期クライアント）
+        unique_id: 冪等性確保のためのユニークID
+        user_id: LINEユーザーID
+        scores: 解析スコア
+        timer: 工程ごとの所要時間を記録する StageTimer
+    """
+    # AsyncClient は作成したイベントループに紐づくため、ジョブ（asyncio.run）ごとに作成する
+    adb = firestore.AsyncClient()
+    try:
+        job_doc = adb.document(processing_doc_ref.path)
+        notification_doc = adb.collection('video_jobs').document(unique_id)
+        
+        async def timed(name, awaitable):
+            start = time.perf_counter()
+            try:
+                return await awaitable
+            finally:
+                timer.add(name, time.perf_counter() - start)
+        
+        async def read_gender():
+            try:
+                snapshot = await adb.collection('user_profiles').document(user_id).get()
+                if snapshot.exists:
+                    return snapshot.to_dict().get('gender', 'unknown')
+            except Exception as e:
+                logger.warning(f"⚠️ 性別の取得に失敗しました: {str(e)}")
+            return 'unknown'
+        
+        async def read_notified():
+            try:
+                snapshot = await notification_doc.get()
+                return snapshot.exists and snapshot.to_dict().get('notification_sent', False)
+            except Exception as e:
+                logger.warning(f"⚠️ 通知済みフラグの取得に失敗しました: {str(e)}")
+                return False
+        
+        # 5. Dify API呼び出しと、Firestoreの読み込みを同時に実行
+        logger.info(f"📁 Dify API呼び出し開始（非同期）: user_id={user_id}")
+        raw_message, (user_gender, notified) = await asyncio.gather(
+            timed('dify', asyncio.to_thread(call_dify_via_mcp, scores, user_id, False)),
+            # 2件の読み込みは同時に実行されるため、まとめて1つの 'firestore' として記録する
+            timed('firestore', asyncio.gather(read_gender(), read_notified())),
+        )
+        if not raw_message:
+            logger.warning("⚠️ Dify MCPからメッセージが取得できませんでした")
+        aika_message = format_aika_response(raw_message or "動画を解析しました。", scores, user_id, user_gender=user_gender)
+        full_message = aika_message
+        
+        # 6. LINE送信（通知済みフラグの確認・設定はここでまとめて行う）
+        if notified:
+            logger.info(f"⏭️ 既に通知済み: {unique_id}")
+            line_sent = True
+        else:
+            logger.info(f"📁 LINE送信開始: user_id={user_id}")
+            line_sent = await timed('line', asyncio.to_thread(
+                deliver_line_message, user_id, full_message, unique_id, False
+            ))
+        
+        writer = JobStateWriter(adb)
+        if line_sent and not notified:
+            # 後の処理で落ちて再実行されても二重に送信しないよう、送信できたらすぐに書き込む
+            writer.set(notification_doc, {
+                'notification_sent': True,
+                'notification_sent_at': firestore.SERVER_TIMESTAMP
+            })
+            await timed('firestore', writer.flush_async())
+        
+        # 7. 結果・ステータス・送信失敗を1回で書き込む
+        if not line_sent:
+            logger.error(f"❌ CRITICAL: LINE送信に失敗しました。user_id={user_id}, unique_id={unique_id}")
+            writer.set(job_doc, {
+                'line_send_failed': True,
+                'line_send_error': 'All retry attempts failed',
+                'line_send_attempts': LINE_MAX_ATTEMPTS
+            })
+        
+        logger.info(f"📁 Firestore更新開始: unique_id={unique_id}")
+        writer.set(job_doc, {
+            'status': 'completed',
+            'analysis_result': scores,
+            'aika_message': aika_message,
+            'full_message': full_message,
+            # 工程ごとの所要時間（この書き込み自体は含まない）
+            'timings': timer.summary(),
+            'completed_at': firestore.SERVER_TIMESTAMP
+        })
+        await timed('firestore', writer.flush_async())
+
+    finally:
+        # ジョブごとに作成するクライアントのため、gRPCチャネルを閉じる（閉じないとジョブのたびにチャネルが残る）
+        await close_async_client(adb)
+
 def process_video(data, context):
     """
     Firebase Storageのトリガーで呼ばれる関数（要塞化版）
@@ -770,6 +1035,37 @@ def process_video(data, context):
         data: イベントデータ（ファイル情報が入っている）
         context: イベントのメタデータ
     """
+    timer = StageTimer()
+    job = {}
+    result = None
+    start = time.perf_counter()
+    try:
+        result = _process_video(data, context, timer, job)
+        return result
+    finally:
+        # 工程ごとの所要時間（容量計画用）をジョブごとに1行の構造化ログで出力
+        timings = timer.summary()
+        if isinstance(result, dict):
+            result['timings'] = timings
+        logger.info(json.dumps({
+            "event": "video_job_timings",
+            "job_id": job.get('unique_id'),
+            "user_id": job.get('user_id'),
+            "status": result.get('status') if isinstance(result, dict) else 'exception',
+            "total_ms": round((time.perf_counter() - start) * 1000, 2),
+            "timings": timings,
+            # ホストごとの接続の使い回し状況（プロセス起動からの累計）
+            "http_pools": http_client.pool_stats()
+        }, ensure_ascii=False))
+
+
+def _process_video(data, context, timer, job):
+    """
+    process_video の本体
+
+    各工程（プローブ・ダウンロード・解析・Dify・LINE・Firestore）の時間を timer に記録し、
+    ログ用のジョブ情報（unique_id / user_id）を job に入れる。
+    """
     try:
         logger.info("📁 process_video関数開始")
         logger.info(f"📁 受信データ型: {type(data)}")
@@ -791,6 +1087,8 @@ def process_video(data, context):
         
         file_path = data.get('name') or data.get('file')
         bucket_name = data.get('bucket', os.environ.get('STORAGE_BUCKET', 'aikaapp-584fa.firebasestorage.app'))
+        # キューワーカーから呼ばれた場合の貸し出し情報（process_queued_video が付ける）
+        queue_lease = data.get('queue_lease')
         
         logger.info(f"📁 処理開始: {file_path} (bucket: {bucket_name})")
     
@@ -839,7 +1137,9 @@ def process_video(data, context):
         
         # レートリミットチェック
         logger.info(f"📁 レートリミットチェック開始: {user_id}")
-        is_allowed, rate_limit_message = check_rate_limit(user_id, 'upload_video')
+        job['user_id'] = user_id
+        with timer.stage('rate_limit'):
+            is_allowed, rate_limit_message = check_rate_limit(user_id, 'upload_video')
         if not is_allowed:
             logger.warning(f"❌ レートリミット超過: {user_id} - {rate_limit_message}")
             # 簡易的なLINEメッセージ送信（エラーは無視）
@@ -859,11 +1159,18 @@ def process_video(data, context):
             file_hash = hashlib.md5(file_path.encode()).hexdigest()
             processing_doc_ref = db.collection('video_processing').document(file_hash)
             unique_id = file_hash
+        job['unique_id'] = unique_id
         
         # 【冪等性確保】アトミックトランザクションで処理済みチェック
         @firestore.transactional
-        def check_and_mark_processing(transaction, processing_doc_ref, job_id, file_path, user_id):
-            """アトミックトランザクションで処理済みチェック"""
+        def check_and_mark_processing(transaction, processing_doc_ref, job_id, file_path, user_id, queue_lease=None):
+            """
+            アトミックトランザクションで処理済みチェック
+            
+            キューワーカーから呼ばれた場合は、貸し出し情報（キューのジョブID・トークン・期限）をドキュメントに記録する。
+            処理中のドキュメントでも、別の貸し出しで記録されたもので、同じキューのジョブ（その貸し出しは既に失効している）か
+            記録された期限を過ぎていれば、落ちたワーカーの処理とみなして引き継ぐ。
+            """
             doc = processing_doc_ref.get(transaction=transaction)
             if doc.exists:
                 doc_data = doc.to_dict()
@@ -872,8 +1179,18 @@ def process_video(data, context):
                     logger.info(f"✅ 既に処理済み（冪等性確保）: {file_path}")
                     return False  # 処理済み→スキップ
                 elif current_status == 'processing':
-                    logger.warning(f"⚠️ 処理中（重複実行防止）: {file_path}")
-                    return False  # 処理中→スキップ
+                    owner_token = doc_data.get('processing_lease_token')
+                    owner_expires = doc_data.get('processing_lease_expires_at')
+                    stale = (
+                        queue_lease is not None and owner_token and owner_token != queue_lease['token'] and (
+                            doc_data.get('processing_queue_job') == queue_lease['job_id']
+                            or (owner_expires is not None and owner_expires < datetime.now(timezone.utc))
+                        )
+                    )
+                    if not stale:
+                        logger.warning(f"⚠️ 処理中（重複実行防止）: {file_path}")
+                        return False  # 処理中→スキップ
+                    logger.warning(f"⚠️ 貸し出しが失効した処理中のジョブを引き継ぎます: {file_path}")
 
             payload = {
                 'status': 'processing',
@@ -881,6 +1198,14 @@ def process_video(data, context):
                 'user_id': user_id,
                 'updated_at': firestore.SERVER_TIMESTAMP
             }
+            if queue_lease is not None:
+                payload.update({
+                    'processing_queue_job': queue_lease['job_id'],
+                    'processing_lease_token': queue_lease['token'],
+                    'processing_lease_expires_at': (
+                        datetime.now(timezone.utc) + timedelta(seconds=queue_lease['lease_seconds'])
+                    )
+                })
             if not doc.exists:
                 payload['started_at'] = firestore.SERVER_TIMESTAMP
 
@@ -894,8 +1219,10 @@ def process_video(data, context):
             return True  # 新規処理
         
         try:
-            transaction = db.transaction()
-            is_new = check_and_mark_processing(transaction, processing_doc_ref, job_id, file_path, user_id)
+            with timer.stage('firestore'):
+                transaction = db.transaction()
+                is_new = check_and_mark_processing(transaction, processing_doc_ref, job_id, file_path, user_id,
+                                                   queue_lease)
             if not is_new:
                 logger.info("⚠️ スキップ: 既に処理済みまたは処理中")
                 return {"status": "skipped", "reason": "already processed or processing"}
@@ -905,55 +1232,176 @@ def process_video(data, context):
             traceback.print_exc()
             return {"status": "error", "reason": "transaction failed"}
         
-        # 2. 動画ファイルを一時ディレクトリにダウンロード
-        logger.info(f"📁 動画ダウンロード開始: {file_path}")
         storage_client = get_storage_client()
         bucket = storage_client.bucket(bucket_name)
         blob = bucket.blob(file_path)
         
-        temp_path = None
+        # 2. ダウンロード前のプローブ（メタデータのサイズとコンテナヘッダーの範囲読み込みのみ）
+        logger.info(f"📁 動画プローブ開始: {file_path}")
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_file:
-                temp_path = temp_file.name
-                blob.download_to_filename(temp_path)
-                logger.info(f"📁 ダウンロード完了: {temp_path}")
-            
-            # ファイルサイズチェック（100MB制限）
-            file_size = os.path.getsize(temp_path)
-            max_size = 100 * 1024 * 1024  # 100MB
-            if file_size > max_size:
-                logger.error(f"❌ ファイルサイズ超過: {file_size / 1024 / 1024:.2f}MB > 100MB")
-                # 簡易的なLINEメッセージ送信（エラーは無視）
-                send_line_message_simple(user_id, "ごめんあそばせ。動画ファイルが大きすぎるわ（100MB以下に収めて）。")
-                # Firestoreを更新（エラー状態）
-                processing_doc_ref.set({
-                    'status': 'error',
-                    'error_message': 'file size too large',
-                    'updated_at': firestore.SERVER_TIMESTAMP
-                }, merge=True)
-                return {"status": "error", "reason": "file size too large"}
-            
-            # 動画の長さチェック（20秒制限）
-            cap = cv2.VideoCapture(temp_path)
-            if not cap.isOpened():
-                logger.error(f"❌ 動画ファイルを開けません: {temp_path}")
-                cap.release()
+            with timer.stage('probe'):
+                video_info = probe_blob(blob, size=int(data['size']) if data.get('size') else None)
+        except Exception as probe_error:
+            # オブジェクトがない場合は再実行しても変わらない。それ以外（メタデータ取得の一時的な失敗）は再実行する
+            reason = 'video not found' if isinstance(probe_error, NotFound) else 'probe failed'
+            logger.error(f"❌ 動画のメタデータ取得エラー（{reason}）: {str(probe_error)}")
+            processing_doc_ref.set({
+                'status': 'error',
+                'error_message': reason,
+                'updated_at': firestore.SERVER_TIMESTAMP
+            }, merge=True)
+            return {"status": "error", "reason": reason}
+        logger.info(f"📁 プローブ結果: {json.dumps(video_info, ensure_ascii=False)}")
+        
+        # ファイルサイズチェック（100MB制限）: ダウンロードせずに拒否
+        if video_info['size'] > MAX_VIDEO_SIZE_BYTES:
+            logger.error(f"❌ ファイルサイズ超過: {video_info['size'] / 1024 / 1024:.2f}MB > 100MB")
+            # 簡易的なLINEメッセージ送信（エラーは無視）
+            send_line_message_simple(user_id, "ごめんあそばせ。動画ファイルが大きすぎるわ（100MB以下に収めて）。")
+            # Firestoreを更新（エラー状態）
+            processing_doc_ref.set({
+                'status': 'error',
+                'error_message': 'file size too large',
+                'updated_at': firestore.SERVER_TIMESTAMP
+            }, merge=True)
+            return {"status": "error", "reason": "file size too large"}
+        
+        # 動画の長さチェック（20秒制限）: ヘッダーから長さが取れた場合はダウンロードせずに拒否
+        if video_info['duration_seconds'] is not None and video_info['duration_seconds'] > MAX_VIDEO_DURATION_SECONDS:
+            logger.error(f"❌ 動画の長さ超過: {video_info['duration_seconds']:.2f}秒 > 20秒")
+            # 簡易的なLINEメッセージ送信（エラーは無視）
+            send_line_message_simple(user_id, "ごめんあそばせ。動画が長すぎるわ（20秒以内に収めて）。")
+            processing_doc_ref.set({
+                'status': 'error',
+                'error_message': 'video duration too long',
+                'updated_at': firestore.SERVER_TIMESTAMP
+            }, merge=True)
+            return {"status": "error", "reason": "video duration too long"}
+        
+        # 内容ハッシュ（同じ動画の再送時にランドマークキャッシュを使うためのキー）
+        # プローブでメタデータを取得済みならそのハッシュを使い、なければここで取得する
+        content_hash = data.get('md5Hash') or data.get('crc32c') or blob.md5_hash or blob.crc32c
+        if not content_hash:
+            try:
+                blob.reload()
+                content_hash = blob.md5_hash or blob.crc32c
+            except Exception as metadata_error:
+                logger.warning(f"⚠️ オブジェクトのメタデータ取得に失敗（キャッシュなしで続行）: {str(metadata_error)}")
+        
+        # ストリーミング取り込み: faststart形式ならダウンロード完了を待たずに解析を始める
+        use_streaming = VIDEO_STREAMING_INGEST and video_info['streamable']
+        
+        # 3. 動画ファイルを一時ディレクトリにダウンロード
+        temp_path = None
+        cap = None
+        if not use_streaming:
+            logger.info(f"📁 動画ダウンロード開始: {file_path}")
+            try:
+                with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_file:
+                    temp_path = temp_file.name
+                    with timer.stage('download'):
+                        blob.download_to_filename(temp_path)
+                    logger.info(f"📁 ダウンロード完了: {temp_path}")
+                
+                # アップロード後に差し替えられた場合に備え、実サイズも確認
+                file_size = os.path.getsize(temp_path)
+                if file_size > MAX_VIDEO_SIZE_BYTES:
+                    logger.error(f"❌ ファイルサイズ超過: {file_size / 1024 / 1024:.2f}MB > 100MB")
+                    # 簡易的なLINEメッセージ送信（エラーは無視）
+                    send_line_message_simple(user_id, "ごめんあそばせ。動画ファイルが大きすぎるわ（100MB以下に収めて）。")
+                    processing_doc_ref.set({
+                        'status': 'error',
+                        'error_message': 'file size too large',
+                        'updated_at': firestore.SERVER_TIMESTAMP
+                    }, merge=True)
+                    return {"status": "error", "reason": "file size too large"}
+                
+                # 動画はここで一度だけ開き、そのまま解析に渡す
+                with timer.stage('open'):
+                    cap = cv2.VideoCapture(temp_path)
+                if not cap.isOpened():
+                    logger.error(f"❌ 動画ファイルを開けません: {temp_path}")
+                    cap.release()
+                    processing_doc_ref.set({
+                        'status': 'error',
+                        'error_message': 'cannot open video file',
+                        'updated_at': firestore.SERVER_TIMESTAMP
+                    }, merge=True)
+                    return {"status": "error", "reason": "cannot open video file"}
+                
+                # ヘッダーから長さが取れなかった場合のみ、開いたキャプチャで判定
+                if video_info['duration_seconds'] is None:
+                    fps = cap.get(cv2.CAP_PROP_FPS)
+                    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+                    if fps > 0:
+                        duration = frame_count / fps
+                        if duration > MAX_VIDEO_DURATION_SECONDS:
+                            logger.error(f"❌ 動画の長さ超過: {duration:.2f}秒 > 20秒")
+                            cap.release()
+                            # 簡易的なLINEメッセージ送信（エラーは無視）
+                            send_line_message_simple(user_id, "ごめんあそばせ。動画が長すぎるわ（20秒以内に収めて）。")
+                            processing_doc_ref.set({
+                                'status': 'error',
+                                'error_message': 'video duration too long',
+                                'updated_at': firestore.SERVER_TIMESTAMP
+                            }, merge=True)
+                            return {"status": "error", "reason": "video duration too long"}
+                    else:
+                        logger.warning("⚠️ FPSが取得できませんでした。動画の長さチェックをスキップします。")
+                
+            except Exception as download_error:
+                logger.error(f"❌ ファイルダウンロードエラー: {str(download_error)}")
+                if cap is not None:
+                    cap.release()
                 processing_doc_ref.set({
                     'status': 'error',
-                    'error_message': 'cannot open video file',
+                    'error_message': 'download failed',
                     'updated_at': firestore.SERVER_TIMESTAMP
                 }, merge=True)
-                return {"status": "error", "reason": "cannot open video file"}
-            
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
-            cap.release()
-            
-            if fps > 0:
-                duration = frame_count / fps
-                if duration > 20:
-                    logger.error(f"❌ 動画の長さ超過: {duration:.2f}秒 > 20秒")
-                    # 簡易的なLINEメッセージ送信（エラーは無視）
+                if temp_path and os.path.exists(temp_path):
+                    os.remove(temp_path)
+                return {"status": "error", "reason": "download failed"}
+        
+        try:
+            # 4. 動画解析を実行
+            if use_streaming:
+                # FIFOはシークできないため区間並列は使わず、長さの上限は解析側で動画を開いた直後に判定する
+                stream = BlobFifoStream(blob, MAX_VIDEO_SIZE_BYTES).start()
+                logger.info(f"📁 動画解析開始（ストリーミング）: {file_path}")
+                try:
+                    # ストリーミングではダウンロードと解析が重なるため、両方を含めた時間を 'analysis' とする
+                    with timer.stage('analysis'):
+                        analysis_result = analyze_kickboxing_form(
+                            stream.path,
+                            content_hash=content_hash,
+                            parallel_workers=0,
+                            max_duration_seconds=MAX_VIDEO_DURATION_SECONDS,
+                            timer=timer
+                        )
+                finally:
+                    stream.close()
+                logger.info(f"📁 ストリーミング受信量: {stream.bytes_written / 1024 / 1024:.2f}MB")
+                
+                if stream.size_exceeded:
+                    logger.error(f"❌ ファイルサイズ超過: > {MAX_VIDEO_SIZE_BYTES / 1024 / 1024:.0f}MB")
+                    send_line_message_simple(user_id, "ごめんあそばせ。動画ファイルが大きすぎるわ（100MB以下に収めて）。")
+                    processing_doc_ref.set({
+                        'status': 'error',
+                        'error_message': 'file size too large',
+                        'updated_at': firestore.SERVER_TIMESTAMP
+                    }, merge=True)
+                    return {"status": "error", "reason": "file size too large"}
+                
+                if stream.error is not None:
+                    processing_doc_ref.set({
+                        'status': 'error',
+                        'error_message': 'download failed',
+                        'updated_at': firestore.SERVER_TIMESTAMP
+                    }, merge=True)
+                    return {"status": "error", "reason": "download failed"}
+                
+                if analysis_result.get('error_code') == 'duration_exceeded':
+                    logger.error(f"❌ 動画の長さ超過: {analysis_result.get('error_message')}")
                     send_line_message_simple(user_id, "ごめんあそばせ。動画が長すぎるわ（20秒以内に収めて）。")
                     processing_doc_ref.set({
                         'status': 'error',
@@ -962,21 +1410,9 @@ def process_video(data, context):
                     }, merge=True)
                     return {"status": "error", "reason": "video duration too long"}
             else:
-                logger.warning("⚠️ FPSが取得できませんでした。動画の長さチェックをスキップします。")
-                
-        except Exception as download_error:
-            logger.error(f"❌ ファイルダウンロードエラー: {str(download_error)}")
-            processing_doc_ref.set({
-                'status': 'error',
-                'error_message': 'download failed',
-                'updated_at': firestore.SERVER_TIMESTAMP
-            }, merge=True)
-            return {"status": "error", "reason": "download failed"}
-        
-        try:
-            # 3. 動画解析を実行
-            logger.info(f"📁 動画解析開始: {temp_path}")
-            analysis_result = analyze_kickboxing_form(temp_path)
+                logger.info(f"📁 動画解析開始: {temp_path}")
+                with timer.stage('analysis'):
+                    analysis_result = analyze_kickboxing_form(temp_path, content_hash=content_hash, cap=cap, timer=timer)
             logger.info(f"📁 解析結果: {json.dumps(analysis_result, ensure_ascii=False)}")
             
             if analysis_result['status'] != 'success':
@@ -984,79 +1420,16 @@ def process_video(data, context):
                 processing_doc_ref.set({
                     'status': 'error',
                     'error_message': analysis_result.get('error_message', 'analysis failed'),
+                    'timings': timer.summary(),
                     'updated_at': firestore.SERVER_TIMESTAMP
                 }, merge=True)
                 return analysis_result
             
-            # 4. MCPスタイルでDify APIに送信してAIKAのセリフを生成
-            logger.info(f"📁 Dify API呼び出し開始: user_id={user_id}")
-            aika_message = call_dify_via_mcp(analysis_result['scores'], user_id)
-            
-            if not aika_message:
-                logger.warning("⚠️ Dify MCPからメッセージが取得できませんでした")
-                # デフォルトメッセージを使用（整形関数を通す）
-                scores = analysis_result['scores']
-                aika_message = format_aika_response("動画を解析しました。", scores, user_id)
-            
-            # 整形済みメッセージをそのまま使用（既にformat_aika_responseで整形済み）
-            full_message = aika_message
-            
-            # 5. LINE Messaging APIでユーザーに送信（指数関数的バックオフ・リトライ付き）
-            logger.info(f"📁 LINE送信開始: user_id={user_id}")
-            line_sent = False
-            max_line_attempts = 5  # LINE送信は最大5回試行
-            
-            for line_attempt in range(1, max_line_attempts + 1):
-                try:
-                    if line_attempt == 1:
-                        # 最初はリトライ版を試行
-                        send_line_message_with_retry(user_id, full_message, unique_id)
-                        logger.info(f"✅ LINE送信成功（リトライ版）: user_id={user_id}")
-                        line_sent = True
-                        break
-                    else:
-                        # 2回目以降は簡易版を試行
-                        if send_line_message_simple(user_id, full_message):
-                            logger.info(f"✅ LINE送信成功（簡易版・試行{line_attempt}回目）: user_id={user_id}")
-                            line_sent = True
-                            break
-                        else:
-                            logger.warning(f"⚠️ LINE送信失敗（簡易版・試行{line_attempt}回目）")
-                            if line_attempt < max_line_attempts:
-                                time.sleep(2 * line_attempt)  # 指数バックオフ
-                            continue
-                except Exception as send_error:
-                    logger.error(f"❌ LINE送信エラー（試行{line_attempt}回目）: {str(send_error)}")
-                    if line_attempt < max_line_attempts:
-                        time.sleep(2 * line_attempt)  # 指数バックオフ
-                        continue
-                    else:
-                        logger.error(f"❌ LINE送信が全て失敗しました（{max_line_attempts}回試行）")
-            
-            # LINE送信が失敗した場合でも、Firestoreには結果を保存（後で再送信可能）
-            if not line_sent:
-                logger.error(f"❌ CRITICAL: LINE送信に失敗しました。user_id={user_id}, unique_id={unique_id}")
-                # Firestoreに送信失敗フラグを記録
-                try:
-                    processing_doc_ref.set({
-                        'line_send_failed': True,
-                        'line_send_error': 'All retry attempts failed',
-                        'line_send_attempts': max_line_attempts,
-                        'updated_at': firestore.SERVER_TIMESTAMP
-                    }, merge=True)
-                except Exception as firestore_error:
-                    logger.error(f"❌ Firestore更新も失敗: {str(firestore_error)}")
-            
-            # 【データ整合性】Firestoreを更新（分析結果とステータス）
-            logger.info(f"📁 Firestore更新開始: unique_id={unique_id}")
-            processing_doc_ref.set({
-                'status': 'completed',
-                'analysis_result': analysis_result['scores'],
-                'aika_message': aika_message,
-                'full_message': full_message,
-                'completed_at': firestore.SERVER_TIMESTAMP,
-                'updated_at': firestore.SERVER_TIMESTAMP
-            }, merge=True)
+            # 5-7. Dify → LINE → Firestore
+            if PROCESS_VIDEO_ASYNC_NOTIFY:
+                asyncio.run(deliver_results_async(processing_doc_ref, unique_id, user_id, analysis_result['scores'], timer))
+            else:
+                deliver_results(processing_doc_ref, unique_id, user_id, analysis_result['scores'], timer)
             
             logger.info(f"✅ 処理完了: {file_path} (分析結果をFirestoreに保存)")
             
@@ -1107,13 +1480,12 @@ def process_video(data, context):
 
 
 
-# Firebase Storage トリガー関数（CloudEvent形式・Cloud Storage v2仕様対応）
-@functions_framework.cloud_event
-def process_video_trigger(cloud_event):
+def parse_storage_event(cloud_event):
     """
-    Firebase StorageのCloudEventトリガー（Cloud Storage v2仕様対応）
+    Cloud StorageのCloudEvent（Cloud Storage v2仕様）から process_video に渡すデータを取り出して検証
     
-    Storageにファイルが作成されると自動で呼ばれます
+    Returns:
+        tuple: (video_data, None)、処理対象外・不正なイベントの場合は (None, 応答のdict)
     """
     # CloudEventオブジェクトの属性を安全に取得（辞書形式とオブジェクト形式の両方に対応）
     try:
@@ -1155,7 +1527,7 @@ def process_video_trigger(cloud_event):
                 logger.info(f"📦 直接取得したevent_dataの型: {type(event_data)}")
             else:
                 logger.error("❌ CloudEventにdata属性が見つかりません")
-                return {"status": "error", "reason": "no data in cloud_event"}
+                return None, {"status": "error", "reason": "no data in cloud_event"}
         
         # デバッグログ: 実際のデータ構造を確認
         if event_data:
@@ -1181,7 +1553,7 @@ def process_video_trigger(cloud_event):
                 except json.JSONDecodeError:
                     logger.error(f"❌ CloudEventデータのデコードエラー: {decode_error}")
                     logger.error(f"   データ（最初の500文字）: {event_data[:500] if len(event_data) > 500 else event_data}")
-                    return {"status": "error", "reason": "decode error", "details": str(decode_error)}
+                    return None, {"status": "error", "reason": "decode error", "details": str(decode_error)}
         
         # パターン2: 既に辞書形式
         if isinstance(event_data, dict):
@@ -1196,13 +1568,17 @@ def process_video_trigger(cloud_event):
                 logger.error(f"❌ CloudEventデータが不完全: bucket={bucket}, name={name}")
                 logger.error(f"   完全なevent_data: {json.dumps(event_data, ensure_ascii=False)}")
                 logger.error(f"   利用可能なキー: {list(event_data.keys())}")
-                return {"status": "error", "reason": "incomplete event data", "bucket": bucket, "name": name}
+                return None, {"status": "error", "reason": "incomplete event data", "bucket": bucket, "name": name}
             
             # process_video関数に渡す形式に変換
             video_data = {
                 'bucket': bucket,
                 'name': name
             }
+            # 内容ハッシュ（ランドマークキャッシュのキー）とサイズ（事前チェック用）があれば引き継ぐ
+            for metadata_key in ('md5Hash', 'crc32c', 'size'):
+                if event_data.get(metadata_key):
+                    video_data[metadata_key] = event_data[metadata_key]
             
             logger.info(f"📁 処理対象ファイル: {name} (バケット: {bucket})")
             
@@ -1210,24 +1586,14 @@ def process_video_trigger(cloud_event):
             if not name.startswith('videos/'):
                 logger.warning(f"⚠️ パスがvideos/で始まらない: {name}")
                 logger.warning(f"   完全なevent_data: {json.dumps(event_data, ensure_ascii=False)}")
-                return {"status": "skipped", "reason": "not a video file", "file_path": name}
+                return None, {"status": "skipped", "reason": "not a video file", "file_path": name}
             
-            try:
-                logger.info("🚀 process_video関数を呼び出します...")
-                result = process_video(video_data, None)
-                logger.info(f"✅ 処理完了: {json.dumps(result, ensure_ascii=False)}")
-                logger.info("=" * 80)
-                return result
-            except Exception as process_error:
-                logger.error(f"❌ process_video実行エラー: {process_error}")
-                traceback.print_exc()
-                logger.info("=" * 80)
-                return {"status": "error", "reason": "processing error", "details": str(process_error)}
+            return video_data, None
         else:
             logger.error(f"❌ 予期しないCloudEventデータ形式: {type(event_data)}")
             logger.error(f"   データ内容: {str(event_data)[:500]}")
             logger.info("=" * 80)
-            return {"status": "error", "reason": "unexpected event data format", "type": str(type(event_data))}
+            return None, {"status": "error", "reason": "unexpected event data format", "type": str(type(event_data))}
                 
     except Exception as e:
         logger.error(f"❌ CloudEvent処理エラー: {e}")
@@ -1235,7 +1601,129 @@ def process_video_trigger(cloud_event):
         logger.error(f"   CloudEvent内容: {str(cloud_event)[:500]}")
         traceback.print_exc()
         logger.info("=" * 80)
-        return {"status": "error", "reason": str(e)}
+        return None, {"status": "error", "reason": str(e)}
+
+
+# Firebase Storage トリガー関数（CloudEvent形式・Cloud Storage v2仕様対応）
+@functions_framework.cloud_event
+def process_video_trigger(cloud_event):
+    """
+    Firebase StorageのCloudEventトリガー（Cloud Storage v2仕様対応）
+    
+    Storageにファイルが作成されると自動で呼ばれます
+    """
+    video_data, error_result = parse_storage_event(cloud_event)
+    if error_result is not None:
+        return error_result
+    
+    try:
+        logger.info("🚀 process_video関数を呼び出します...")
+        result = process_video(video_data, None)
+        logger.info(f"✅ 処理完了: {json.dumps(result, ensure_ascii=False)}")
+        logger.info("=" * 80)
+        return result
+    except Exception as process_error:
+        logger.error(f"❌ process_video実行エラー: {process_error}")
+        traceback.print_exc()
+        logger.info("=" * 80)
+        return {"status": "error", "reason": "processing error", "details": str(process_error)}
+
+
+# --- キューモード（VIDEO_QUEUE_MODE=true）---
+_queue_workers = None
+_queue_workers_lock = threading.Lock()
+
+
+def video_job_id(video_data):
+    """キューのジョブID（同じオブジェクトのイベントが再送されても1件にまとめる）"""
+    key = f"{video_data['bucket']}/{video_data['name']}:{video_data.get('md5Hash', '')}"
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+# 再実行しても結果が変わらない失敗（入力の問題）。これ以外の error / failure はキューに戻して再実行する
+PERMANENT_ERROR_REASONS = {
+    'invalid data format', 'invalid path', 'invalid path structure', 'invalid user id',
+    'file size too large', 'video duration too long', 'cannot open video file', 'video not found',
+}
+
+
+class RetryableVideoJobError(Exception):
+    """一時的な失敗（ダウンロード・トランザクション・解析中の例外など）でジョブを再実行する"""
+
+
+def process_queued_video(lease):
+    """
+    キューワーカーのハンドラ: 貸し出し情報を付けて process_video を実行
+    
+    process_video は失敗を例外ではなく結果のdictで返すため、一時的な失敗は RetryableVideoJobError にして
+    キューに知らせる（nack → VIDEO_QUEUE_MAX_ATTEMPTS 回まで再実行）。
+    """
+    video_data = dict(lease.payload)
+    video_data['queue_lease'] = {
+        'job_id': lease.job_id,
+        'token': lease.token,
+        'lease_seconds': VIDEO_QUEUE_LEASE_SECONDS
+    }
+    result = process_video(video_data, None)
+    status = result.get('status') if isinstance(result, dict) else None
+    if status == 'failure' or (status == 'error' and result.get('reason') not in PERMANENT_ERROR_REASONS):
+        raise RetryableVideoJobError(result.get('reason') or result.get('error_message') or status)
+    return result
+
+
+def start_video_queue_workers(workers=None):
+    """
+    このプロセスでキューワーカーを起動（workers が0なら起動しない。2回目以降は何もしない）
+    
+    Args:
+        workers: ワーカー数（省略時は VIDEO_QUEUE_WORKERS。HTTPサービスの既定は0で、起動しない）
+    """
+    global _queue_workers
+    if workers is None:
+        workers = VIDEO_QUEUE_WORKERS
+    with _queue_workers_lock:
+        if _queue_workers is None and workers > 0:
+            _queue_workers = QueueWorkerPool(get_queue(), process_queued_video, workers=workers)
+            _queue_workers.start()
+        return _queue_workers
+
+
+def run_video_queue_worker():
+    """
+    キューワーカー専用プロセスとして処理を続ける（受け付け用とは別のサービス・インスタンスで処理する）
+    
+    ワーカー数は VIDEO_QUEUE_WORKERS（0 または未設定の場合は1）。
+    例: VIDEO_QUEUE_MODE=true VIDEO_QUEUE_WORKERS=2 python -c "import main; main.run_video_queue_worker()"
+    """
+    workers = start_video_queue_workers(max(1, VIDEO_QUEUE_WORKERS))
+    try:
+        while True:
+            time.sleep(60)
+            logger.info(f"🧰 キュー状況: {json.dumps(get_queue().stats(), ensure_ascii=False)} "
+                        f"処理={workers.processed} 失敗={workers.failed}")
+    except KeyboardInterrupt:
+        workers.stop()
+
+
+def enqueue_video_job(cloud_event):
+    """
+    イベントを検証してジョブをキューに積む（処理はキューワーカーが行う）
+    
+    Returns:
+        dict: 応答（queued / duplicate、処理対象外・不正なイベントの場合は parse_storage_event の結果）
+    """
+    video_data, error_result = parse_storage_event(cloud_event)
+    if error_result is not None:
+        return error_result
+    job_id = video_job_id(video_data)
+    if get_queue().enqueue(job_id, video_data):
+        logger.info(f"📥 ジョブをキューに追加: {job_id} ({video_data['name']})")
+        status = "queued"
+    else:
+        logger.info(f"⏭️ キューに追加済みのジョブ: {job_id} ({video_data['name']})")
+        status = "duplicate"
+    logger.info("=" * 80)
+    return {"status": status, "job_id": job_id, "file_path": video_data['name']}
 
 
 # Cloud Run HTTPエンドポイント（CloudEvent形式のリクエストを受け取る）
@@ -1246,6 +1734,7 @@ def app(request):
     
     Cloud StorageからのCloudEvent形式のHTTPリクエストを受け取り、
     process_video_trigger関数に渡します。
+    VIDEO_QUEUE_MODE=true の場合は、ジョブをキューに積んで 202 を返します（処理はキューワーカーが行う）。
     """
     try:
         # CloudEvent形式のリクエストを処理
@@ -1276,6 +1765,12 @@ def app(request):
                 'data': event_data
             }
             
+            if VIDEO_QUEUE_MODE:
+                # キューに積んで応答し、処理はキューワーカー（run_video_queue_worker）に任せる
+                # VIDEO_QUEUE_WORKERS > 0 の場合だけ、このサービスの中でもワーカーを動かす（CPUの常時割り当てが必要）
+                start_video_queue_workers()
+                return enqueue_video_job(cloud_event), 202
+            
             # process_video_trigger関数を呼び出し
             result = process_video_trigger(cloud_event)
             return result, 200
@@ -0,0 +1,88 @@
+"""
+動きのないフレームの推論を省くモーションゲート
+
+アップロードされる動画は、撮影の準備などで前後に誰も動いていない時間が数秒ずつあることが多い。
+推論の前に各フレームを小さなグレースケール画像に縮小し、最後に推論したフレームの縮小画像と比べる。
+輝度が変わった画素の割合が閾値未満であれば pose.process を呼ばず、直前のランドマークをそのまま使い回す。
+（画面全体の平均差だと、画面の一部に映った選手の手足の動きが薄まって見逃すため、変化した画素の割合で判定する）
+
+比べる相手は直前のフレームではなく最後に推論したフレームのため、閾値未満のゆっくりした変化も
+積み重なれば推論し直す。また、使い回しが ANALYSIS_MOTION_MAX_SKIP フレーム続いた場合も推論し直す。
+
+動いている区間でも、技の切り返しなどで1〜2フレームだけ変化が閾値を下回ることがある。
+そこで使い回すとその後の推論結果（MediaPipeの追跡・平滑化）まで変わるため、
+動きなしのフレームが ANALYSIS_MOTION_MIN_STATIC フレーム続くまでは推論を続け、それ以降だけを使い回す。
+
+使い回したフレームは「同じ姿勢を保っていたフレーム」として扱う（スコアリングでは
+手首の移動量0、ガード・コア回転は直前と同じ値として平均に含める）。
+そのため、動いている区間のスコアはゲートを使わない場合と変わらない。
+"""
+
+import os
+import cv2
+
+# ANALYSIS_MOTION_GATE: true の場合、動きのないフレームは推論せず直前の結果を使い回す
+# ANALYSIS_MOTION_THRESHOLD: 縮小画像で輝度が変わった画素の割合がこれ未満なら動きなしとみなす
+# ANALYSIS_MOTION_PIXEL_DIFF: 画素の輝度差（0-255）がこれを超えたら変わったとみなす（圧縮ノイズを無視する）
+# ANALYSIS_MOTION_MAX_SKIP: 続けて使い回す解析フレーム数の上限
+# ANALYSIS_MOTION_MIN_STATIC: 動きなしのフレームがこの数だけ続いてから使い回しを始める（それまでは推論する）
+ANALYSIS_MOTION_GATE = os.environ.get('ANALYSIS_MOTION_GATE', 'false').lower() in ('1', 'true', 'yes')
+ANALYSIS_MOTION_THRESHOLD = float(os.environ.get('ANALYSIS_MOTION_THRESHOLD', '0.002'))
+ANALYSIS_MOTION_PIXEL_DIFF = int(os.environ.get('ANALYSIS_MOTION_PIXEL_DIFF', '8'))
+ANALYSIS_MOTION_MAX_SKIP = int(os.environ.get('ANALYSIS_MOTION_MAX_SKIP', '30'))
+ANALYSIS_MOTION_MIN_STATIC = int(os.environ.get('ANALYSIS_MOTION_MIN_STATIC', '5'))
+
+# 比較に使う縮小画像のサイズ（幅, 高さ）
+THUMBNAIL_SIZE = (64, 64)
+
+
+def thumbnail(image_rgb):
+    """比較用の小さなグレースケール画像（uint8）"""
+    small = cv2.resize(image_rgb, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+
+
+class MotionGate:
+    """
+    フレームごとに推論が必要かを判定する
+
+    使い方:
+        gate = MotionGate()
+        if gate.is_static(image_rgb):
+            ...  # 直前のランドマークを使い回す
+        else:
+            ...  # pose.process で推論する
+    """
+
+    def __init__(self, threshold=None, max_skip=None, pixel_diff=None, min_static=None):
+        self.threshold = ANALYSIS_MOTION_THRESHOLD if threshold is None else threshold
+        self.pixel_diff = ANALYSIS_MOTION_PIXEL_DIFF if pixel_diff is None else pixel_diff
+        self.max_skip = ANALYSIS_MOTION_MAX_SKIP if max_skip is None else max_skip
+        self.min_static = ANALYSIS_MOTION_MIN_STATIC if min_static is None else min_static
+        # 最後に推論したフレームの縮小画像
+        self.reference = None
+        # 続けて使い回したフレーム数 / 続けて動きなしと判定したフレーム数（推論したものを含む）
+        self._run = 0
+        self._still = 0
+        self.inferred_frames = 0
+        self.skipped_frames = 0
+
+    def is_static(self, image_rgb):
+        """最後に推論したフレームから動きがなければTrue（Falseの場合はこのフレームを新しい基準にする）"""
+        thumb = thumbnail(image_rgb)
+        if self.reference is not None and self._run < self.max_skip:
+            changed = cv2.countNonZero(cv2.threshold(
+                cv2.absdiff(thumb, self.reference), self.pixel_diff, 255, cv2.THRESH_BINARY
+            )[1])
+            if changed >= self.threshold * thumb.size:
+                self._still = 0
+            else:
+                self._still += 1
+                if self._still > self.min_static:
+                    self._run += 1
+                    self.skipped_frames += 1
+                    return True
+        self.reference = thumb
+        self._run = 0
+        self.inferred_frames += 1
+        return False
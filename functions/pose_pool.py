@@ -0,0 +1,182 @@
+"""
+MediaPipe Poseのウォームプール
+
+動画ごとに mp.solutions.pose.Pose を生成するとTFLiteグラフの読み込みが毎回発生するため、
+プロセス内で初期化済みのPoseを使い回す。プールはプロファイル（model_complexity /
+smooth_landmarks）ごとに持ち、同時に貸し出せる数はインスタンスの同時実行数に合わせる。
+
+使い方:
+    with checkout_pose(profile) as pose:
+        results = pose.process(image_rgb)
+"""
+
+import os
+import time
+import threading
+import logging
+from contextlib import contextmanager
+import numpy as np
+from analysis_profile import create_pose
+from thread_tuning import available_cpus
+
+logger = logging.getLogger(__name__)
+
+# プールの最大サイズ（= 同時に解析できる動画数）。0 の場合はCPU数（cgroupのCPU割り当てを考慮）
+POSE_POOL_SIZE = int(os.environ.get('POSE_POOL_SIZE', '0'))
+# 空きがない場合に貸し出しを待つ秒数
+POSE_POOL_TIMEOUT_SECONDS = float(os.environ.get('POSE_POOL_TIMEOUT_SECONDS', '300'))
+
+# 動画の切り替え時に流す空フレーム（人物が検出されないため追跡・平滑化の状態が消える）
+_RESET_FRAME = np.zeros((64, 64, 3), dtype=np.uint8)
+_RESET_FRAME.flags.writeable = False
+
+
+def default_pool_size():
+    """プールサイズを決定（POSE_POOL_SIZE、未設定ならCPU数）"""
+    if POSE_POOL_SIZE > 0:
+        return POSE_POOL_SIZE
+    return available_cpus()
+
+
+def reset_pose(pose):
+    """
+    Poseの追跡・平滑化の状態を、モデルを読み直さずにリセット
+
+    Pose.reset() はグラフを再起動してモデルを読み込み直すため、新規生成と同じだけ時間がかかる。
+    代わりに人物のいない空フレームを1枚処理させると、前フレームの追跡領域と
+    ランドマーク（x, y, z）の平滑化フィルタが破棄され、座標は新規インスタンスと同じ結果になる。
+    ただしvisibilityの平滑化状態は残るため、次の動画の最初の数フレームのvisibilityだけは
+    前の動画の影響を受ける（スコアはx, y, zだけを使うので影響しない）。
+    visibilityまで一致させたい場合は checkout_pose(..., exact=True) を使う（プールを使わずに新規生成する）。
+    """
+    pose.process(_RESET_FRAME)
+
+
+class PosePool:
+    """
+    同一設定のPoseインスタンスを貸し出すスレッドセーフなプール
+
+    インスタンスは必要になった時点で最大 size 個まで生成し、
+    返却時にリセットして次の動画に備える。
+    """
+
+    def __init__(self, profile, size):
+        self.profile = dict(profile)
+        self.size = max(1, int(size))
+        # 返却済みのインスタンス（最後に返却したものから貸し出す）
+        self._idle = []
+        # 空きの待ち合わせ（返却・破棄のどちらでも待っているスレッドを起こす）
+        self._cond = threading.Condition()
+        self._created = 0
+
+    def acquire(self, timeout=None):
+        """
+        Poseを1つ借りる（空きがなければ返却を待つ）
+
+        Args:
+            timeout: 空きを待つ秒数（省略時は POSE_POOL_TIMEOUT_SECONDS）
+
+        Raises:
+            TimeoutError: timeout秒以内に空きができなかった場合
+        """
+        if timeout is None:
+            timeout = POSE_POOL_TIMEOUT_SECONDS
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    pose = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    pose = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Pose pool exhausted ({self.size} in use)")
+                self._cond.wait(remaining)
+        if pose is not None:
+            return pose
+
+        # 生成はモデルの読み込みに時間がかかるため、ロックの外で行う
+        try:
+            pose = create_pose(self.profile)
+        except Exception:
+            self._discarded()
+            raise
+        logger.info(f"🧠 Poseインスタンスを生成: {self._created}/{self.size} (profile={self.profile.get('name')})")
+        return pose
+
+    def release(self, pose, discard=False):
+        """
+        Poseを返却
+
+        Args:
+            pose: acquire() で借りたインスタンス
+            discard: Trueの場合は再利用せずに破棄（処理中に例外が起きた場合など）
+        """
+        if not discard:
+            try:
+                reset_pose(pose)
+                with self._cond:
+                    self._idle.append(pose)
+                    self._cond.notify()
+                return
+            except Exception as e:
+                logger.warning(f"⚠️ Poseのリセットに失敗したため破棄します: {str(e)}")
+
+        try:
+            pose.close()
+        except Exception:
+            pass
+        self._discarded()
+
+    def _discarded(self):
+        """生成枠を1つ空けて、空きを待っているスレッドを起こす（空いた枠で新しく生成できる）"""
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pose_pool(profile, size=None):
+    """プロファイルに対応するプールを取得（なければ作成）"""
+    key = (profile['model_complexity'], profile['smooth_landmarks'])
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = PosePool(profile, size or default_pool_size())
+            _pools[key] = pool
+        return pool
+
+
+@contextmanager
+def checkout_pose(profile, timeout=None, exact=False):
+    """
+    プールからPoseを借りて、ブロックを抜けたら返却するコンテキストマネージャ
+
+    ブロック内で例外が発生した場合、そのインスタンスは状態が不明なため破棄する。
+    exact=True の場合はプールを使わず、新規に生成したインスタンスを使ってブロックを抜けたら閉じる
+    （visibilityの平滑化状態はモデルを読み直す Pose.reset() でしか消せず、新規生成と同じだけ時間がかかるため、
+    プールのインスタンスを初期化し直す意味がない）。
+    """
+    if exact:
+        pose = create_pose(profile)
+        try:
+            yield pose
+        finally:
+            pose.close()
+        return
+
+    pool = get_pose_pool(profile)
+    pose = pool.acquire(timeout)
+    try:
+        yield pose
+    except BaseException:
+        pool.release(pose, discard=True)
+        raise
+    else:
+        pool.release(pose)
@@ -0,0 +1,171 @@
+"""
+選手の周囲だけを切り出して推論するROIトラッキング
+
+ジムで撮った動画では選手が画面の一部にしか映っていないことが多い。
+前フレームのランドマークから余白付きの矩形を求め、次のフレームはその範囲だけを
+pose.process に渡すことで、1回の推論で扱う画素数を減らす。
+切り出した画像でのランドマークは元画像の正規化座標に戻して返すため、
+スコアリングや出力側は全体画像で推論した場合と同じように扱える。
+
+見失った場合（切り出し範囲で人物が検出されなかった場合）や、蹴りなどで手足が切り出し範囲の端に
+かかった場合は、同じフレームを全体画像で推論し直す。端の判定には visibility の高いランドマークだけを使う
+（見えていない点はMediaPipeが画像の外に推定することが多く、全点で判定すると常に全体画像に戻ってしまう）。
+
+MediaPipe内部の追跡領域とランドマークの平滑化は、直前の入力画像の正規化座標で保持されている。
+全体画像との切り替えや、切り出し範囲が大きく動いた場合（ROI_RESET_SHIFT 以上）は座標系が大きくずれるため、
+reset_pose で追跡・平滑化の状態を捨ててから推論する。リセットした直後のフレームは人物検出からやり直しになり、
+平滑化もかからないため、小さな移動ではリセットせず、ずれは次の推論で追跡側に吸収させる。
+矩形は正方形にし（モデルへの入力の縦横比を一定に保つ）、ランドマークが余白の内側に収まっている間は動かさない。
+全体画像で推論した場合とのスコアの差は、bench/pose_benchmark.py の roi モードと sequential モードの scores を比べて確認できる。
+"""
+
+import os
+import numpy as np
+from landmark_format import landmarks_to_array
+from pose_pool import reset_pose
+
+# ANALYSIS_ROI_TRACKING: true の場合、前フレームの選手の位置を切り出して推論する
+# ANALYSIS_ROI_PADDING: ランドマークの外接矩形に付ける余白（矩形の長辺に対する割合）
+# ANALYSIS_ROI_MAX_AREA: 切り出し範囲が画像に対してこの割合より大きければ切り出さない
+ANALYSIS_ROI_TRACKING = os.environ.get('ANALYSIS_ROI_TRACKING', 'false').lower() in ('1', 'true', 'yes')
+ANALYSIS_ROI_PADDING = float(os.environ.get('ANALYSIS_ROI_PADDING', '0.3'))
+ANALYSIS_ROI_MAX_AREA = float(os.environ.get('ANALYSIS_ROI_MAX_AREA', '0.7'))
+
+# 切り出し画像の端からこの割合以内にランドマークがあれば、手足が範囲外にはみ出たとみなす
+EDGE_MARGIN = 0.02
+# 端の判定・切り出し範囲の計算に使うランドマークの visibility の下限
+MIN_VISIBILITY = 0.5
+# 切り出し範囲の辺の移動がこの割合（前の範囲の長辺に対する）を超えたら、Poseの追跡・平滑化の状態をリセットする
+ROI_RESET_SHIFT = 0.25
+
+
+class RoiTracker:
+    """
+    前フレームのランドマークから次フレームの切り出し範囲を決める
+
+    使い方:
+        tracker = RoiTracker()
+        results = tracker.process(pose, image_rgb)  # (33, 4) の配列（元画像の正規化座標）or None
+    """
+
+    def __init__(self, padding=None, max_area=None):
+        self.padding = ANALYSIS_ROI_PADDING if padding is None else padding
+        self.max_area = ANALYSIS_ROI_MAX_AREA if max_area is None else max_area
+        # 切り出し範囲 (x0, y0, x1, y1)（画素）。Noneの場合は全体画像で推論する
+        self.box = None
+        # 直前に推論した範囲（Poseの追跡・平滑化の状態がどの座標系のものか）。未推論なら False
+        self._state_box = False
+        self.cropped_frames = 0
+        self.full_frames = 0
+        self.fallbacks = 0
+        self.resets = 0
+
+    def reset(self):
+        self.box = None
+        self._state_box = False
+
+    def _infer(self, pose, image, box):
+        """box の範囲（Noneなら全体）で推論し、元画像の正規化座標のランドマークを返す"""
+        height, width = image.shape[:2]
+        if self._state_box is not False and self._needs_reset(box):
+            # 座標系が大きく変わるため、前の範囲での追跡・平滑化の状態を捨てる
+            reset_pose(pose)
+            self.resets += 1
+        self._state_box = box
+        if box is None:
+            self.full_frames += 1
+            results = pose.process(image)
+            if not results.pose_landmarks:
+                return None
+            return landmarks_to_array(results.pose_landmarks.landmark)
+
+        self.cropped_frames += 1
+        x0, y0, x1, y1 = box
+        crop = np.ascontiguousarray(image[y0:y1, x0:x1])
+        crop.flags.writeable = False
+        results = pose.process(crop)
+        if not results.pose_landmarks:
+            return None
+        landmarks = landmarks_to_array(results.pose_landmarks.landmark)
+        if self._touches_edge(landmarks):
+            return None
+        crop_width = x1 - x0
+        crop_height = y1 - y0
+        landmarks[:, 0] = (landmarks[:, 0] * crop_width + x0) / width
+        landmarks[:, 1] = (landmarks[:, 1] * crop_height + y0) / height
+        # zはx（画像の幅）と同じ尺度のため、幅の比で戻す
+        landmarks[:, 2] = landmarks[:, 2] * crop_width / width
+        return landmarks
+
+    def _needs_reset(self, box):
+        """直前に推論した範囲から box に変えるときに、Poseの状態をリセットするか"""
+        previous = self._state_box
+        if box == previous:
+            return False
+        if box is None or previous is None:
+            # 全体画像との切り替え
+            return True
+        size = max(previous[2] - previous[0], previous[3] - previous[1])
+        shift = max(abs(a - b) for a, b in zip(box, previous))
+        return shift > ROI_RESET_SHIFT * size
+
+    @staticmethod
+    def _visible(landmarks):
+        """visibility の高いランドマーク（なければ全点）"""
+        visible = landmarks[landmarks[:, 3] >= MIN_VISIBILITY]
+        return visible if len(visible) else landmarks
+
+    @staticmethod
+    def _touches_edge(landmarks):
+        """切り出し画像の正規化座標で、見えているランドマークが端にかかっている（はみ出している）か"""
+        xy = landmarks[landmarks[:, 3] >= MIN_VISIBILITY, :2]
+        return bool(np.any((xy < EDGE_MARGIN) | (xy > 1 - EDGE_MARGIN)))
+
+    def _next_box(self, landmarks, width, height):
+        """見えているランドマークの外接矩形に余白を付けた次の切り出し範囲（画像の大部分なら None）"""
+        visible = self._visible(landmarks)
+        xs = np.clip(visible[:, 0], 0.0, 1.0) * width
+        ys = np.clip(visible[:, 1], 0.0, 1.0) * height
+        left, right = float(np.min(xs)), float(np.max(xs))
+        top, bottom = float(np.min(ys)), float(np.max(ys))
+
+        if self.box is not None:
+            # 今の範囲の余白の内側（余白の半分まで）に収まっていれば動かさない
+            # （画像の端に接している辺は、それ以上広げられないので余白を求めない）
+            x0, y0, x1, y1 = self.box
+            margin = self.padding / 2 * max(x1 - x0, y1 - y0) / (1 + 2 * self.padding)
+            if ((x0 == 0 or left >= x0 + margin) and (x1 == width or right <= x1 - margin)
+                    and (y0 == 0 or top >= y0 + margin) and (y1 == height or bottom <= y1 - margin)):
+                return self.box
+
+        # 外接矩形の中心に、長辺＋余白の正方形を置く（画像からはみ出す分は内側にずらし、収まらなければ切り詰める）
+        size = int(np.ceil(max(right - left, bottom - top) * (1 + 2 * self.padding)))
+        x0 = min(max(0, int((left + right - size) / 2)), max(0, width - size))
+        y0 = min(max(0, int((top + bottom - size) / 2)), max(0, height - size))
+        x1 = min(width, x0 + size)
+        y1 = min(height, y0 + size)
+        if x1 - x0 < 16 or y1 - y0 < 16:
+            return None
+        if (x1 - x0) * (y1 - y0) > self.max_area * width * height:
+            return None
+        return (x0, y0, x1, y1)
+
+    def process(self, pose, image):
+        """
+        1フレームを推論
+
+        Returns:
+            np.ndarray: (33, 4) のランドマーク（元画像の正規化座標）、検出できなければNone
+        """
+        height, width = image.shape[:2]
+        landmarks = self._infer(pose, image, self.box)
+        if landmarks is None and self.box is not None:
+            # 切り出し範囲で見失った・はみ出した場合は、同じフレームを全体画像で推論し直す
+            self.fallbacks += 1
+            self.box = None
+            landmarks = self._infer(pose, image, None)
+        if landmarks is None:
+            self.box = None
+            return None
+        self.box = self._next_box(landmarks, width, height)
+        return landmarks
@@ -0,0 +1,114 @@
+"""
+Secret Manager の値のプロセス内キャッシュ
+
+LINEの送信のたびに Secret Manager からアクセストークンを取得すると、1通ごとに1〜2回のRPC
+（prod → latest の順に試行）がかかり、process_video の送信リトライの回数ぶん繰り返される。
+取得した値を一定時間（SECRET_CACHE_TTL_SECONDS）プロセス内に保持し、ジョブの処理中には取得しないようにする。
+
+- 同じキーを複数のスレッドが同時に取得しようとした場合、Secret Manager を呼ぶのは1スレッドだけで、残りはその結果を待つ
+- 期限の SECRET_CACHE_REFRESH_AHEAD_SECONDS 秒前を過ぎて参照された場合は、キャッシュの値を返しつつ
+  バックグラウンドのスレッドで取得し直す（期限切れで呼び出し側が待たされないようにする）
+- 取得し直しに失敗した場合は、期限切れの値をそのまま返す（Secret Manager の一時的な障害で送信を止めない）
+- ローテーションなどで値が無効になった場合（APIが401を返した場合）は、呼び出し側で invalidate() する
+"""
+
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# SECRET_CACHE_TTL_SECONDS: キャッシュの有効期間（秒、0の場合はキャッシュしない）
+# SECRET_CACHE_REFRESH_AHEAD_SECONDS: 期限のこの秒数前からバックグラウンドで取得し直す
+SECRET_CACHE_TTL_SECONDS = float(os.environ.get('SECRET_CACHE_TTL_SECONDS', '300'))
+SECRET_CACHE_REFRESH_AHEAD_SECONDS = float(os.environ.get('SECRET_CACHE_REFRESH_AHEAD_SECONDS', '60'))
+
+
+class SecretCache:
+    """
+    キーごとに fetch(key) の結果を保持する
+
+    使い方:
+        cache = SecretCache(fetch)
+        value = cache.get('LINE_CHANNEL_ACCESS_TOKEN')
+        cache.invalidate('LINE_CHANNEL_ACCESS_TOKEN')  # 401を受け取った場合
+    """
+
+    def __init__(self, fetch, ttl=None, refresh_ahead=None):
+        self.fetch = fetch
+        self.ttl = SECRET_CACHE_TTL_SECONDS if ttl is None else ttl
+        self.refresh_ahead = SECRET_CACHE_REFRESH_AHEAD_SECONDS if refresh_ahead is None else refresh_ahead
+        # {key: (値, 取得時刻)}
+        self._entries = {}
+        # キーごとのロック（同時取得の重複をなくす）
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def _key_lock(self, key):
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _fresh(self, key):
+        """有効期間内の (値, 取得時刻)、なければNone"""
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[1] < self.ttl:
+            return entry
+        return None
+
+    def _load(self, key):
+        """fetch して保存（キーのロックを持った状態で呼ぶ）。失敗した場合、期限切れの値があればそれを返す"""
+        try:
+            value = self.fetch(key)
+        except Exception as e:
+            stale = self._entries.get(key)
+            if stale is None:
+                raise
+            logger.warning(f"⚠️ シークレットの再取得に失敗したため、期限切れの値を使用します ({key}): {str(e)}")
+            return stale[0]
+        self._entries[key] = (value, time.monotonic())
+        return value
+
+    def _refresh(self, key, lock):
+        try:
+            self.refreshes += 1
+            self._load(key)
+        except Exception as e:
+            logger.warning(f"⚠️ シークレットのバックグラウンド更新に失敗 ({key}): {str(e)}")
+        finally:
+            lock.release()
+
+    def get(self, key):
+        """キャッシュの値（なければ・期限切れなら取得して返す）"""
+        if self.ttl <= 0:
+            return self.fetch(key)
+
+        entry = self._fresh(key)
+        if entry is not None:
+            self.hits += 1
+            if time.monotonic() - entry[1] >= self.ttl - self.refresh_ahead:
+                lock = self._key_lock(key)
+                # 取得中のスレッドがあれば任せる（ロックはバックグラウンドのスレッドが解放する）
+                if lock.acquire(blocking=False):
+                    threading.Thread(target=self._refresh, args=(key, lock), daemon=True).start()
+            return entry[0]
+
+        with self._key_lock(key):
+            # 待っている間に別のスレッドが取得していればそれを使う
+            entry = self._fresh(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return self._load(key)
+
+    def invalidate(self, key):
+        """キャッシュの値を破棄（次の get で取得し直す）"""
+        with self._lock:
+            self._entries.pop(key, None)
@@ -0,0 +1,123 @@
+"""
+処理工程ごとの所要時間の計測
+
+ジョブが遅かったときに、ダウンロード・デコード・色変換・推論・スコアリング・Dify・LINEの
+どこで時間がかかったかを後から確認できるよう、工程ごとの合計時間と、
+フレーム単位の工程は1フレームあたりの時間の分布（p50 / p95 / 最大）を記録する。
+計測は time.perf_counter() を呼んで加算するだけなので、フレームごとに使ってもほぼ負荷はない。
+
+分布は1回ごとの時間を残さず、対数目盛りの固定長のヒストグラム（1桁を BUCKETS_PER_DECADE 分割）で持つ。
+メモリ使用量は動画の長さによらず、パーセンタイルの誤差はバケット幅の半分（約6%）以内になる。
+"""
+
+import math
+import time
+from contextlib import contextmanager
+import numpy as np
+
+# ヒストグラムの範囲（1マイクロ秒〜100秒）と細かさ。範囲外は両端のバケットに入れる
+HISTOGRAM_MIN_SECONDS = 1e-6
+HISTOGRAM_DECADES = 8
+BUCKETS_PER_DECADE = 20
+NUM_BUCKETS = HISTOGRAM_DECADES * BUCKETS_PER_DECADE
+
+
+def _bucket(seconds):
+    """時間（秒）が入るヒストグラムのバケット番号"""
+    if seconds <= HISTOGRAM_MIN_SECONDS:
+        return 0
+    index = int(math.log10(seconds / HISTOGRAM_MIN_SECONDS) * BUCKETS_PER_DECADE)
+    return min(index, NUM_BUCKETS - 1)
+
+
+def _bucket_seconds(index):
+    """バケットの代表値（対数目盛りでの中央）"""
+    return HISTOGRAM_MIN_SECONDS * 10 ** ((index + 0.5) / BUCKETS_PER_DECADE)
+
+
+class StageTimer:
+    """
+    工程ごとの所要時間を集計する
+
+    使い方:
+        timer = StageTimer()
+        with timer.stage('download'):
+            ...
+        timer.add_frame('inference', seconds)  # フレーム単位の工程
+        timer.summary()  # {'download': {'total_ms': ..., 'count': 1}, 'inference': {..., 'p50_ms': ...}}
+    """
+
+    def __init__(self):
+        self.totals = {}
+        self.counts = {}
+        # フレーム単位の工程の1回ごとの時間の分布（NUM_BUCKETS 個のバケットの回数）と最大値（秒）
+        self.histograms = {}
+        self.maximums = {}
+
+    @contextmanager
+    def stage(self, name):
+        """with ブロック全体の時間を name に加算"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.totals[name] = self.totals.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def add_frame(self, name, seconds):
+        """フレーム単位の工程の1回分を加算（分布も記録する）"""
+        self.add(name, seconds)
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = np.zeros(NUM_BUCKETS, dtype=np.int64)
+        histogram[_bucket(seconds)] += 1
+        if seconds > self.maximums.get(name, 0.0):
+            self.maximums[name] = seconds
+
+    def state(self):
+        """別プロセスから返すための集計値（dict、pickle可能）"""
+        return {'totals': self.totals, 'counts': self.counts,
+                'histograms': self.histograms, 'maximums': self.maximums}
+
+    def merge(self, state):
+        """state() で受け取った別プロセスの集計値を合算"""
+        for name, seconds in state['totals'].items():
+            self.totals[name] = self.totals.get(name, 0.0) + seconds
+            self.counts[name] = self.counts.get(name, 0) + state['counts'][name]
+        for name, histogram in state['histograms'].items():
+            if name in self.histograms:
+                self.histograms[name] = self.histograms[name] + histogram
+            else:
+                self.histograms[name] = np.array(histogram, dtype=np.int64)
+        for name, seconds in state['maximums'].items():
+            self.maximums[name] = max(self.maximums.get(name, 0.0), seconds)
+
+    def percentile(self, name, q):
+        """フレーム単位の工程の q パーセンタイル（秒、ヒストグラムからの推定値）。記録がなければNone"""
+        histogram = self.histograms.get(name)
+        if histogram is None or not histogram.any():
+            return None
+        cumulative = np.cumsum(histogram)
+        index = int(np.searchsorted(cumulative, cumulative[-1] * q / 100, side='left'))
+        # 代表値が実測の最大値を超えないようにする（1回しか記録がない場合など）
+        return min(_bucket_seconds(index), self.maximums[name])
+
+    def summary(self):
+        """
+        工程ごとの集計（ミリ秒）
+
+        Returns:
+            dict: {工程名: {'total_ms', 'count'}}。フレーム単位の工程は 'p50_ms' / 'p95_ms' / 'max_ms' も含む
+        """
+        result = {}
+        for name, seconds in self.totals.items():
+            entry = {'total_ms': round(seconds * 1000, 2), 'count': self.counts[name]}
+            if name in self.histograms:
+                entry['p50_ms'] = round(self.percentile(name, 50) * 1000, 2)
+                entry['p95_ms'] = round(self.percentile(name, 95) * 1000, 2)
+                entry['max_ms'] = round(self.maximums[name] * 1000, 2)
+            result[name] = entry
+        return result
@@ -0,0 +1,30 @@
+"""
+functions/ のモジュールはデプロイ先と同じくフラットに import する（from landmark_format import ...）ため、
+テストからも functions/ を import パスに入れる。
+
+実行: cd functions && python -m pytest tests
+"""
+
+import os
+import sys
+import pytest
+
+FUNCTIONS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(os.path.dirname(FUNCTIONS_DIR), 'bench')
+
+sys.path.insert(0, FUNCTIONS_DIR)
+
+
+@pytest.fixture
+def synthetic_clip(tmp_path):
+    """bench/synthetic.py の合成動画を tmp_path に作る関数（MediaPipeがなければスキップ）"""
+    pytest.importorskip('mediapipe')
+    sys.path.insert(0, BENCH_DIR)
+    try:
+        from synthetic import ensure_clip
+    finally:
+        sys.path.remove(BENCH_DIR)
+
+    def make(width=320, height=240, seconds=2.0, **kwargs):
+        return ensure_clip(str(tmp_path), width, height, seconds, **kwargs)
+    return make
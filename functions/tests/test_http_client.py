@@ -0,0 +1,107 @@
+"""http_client: 既定のタイムアウト、接続の確立だけのリトライ、接続の使い回し"""
+
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+import urllib3
+import http_client
+
+
+@pytest.fixture(autouse=True)
+def fresh_pools(monkeypatch):
+    """テストごとにコネクションプールとスレッドごとのセッションを作り直す"""
+    monkeypatch.setattr(http_client, '_adapters', {})
+    monkeypatch.setattr(http_client, '_local', threading.local())
+
+
+class Server:
+    """POSTの回数を数え、status を返す（drop=True の場合は応答せずに接続を切る）ローカルHTTPサーバー"""
+
+    def __init__(self, status=200, drop=False):
+        self.status = status
+        self.drop = drop
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                server.requests += 1
+                if server.drop:
+                    self.close_connection = True
+                    return
+                body = b'ok'
+                self.send_response(server.status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_default_timeout_is_set(monkeypatch):
+    calls = []
+    monkeypatch.setattr(requests.Session, 'request', lambda self, method, url, **kwargs: calls.append(kwargs))
+    http_client.post('http://example.invalid/a', json={})
+    http_client.post('http://example.invalid/a', json={}, timeout=3)
+    assert calls[0]['timeout'] == (http_client.HTTP_CONNECT_TIMEOUT, http_client.HTTP_READ_TIMEOUT)
+    assert calls[1]['timeout'] == 3
+
+
+def test_connection_failures_are_retried(monkeypatch):
+    attempts = []
+    new_conn = urllib3.connection.HTTPConnection._new_conn
+
+    def counting_new_conn(self):
+        attempts.append(self.port)
+        return new_conn(self)
+
+    monkeypatch.setattr(urllib3.connection.HTTPConnection, '_new_conn', counting_new_conn)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http_client.post(f"http://127.0.0.1:{closed_port()}/", json={})
+    assert len(attempts) == 1 + http_client.HTTP_CONNECT_RETRIES
+
+
+def test_error_status_is_not_retried():
+    with Server(status=503) as server:
+        response = http_client.post(server.url, json={})
+    assert response.status_code == 503
+    assert server.requests == 1
+
+
+def test_request_that_reached_the_server_is_not_retried():
+    with Server(drop=True) as server:
+        with pytest.raises(requests.exceptions.ConnectionError):
+            http_client.post(server.url, json={})
+    assert server.requests == 1
+
+
+def test_connections_are_reused():
+    with Server() as server:
+        for _ in range(3):
+            assert http_client.post(server.url, json={}).status_code == 200
+    [stats] = http_client.pool_stats().values()
+    assert stats == {'requests': 3, 'new_connections': 1, 'reused': 2}
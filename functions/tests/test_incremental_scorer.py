@@ -0,0 +1,67 @@
+"""analyze.IncrementalScorer が compute_scores と同じスコアを返すか"""
+
+import numpy as np
+import pytest
+from analyze import IncrementalScorer, compute_scores
+
+
+def random_sequence(frames, seed):
+    """立ち姿勢の周りで関節が少しずつ動くランドマーク列（どのスコアも上限・下限に張り付かない）"""
+    rng = np.random.default_rng(seed)
+    base = rng.uniform(0.4, 0.6, (33, 4)).astype(np.float32)
+    for index, (x, y) in {11: (0.45, 0.30), 12: (0.55, 0.30), 15: (0.42, 0.36), 16: (0.58, 0.34),
+                          23: (0.47, 0.55), 24: (0.53, 0.55), 27: (0.46, 0.90), 28: (0.54, 0.90)}.items():
+        base[index, :2] = (x, y)
+    landmarks = np.repeat(base[None], frames, axis=0)
+    landmarks[:, :, :3] += np.cumsum(rng.normal(0, 0.004, (frames, 33, 3)), axis=0).astype(np.float32)
+    # 途中で右足を腰の近くまで上げる（キック）
+    kick = slice(frames // 3, frames // 3 + max(1, frames // 10))
+    landmarks[kick, 28, 1] = 0.48 + rng.uniform(0, 0.03)
+    return list(landmarks)
+
+
+def score_incrementally(sequence, sample_fps):
+    scorer = IncrementalScorer(sample_fps)
+    for landmarks in sequence:
+        scorer.update(landmarks)
+    return scorer.scores()
+
+
+@pytest.mark.parametrize('frames, seed', [(1, 0), (2, 1), (30, 2), (300, 3)])
+def test_matches_compute_scores(frames, seed):
+    sequence = random_sequence(frames, seed)
+    assert score_incrementally(sequence, 15.0) == compute_scores(np.stack(sequence), 15.0)
+
+
+def test_empty_sequence_matches():
+    assert IncrementalScorer(30.0).scores() == compute_scores(np.zeros((0, 33, 4), dtype=np.float32), 30.0)
+
+
+def test_reused_frames_match_repeated_landmarks():
+    # モーションゲートは静止フレームで直前と同じ配列オブジェクトを返す
+    frames = random_sequence(40, 4)
+    sequence = []
+    for i, landmarks in enumerate(frames):
+        sequence.append(landmarks)
+        if i % 3 == 0:
+            sequence.extend([landmarks] * 4)
+    assert sum(a is b for a, b in zip(sequence, sequence[1:])) > 0
+
+    expected = compute_scores(np.stack(sequence), 30.0)
+    assert score_incrementally(sequence, 30.0) == expected
+
+
+def test_equal_but_distinct_arrays_match_repeated_landmarks():
+    # 値が同じでも別の配列なら通常のフレームとして計算され、結果は同じになる
+    frames = random_sequence(20, 5)
+    sequence = [landmarks.copy() for landmarks in frames for _ in range(3)]
+    assert score_incrementally(sequence, 30.0) == compute_scores(np.stack(sequence), 30.0)
+
+
+def test_provisional_scores_match_prefix():
+    sequence = random_sequence(120, 6)
+    scorer = IncrementalScorer(15.0)
+    for count, landmarks in enumerate(sequence, start=1):
+        scorer.update(landmarks)
+        if count % 30 == 0:
+            assert scorer.scores() == compute_scores(np.stack(sequence[:count]), 15.0)
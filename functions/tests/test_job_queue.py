@@ -0,0 +1,146 @@
+"""job_queue のメモリ・SQLiteキューの貸し出し（lease / ack / nack / renew）とワーカー"""
+
+import pytest
+from job_queue import MemoryQueue, QueueWorkerPool, SqliteQueue
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_queue(request, tmp_path):
+    def make(max_attempts=3):
+        if request.param == 'memory':
+            return MemoryQueue(max_attempts=max_attempts)
+        return SqliteQueue(path=str(tmp_path / 'queue.sqlite3'), max_attempts=max_attempts)
+    return make
+
+
+# 期限切れを待たずに試すための、取り出した時点で期限が切れている貸し出し
+EXPIRED = -1
+
+
+def test_enqueue_ignores_duplicate_job_ids(make_queue):
+    queue = make_queue()
+    assert queue.enqueue('job', {'name': 'videos/u/1.mp4'})
+    assert not queue.enqueue('job', {'name': 'videos/u/1.mp4'})
+    assert queue.stats() == {'queued': 1}
+
+
+def test_lease_hands_out_each_job_once(make_queue):
+    queue = make_queue()
+    queue.enqueue('a', {'n': 1})
+    queue.enqueue('b', {'n': 2})
+
+    first = queue.lease(60)
+    second = queue.lease(60)
+    assert (first.job_id, first.payload, first.attempts) == ('a', {'n': 1}, 1)
+    assert second.job_id == 'b'
+    assert first.token != second.token
+    assert queue.lease(60) is None
+
+
+def test_ack_completes_job(make_queue):
+    queue = make_queue()
+    queue.enqueue('a', {})
+    lease = queue.lease(60)
+    assert queue.ack(lease, {'status': 'success'})
+    assert queue.stats() == {'done': 1}
+    assert queue.lease(EXPIRED) is None
+    # 完了済みのジョブへの ack / nack / renew は無視される
+    assert not queue.ack(lease)
+    assert not queue.nack(lease, 'late')
+    assert not queue.renew(lease, 60)
+
+
+def test_ack_and_nack_require_current_token(make_queue):
+    queue = make_queue()
+    queue.enqueue('a', {})
+    lease = queue.lease(60)
+    forged = lease._replace(token='someone-else')
+    assert not queue.ack(forged)
+    assert not queue.nack(forged, 'error')
+    assert not queue.renew(forged, 60)
+    assert queue.stats() == {'leased': 1}
+
+
+def test_nack_requeues_until_max_attempts(make_queue):
+    queue = make_queue(max_attempts=2)
+    queue.enqueue('a', {})
+
+    lease = queue.lease(60)
+    assert queue.nack(lease, 'transient')
+    assert queue.stats() == {'queued': 1}
+
+    lease = queue.lease(60)
+    assert lease.attempts == 2
+    assert queue.nack(lease, 'transient')
+    assert queue.stats() == {'failed': 1}
+    assert queue.lease(60) is None
+
+
+def test_expired_lease_is_reclaimed_and_old_token_is_rejected(make_queue):
+    queue = make_queue()
+    queue.enqueue('a', {})
+    crashed = queue.lease(EXPIRED)
+
+    reclaimed = queue.lease(60)
+    assert reclaimed.job_id == 'a'
+    assert reclaimed.attempts == 2
+    assert reclaimed.token != crashed.token
+
+    # 期限切れ後に戻ってきた元のワーカーの操作は無視され、引き継いだワーカーの ack が有効
+    assert not queue.renew(crashed, 60)
+    assert not queue.ack(crashed)
+    assert queue.ack(reclaimed)
+    assert queue.stats() == {'done': 1}
+
+
+def test_renew_keeps_lease_from_being_reclaimed(make_queue):
+    queue = make_queue()
+    queue.enqueue('a', {})
+    lease = queue.lease(EXPIRED)
+    assert queue.renew(lease, 60)
+    assert queue.lease(60) is None
+    assert queue.ack(lease)
+
+
+def test_job_fails_after_too_many_expired_leases(make_queue):
+    queue = make_queue(max_attempts=2)
+    queue.enqueue('a', {})
+    queue.lease(EXPIRED)
+    queue.lease(EXPIRED)
+    assert queue.lease(60) is None
+    assert queue.stats() == {'failed': 1}
+
+
+def test_worker_acks_result_and_passes_lease_to_handler(make_queue):
+    queue = make_queue()
+    queue.enqueue('a', {'name': 'videos/u/1.mp4'})
+    seen = []
+
+    def handler(lease):
+        seen.append((lease.job_id, lease.payload, lease.token is not None))
+        return {'status': 'success'}
+
+    pool = QueueWorkerPool(queue, handler, workers=1, lease_seconds=60)
+    assert pool.run_once()
+    assert not pool.run_once()
+    assert seen == [('a', {'name': 'videos/u/1.mp4'}, True)]
+    assert (pool.processed, pool.failed) == (1, 0)
+    assert queue.stats() == {'done': 1}
+
+
+def test_worker_nacks_when_handler_raises(make_queue):
+    queue = make_queue(max_attempts=2)
+    queue.enqueue('a', {})
+    attempts = []
+
+    def handler(lease):
+        attempts.append(lease.attempts)
+        raise RuntimeError('download failed')
+
+    pool = QueueWorkerPool(queue, handler, workers=1, lease_seconds=60)
+    assert pool.run_once()
+    assert queue.stats() == {'queued': 1}
+    assert pool.run_once()
+    assert attempts == [1, 2]
+    assert pool.failed == 2
+    assert queue.stats() == {'failed': 1}
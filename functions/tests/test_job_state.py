@@ -0,0 +1,120 @@
+"""job_state: JobStateWriter の書き込みのまとめ方と、AsyncClient の後始末"""
+
+import asyncio
+from types import SimpleNamespace
+import pytest
+
+firestore = pytest.importorskip('google.cloud.firestore')
+grpc = pytest.importorskip('grpc')
+from google.auth.credentials import AnonymousCredentials
+from job_state import JobStateWriter, close_async_client
+
+
+class FakeBatch:
+    def __init__(self, client):
+        self.client = client
+        self.writes = []
+
+    def set(self, doc_ref, fields, merge=False):
+        self.writes.append((doc_ref.path, fields, merge))
+
+    def commit(self):
+        self.client.commits.append(self.writes)
+
+
+class FakeAsyncBatch(FakeBatch):
+    async def commit(self):
+        super().commit()
+
+
+class FakeClient:
+    """batch() で作った WriteBatch の commit ごとに、その書き込みを commits に記録する"""
+
+    def __init__(self, batch_class=FakeBatch):
+        self.batch_class = batch_class
+        self.commits = []
+
+    def batch(self):
+        return self.batch_class(self)
+
+
+def doc(path):
+    return SimpleNamespace(path=path)
+
+
+def test_writes_are_held_until_a_durable_write():
+    client = FakeClient()
+    writer = JobStateWriter(client)
+    job = doc('jobs/a')
+    writer.set(job, {'line_send_failed': True})
+    writer.set(doc('video_jobs/a'), {'notification_sent': True})
+    assert client.commits == []
+    assert writer.pending
+
+    writer.set(job, {'status': 'completed'}, durable=True)
+    assert len(client.commits) == 1
+    assert writer.commits == 1
+    assert not writer.pending
+    writes = {path: (fields, merge) for path, fields, merge in client.commits[0]}
+    # 同じドキュメントへの更新は1件の merge set にまとまり、updated_at が付く
+    assert writes == {
+        'jobs/a': ({'line_send_failed': True, 'status': 'completed',
+                    'updated_at': firestore.SERVER_TIMESTAMP}, True),
+        'video_jobs/a': ({'notification_sent': True, 'updated_at': firestore.SERVER_TIMESTAMP}, True),
+    }
+
+
+def test_later_value_wins_for_the_same_field():
+    client = FakeClient()
+    writer = JobStateWriter(client)
+    writer.set(doc('jobs/a'), {'status': 'processing', 'attempt': 1})
+    writer.set(doc('jobs/a'), {'status': 'completed'})
+    writer.flush()
+    [[(_, fields, _)]] = client.commits
+    assert fields['status'] == 'completed'
+    assert fields['attempt'] == 1
+
+
+def test_flush_without_pending_writes_does_not_commit():
+    client = FakeClient()
+    writer = JobStateWriter(client)
+    writer.flush()
+    writer.set(doc('jobs/a'), {'status': 'completed'}, durable=True)
+    writer.flush()
+    assert len(client.commits) == 1
+    assert writer.commits == 1
+
+
+def test_flush_async_commits_once():
+    client = FakeClient(FakeAsyncBatch)
+    writer = JobStateWriter(client)
+    writer.set(doc('video_jobs/a'), {'notification_sent': True})
+    asyncio.run(writer.flush_async())
+    writer.set(doc('jobs/a'), {'status': 'completed'})
+    asyncio.run(writer.flush_async())
+    asyncio.run(writer.flush_async())
+    assert [[path for path, _, _ in writes] for writes in client.commits] == [['video_jobs/a'], ['jobs/a']]
+
+
+def async_client():
+    return firestore.AsyncClient(project='test-project', credentials=AnonymousCredentials())
+
+
+def test_close_async_client_shuts_down_grpc_channel():
+    async def run():
+        client = async_client()
+        channel = client._firestore_api.transport.grpc_channel
+        assert channel.get_state() != grpc.ChannelConnectivity.SHUTDOWN
+        await close_async_client(client)
+        return channel.get_state()
+
+    assert asyncio.run(run()) == grpc.ChannelConnectivity.SHUTDOWN
+
+
+def test_close_async_client_without_requests_does_not_open_channel():
+    async def run():
+        client = async_client()
+        await close_async_client(client)
+        return client
+
+    assert asyncio.run(run())._firestore_api_internal is None
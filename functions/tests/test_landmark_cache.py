@@ -0,0 +1,106 @@
+"""landmark_cache のローカル保存とLRU削除"""
+
+import os
+import importlib
+import numpy as np
+import pytest
+import landmark_cache
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(landmark_cache, 'LANDMARK_CACHE_ENABLED', True)
+    monkeypatch.setattr(landmark_cache, 'LANDMARK_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(landmark_cache, 'LANDMARK_CACHE_BUCKET', '')
+    monkeypatch.setattr(landmark_cache, 'LANDMARK_CACHE_MAX_MB', 1024)
+    return tmp_path
+
+
+def sample_landmarks(frames=50, seed=0):
+    return np.random.default_rng(seed).random((frames, 33, 4), dtype=np.float32)
+
+
+def set_last_used(key, timestamp):
+    os.utime(landmark_cache._local_path(key), (timestamp, timestamp))
+
+
+def test_store_and_load_round_trip(cache_dir):
+    landmarks = sample_landmarks()
+    frame_indices = np.arange(0, 100, 2)
+    landmark_cache.store('a', landmarks, frame_indices, 15.0)
+
+    entry = landmark_cache.load('a')
+    np.testing.assert_array_equal(entry['landmarks'], landmarks)
+    np.testing.assert_array_equal(entry['frame_indices'], frame_indices)
+    assert entry['sample_fps'] == 15.0
+
+
+def test_missing_key_returns_none(cache_dir):
+    assert landmark_cache.load('missing') is None
+
+
+def test_disabled_cache_neither_stores_nor_loads(cache_dir, monkeypatch):
+    monkeypatch.setattr(landmark_cache, 'LANDMARK_CACHE_ENABLED', False)
+    landmark_cache.store('a', sample_landmarks(), np.arange(50), 30.0)
+    assert not os.listdir(cache_dir)
+    assert landmark_cache.load('a') is None
+
+
+def test_corrupt_entry_is_discarded(cache_dir):
+    with open(landmark_cache._local_path('broken'), 'wb') as f:
+        f.write(b'not an npz')
+    assert landmark_cache.load('broken') is None
+    assert not os.path.exists(landmark_cache._local_path('broken'))
+
+
+def test_eviction_removes_least_recently_used(cache_dir, monkeypatch):
+    landmark_cache.store('a', sample_landmarks(seed=1), np.arange(50), 30.0)
+    entry_size = os.path.getsize(landmark_cache._local_path('a'))
+    # 2件分だけ入る上限
+    monkeypatch.setattr(landmark_cache, 'LANDMARK_CACHE_MAX_MB', 2.5 * entry_size / 1024 / 1024)
+
+    landmark_cache.store('b', sample_landmarks(seed=2), np.arange(50), 30.0)
+    set_last_used('a', 1000)
+    set_last_used('b', 2000)
+
+    # 読み込むと最終利用時刻が更新され、a のほうが新しくなる
+    assert landmark_cache.load('a') is not None
+    landmark_cache.store('c', sample_landmarks(seed=3), np.arange(50), 30.0)
+
+    assert landmark_cache.load('b') is None
+    assert landmark_cache.load('a') is not None
+    assert landmark_cache.load('c') is not None
+
+
+def test_eviction_keeps_total_under_budget(cache_dir, monkeypatch):
+    landmark_cache.store('k0', sample_landmarks(seed=0), np.arange(50), 30.0)
+    entry_size = os.path.getsize(landmark_cache._local_path('k0'))
+    monkeypatch.setattr(landmark_cache, 'LANDMARK_CACHE_MAX_MB', 3.5 * entry_size / 1024 / 1024)
+
+    for i in range(1, 8):
+        set_last_used(f"k{i - 1}", 1000 + i)
+        landmark_cache.store(f"k{i}", sample_landmarks(seed=i), np.arange(50), 30.0)
+
+    remaining = sorted(name for name in os.listdir(cache_dir) if name.endswith('.npz'))
+    assert remaining == ['k5.npz', 'k6.npz', 'k7.npz']
+    assert not [name for name in os.listdir(cache_dir) if name.endswith('.tmp')]
+
+
+def test_cache_key_depends_on_hash_and_settings():
+    settings = {'profile': 'default', 'stride': 2}
+    key = landmark_cache.make_cache_key('abc==', settings)
+    assert key == landmark_cache.make_cache_key('abc==', dict(reversed(list(settings.items()))))
+    assert key != landmark_cache.make_cache_key('abd==', settings)
+    assert key != landmark_cache.make_cache_key('abc==', {**settings, 'stride': 3})
+
+
+def test_cache_is_disabled_unless_enabled_explicitly(monkeypatch):
+    monkeypatch.delenv('LANDMARK_CACHE_ENABLED', raising=False)
+    monkeypatch.delenv('LANDMARK_CACHE_MAX_MB', raising=False)
+    module = importlib.reload(landmark_cache)
+    try:
+        assert module.LANDMARK_CACHE_ENABLED is False
+        assert module.LANDMARK_CACHE_MAX_MB == 64
+    finally:
+        monkeypatch.undo()
+        importlib.reload(landmark_cache)
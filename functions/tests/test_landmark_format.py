@@ -0,0 +1,172 @@
+"""landmark_format の書き出し・読み込みと量子化誤差"""
+
+import gzip
+import json
+import numpy as np
+import pytest
+import landmark_format
+from landmark_format import (
+    COORD_SCALE, VISIBILITY_SCALE, decode_quantized, encode_quantized, load_landmarks, open_landmark_writer,
+    read_landmark_file, unpack_header, write_landmark_file, write_landmarks,
+)
+
+# 量子化の丸め誤差の上限（半刻み + float32の誤差）
+COORD_TOLERANCE = 0.5 / COORD_SCALE + 1e-6
+VISIBILITY_TOLERANCE = 0.5 / VISIBILITY_SCALE + 1e-6
+
+
+def sample_landmarks(frames=40, seed=0, spread=1.0):
+    rng = np.random.default_rng(seed)
+    landmarks = np.empty((frames, 33, 4), dtype=np.float32)
+    landmarks[..., :3] = rng.uniform(-spread, spread, (frames, 33, 3))
+    landmarks[..., 3] = rng.uniform(0, 1, (frames, 33))
+    return landmarks
+
+
+def sample_frame_indices(frames=40, stride=3, start=5):
+    return np.arange(start, start + frames * stride, stride, dtype=np.int32)
+
+
+def write_frames(path, landmarks, frame_indices, fps=29.97, flush_every=7):
+    with open_landmark_writer(str(path), fps, 640, 360, flush_every=flush_every) as writer:
+        for frame_index, points in zip(frame_indices.tolist(), landmarks):
+            writer.append_points(points, frame_index)
+
+
+def test_lmk_round_trip_is_exact(tmp_path):
+    landmarks = sample_landmarks()
+    frame_indices = sample_frame_indices()
+    path = tmp_path / 'out.lmk'
+    write_landmarks(str(path), landmarks, frame_indices, 29.97, 640, 360)
+
+    for mmap in (True, False):
+        data = load_landmarks(str(path), mmap=mmap)
+        np.testing.assert_array_equal(data['landmarks'], landmarks)
+        np.testing.assert_array_equal(data['frame_indices'], frame_indices)
+        assert (data['fps'], data['width'], data['height']) == (29.97, 640, 360)
+
+
+def test_lmk_ignores_truncated_trailing_record(tmp_path):
+    landmarks = sample_landmarks(frames=10)
+    path = tmp_path / 'out.lmk'
+    write_landmarks(str(path), landmarks, np.arange(10), 30.0)
+    with open(path, 'ab') as f:
+        f.write(b'\x00' * 100)
+
+    data = load_landmarks(str(path))
+    assert data['landmarks'].shape == (10, 33, 4)
+    np.testing.assert_array_equal(data['landmarks'], landmarks)
+
+
+def test_unpack_header_rejects_other_files():
+    with pytest.raises(ValueError):
+        unpack_header(b'JUNK' + b'\x00' * 60)
+    with pytest.raises(ValueError):
+        unpack_header(b'LMK1')
+
+
+@pytest.mark.parametrize('suffix', ['.lmk', '.jsonl', '.json'])
+def test_streaming_writers_round_trip_exactly(tmp_path, suffix):
+    landmarks = sample_landmarks()
+    frame_indices = sample_frame_indices()
+    path = tmp_path / f"out{suffix}"
+    write_frames(path, landmarks, frame_indices)
+
+    data = read_landmark_file(str(path))
+    np.testing.assert_array_equal(data['landmarks'], landmarks)
+    np.testing.assert_array_equal(data['frame_indices'], frame_indices)
+    if suffix != '.json':
+        # 従来形式のJSONにはfps・解像度が含まれない
+        assert (data['fps'], data['width'], data['height']) == (29.97, 640, 360)
+
+
+def test_json_output_matches_legacy_layout(tmp_path):
+    landmarks = sample_landmarks(frames=2)
+    path = tmp_path / 'out.json'
+    write_frames(path, landmarks, np.array([0, 1]))
+
+    with open(path) as f:
+        frames = json.load(f)
+    assert [frame['frame'] for frame in frames] == [1, 2]
+    assert set(frames[0]['landmarks'][0]) == {'x', 'y', 'z', 'visibility'}
+    assert len(frames[0]['landmarks']) == 33
+
+
+@pytest.mark.parametrize('suffix', ['.lmq', '.lmq.gz'])
+def test_quantized_writers_stay_within_quantization_error(tmp_path, suffix):
+    landmarks = sample_landmarks()
+    frame_indices = sample_frame_indices()
+    path = tmp_path / f"out{suffix}"
+    write_frames(path, landmarks, frame_indices)
+
+    data = read_landmark_file(str(path))
+    np.testing.assert_array_equal(data['frame_indices'], frame_indices)
+    assert np.abs(data['landmarks'][..., :3] - landmarks[..., :3]).max() <= COORD_TOLERANCE
+    assert np.abs(data['landmarks'][..., 3] - landmarks[..., 3]).max() <= VISIBILITY_TOLERANCE
+    assert data['fps'] == pytest.approx(29.97, rel=1e-6)
+    assert (data['width'], data['height']) == (640, 360)
+
+
+def test_quantized_deltas_survive_wraparound():
+    # ±1.9 の間を行き来すると、隣接フレームの差分が int16 の範囲を超えて桁あふれする
+    landmarks = sample_landmarks(frames=20, seed=1, spread=1.9)
+    landmarks[1::2, :, :3] = -landmarks[1::2, :, :3]
+    frame_indices = np.arange(20)
+
+    data = decode_quantized(encode_quantized(landmarks, frame_indices, 30.0))
+    assert np.abs(data['landmarks'][..., :3] - landmarks[..., :3]).max() <= COORD_TOLERANCE
+    np.testing.assert_array_equal(data['frame_indices'], frame_indices)
+
+
+def test_encode_quantized_matches_streaming_writer(tmp_path):
+    landmarks = sample_landmarks()
+    frame_indices = sample_frame_indices()
+    path = tmp_path / 'out.lmq'
+    write_frames(path, landmarks, frame_indices, fps=30.0)
+
+    with open(path, 'rb') as f:
+        assert f.read() == encode_quantized(landmarks, frame_indices, 30.0, 640, 360)
+
+
+def test_truncated_gzip_stream_is_readable_up_to_last_flush(tmp_path):
+    landmarks = sample_landmarks(frames=14)
+    path = tmp_path / 'out.lmq.gz'
+    writer = open_landmark_writer(str(path), 30.0, flush_every=7)
+    for frame_index, points in enumerate(landmarks):
+        writer.append_points(points, frame_index)
+    # close() せずに読む（処理が途中で落ちた場合）
+    data = read_landmark_file(str(path))
+    assert data['landmarks'].shape[0] == 14
+    writer.close()
+
+
+def test_decode_accepts_gzip_bytes():
+    landmarks = sample_landmarks(frames=5)
+    payload = encode_quantized(landmarks, np.arange(5), 30.0)
+    assert decode_quantized(gzip.compress(payload))['landmarks'].shape == (5, 33, 4)
+
+
+def test_frame_indices_must_increase():
+    with pytest.raises(ValueError):
+        encode_quantized(sample_landmarks(frames=3), [0, 2, 1], 30.0)
+
+
+def test_quantize_clips_out_of_range_values():
+    landmarks = np.zeros((1, 33, 4), dtype=np.float32)
+    landmarks[0, 0] = (5.0, -5.0, 0.0, 1.5)
+    coords, visibility = landmark_format.quantize(landmarks)
+    assert coords[0, 0].tolist() == [32767, -32768, 0]
+    assert visibility[0, 0] == 255
+
+
+def test_write_landmark_file_converts_between_formats(tmp_path):
+    landmarks = sample_landmarks()
+    frame_indices = sample_frame_indices()
+    source = tmp_path / 'in.lmk'
+    write_landmarks(str(source), landmarks, frame_indices, 25.0, 1280, 720)
+
+    destination = tmp_path / 'out.jsonl'
+    write_landmark_file(str(destination), read_landmark_file(str(source)))
+    data = read_landmark_file(str(destination))
+    np.testing.assert_array_equal(data['landmarks'], landmarks)
+    assert (data['fps'], data['width'], data['height']) == (25.0, 1280, 720)
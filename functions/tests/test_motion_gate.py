@@ -0,0 +1,46 @@
+"""MotionGate の使い回しの判定と、動いている動画でスコアが変わらないこと"""
+
+import numpy as np
+from motion_gate import MotionGate
+
+
+def frame(x):
+    """x の位置に白い四角がある画像"""
+    image = np.zeros((128, 128, 3), dtype=np.uint8)
+    image[40:80, x:x + 20] = 255
+    return image
+
+
+def test_skips_only_after_min_static_frames():
+    gate = MotionGate(threshold=0.002, pixel_diff=8, max_skip=100, min_static=3)
+    static = [gate.is_static(frame(10)) for _ in range(8)]
+    # 1枚目は基準、続く3枚は動きなしでも推論する
+    assert static == [False, False, False, False, True, True, True, True]
+    assert gate.inferred_frames == 4
+    assert gate.skipped_frames == 4
+
+
+def test_brief_pause_in_motion_is_inferred():
+    gate = MotionGate(threshold=0.002, pixel_diff=8, max_skip=100, min_static=3)
+    positions = [10, 20, 30, 30, 30, 40, 50]
+    assert not any(gate.is_static(frame(x)) for x in positions)
+    assert gate.skipped_frames == 0
+
+
+def test_motion_after_skipping_is_inferred():
+    gate = MotionGate(threshold=0.002, pixel_diff=8, max_skip=100, min_static=1)
+    assert [gate.is_static(frame(x)) for x in (10, 10, 10, 10, 30, 30)] == [False, False, True, True, False, False]
+
+
+def test_max_skip_forces_inference():
+    gate = MotionGate(threshold=0.002, pixel_diff=8, max_skip=2, min_static=0)
+    assert [gate.is_static(frame(10)) for _ in range(7)] == [False, True, True, False, True, True, False]
+
+
+def test_scores_match_ungated_run_on_active_clip(synthetic_clip):
+    from analyze import analyze_kickboxing_form
+
+    clip = synthetic_clip(320, 240, 2.0)
+    ungated = analyze_kickboxing_form(clip, frame_stride=1, motion_gate=False)
+    gated = analyze_kickboxing_form(clip, frame_stride=1, motion_gate=True)
+    assert gated['scores'] == ungated['scores']
@@ -0,0 +1,60 @@
+"""analyze.plan_segments の区間分割"""
+
+import pytest
+from analyze import plan_segments
+
+
+def sampled(total_frames, stride, start, end):
+    """[start, end) のうち解析するフレーム番号（end が None なら終端まで）"""
+    stop = total_frames if end is None else min(end, total_frames)
+    return [index for index in range(start, stop) if index % stride == 0]
+
+
+def test_short_video_is_one_segment():
+    assert plan_segments(100, 1, workers=4, overlap=5, min_frames=60) == [(0, 0, None)]
+
+
+def test_single_worker_is_one_segment():
+    assert plan_segments(10000, 2, workers=1, overlap=5, min_frames=10) == [(0, 0, None)]
+
+
+def test_empty_video_is_one_segment():
+    assert plan_segments(0, 1, workers=4, overlap=5, min_frames=10) == [(0, 0, None)]
+
+
+@pytest.mark.parametrize('total_frames, stride, workers', [
+    (600, 1, 4),
+    (601, 2, 3),
+    (1000, 3, 4),
+    (997, 7, 2),
+    (450, 2, 8),
+])
+def test_segments_cover_sampled_frames_once(total_frames, stride, workers):
+    segments = plan_segments(total_frames, stride, workers, overlap=4, min_frames=20)
+    assert 1 < len(segments) <= workers
+
+    # 区間を連結すると、全体を順に解析した場合と同じフレーム列になる
+    frames = []
+    for _, start, end in segments:
+        frames.extend(sampled(total_frames, stride, start, end))
+    assert frames == list(range(0, total_frames, stride))
+
+    # 境界は解析フレームに揃い、隙間なく続く。最後の区間だけ終端まで読む
+    for (_, _, end), (_, next_start, _) in zip(segments, segments[1:]):
+        assert end == next_start
+        assert next_start % stride == 0
+    assert segments[0][1] == 0
+    assert segments[-1][2] is None
+
+
+def test_warmup_starts_overlap_frames_before_segment():
+    segments = plan_segments(1000, 2, workers=4, overlap=5, min_frames=20)
+    assert segments[0][0] == 0
+    for warmup_start, start, _ in segments[1:]:
+        assert warmup_start == start - 5 * 2
+
+
+def test_segment_count_respects_min_frames():
+    # 解析フレーム100枚・1区間あたり最低40枚なら、ワーカーが多くても2区間まで
+    segments = plan_segments(200, 2, workers=8, overlap=0, min_frames=40)
+    assert len(segments) == 2
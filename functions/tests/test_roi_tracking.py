@@ -0,0 +1,100 @@
+"""RoiTracker の切り出し範囲・座標の戻し方・Poseのリセット"""
+
+from types import SimpleNamespace
+import numpy as np
+from roi_tracking import RoiTracker
+
+WIDTH = 640
+HEIGHT = 360
+
+
+class FakePose:
+    """
+    画像の中の明るい矩形を人物とみなし、その範囲に33点を並べて返す Pose の代わり
+
+    受け取った画像の大きさ（全体画像・切り出し・reset_pose の空フレーム）を記録する。
+    """
+
+    def __init__(self):
+        self.shapes = []
+
+    def process(self, image):
+        self.shapes.append(image.shape[:2])
+        ys, xs = np.nonzero(image[..., 0])
+        if len(xs) == 0:
+            return SimpleNamespace(pose_landmarks=None)
+        height, width = image.shape[:2]
+        left, right = xs.min() / width, (xs.max() + 1) / width
+        top, bottom = ys.min() / height, (ys.max() + 1) / height
+        t = np.linspace(0, 1, 33)
+        landmarks = [
+            SimpleNamespace(x=left + (right - left) * u, y=top + (bottom - top) * u, z=0.0, visibility=0.9)
+            for u in t
+        ]
+        return SimpleNamespace(pose_landmarks=SimpleNamespace(landmark=landmarks))
+
+    @property
+    def resets(self):
+        return sum(1 for shape in self.shapes if shape == (64, 64))
+
+
+def frame_with_person(x, y, width=60, height=120):
+    image = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    image[y:y + height, x:x + width] = 255
+    return image
+
+
+def expected_landmarks(x, y, width=60, height=120):
+    t = np.linspace(0, 1, 33)
+    return (x + width * t) / WIDTH, (y + height * t) / HEIGHT
+
+
+def test_crops_a_square_box_around_the_person():
+    pose = FakePose()
+    tracker = RoiTracker(padding=0.3)
+    tracker.process(pose, frame_with_person(200, 100))
+    assert pose.shapes == [(HEIGHT, WIDTH)]
+    x0, y0, x1, y1 = tracker.box
+    assert x1 - x0 == y1 - y0
+    assert x0 <= 200 and x1 >= 260 and y0 <= 100 and y1 >= 220
+
+    landmarks = tracker.process(pose, frame_with_person(200, 100))
+    assert pose.shapes[-1] == (y1 - y0, x1 - x0)
+    xs, ys = expected_landmarks(200, 100)
+    np.testing.assert_allclose(landmarks[:, 0], xs, atol=1e-5)
+    np.testing.assert_allclose(landmarks[:, 1], ys, atol=1e-5)
+
+
+def test_small_moves_do_not_reset_pose():
+    pose = FakePose()
+    tracker = RoiTracker(padding=0.3)
+    boxes = set()
+    for step in range(30):
+        landmarks = tracker.process(pose, frame_with_person(200 + 2 * step, 100, width=100, height=100))
+        boxes.add(tracker.box)
+        xs, _ = expected_landmarks(200 + 2 * step, 100, width=100, height=100)
+        np.testing.assert_allclose(landmarks[:, 0], xs, atol=1e-5)
+    assert tracker.cropped_frames == 29
+    # 矩形は動くが、リセットするのは全体画像から切り出しに切り替えたときの1回だけ
+    assert len(boxes) > 1
+    assert tracker.resets == pose.resets == 1
+
+
+def test_switching_to_the_full_frame_resets_pose():
+    pose = FakePose()
+    tracker = RoiTracker(padding=0.3)
+    tracker.process(pose, frame_with_person(100, 100))
+    tracker.process(pose, frame_with_person(100, 100))
+    # 切り出し範囲の外に移動 → 全体画像で推論し直す
+    landmarks = tracker.process(pose, frame_with_person(500, 100))
+    assert tracker.fallbacks == 1
+    assert tracker.resets == pose.resets == 2
+    xs, _ = expected_landmarks(500, 100)
+    np.testing.assert_allclose(landmarks[:, 0], xs, atol=1e-5)
+
+
+def test_large_person_uses_the_full_frame():
+    pose = FakePose()
+    tracker = RoiTracker(padding=0.3, max_area=0.7)
+    tracker.process(pose, frame_with_person(200, 20, width=200, height=320))
+    assert tracker.box is None
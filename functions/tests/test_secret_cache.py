@@ -0,0 +1,167 @@
+"""secret_cache.SecretCache の有効期限・同時取得・バックグラウンド更新"""
+
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+import secret_cache
+from secret_cache import SecretCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(secret_cache, 'time', SimpleNamespace(monotonic=clock))
+    return clock
+
+
+class Fetcher:
+    """呼ばれた回数を数え、呼ぶたびに value-1, value-2, ... を返す"""
+
+    def __init__(self):
+        self.calls = 0
+        self.error = None
+        self.lock = threading.Lock()
+
+    def __call__(self, key):
+        with self.lock:
+            self.calls += 1
+            calls = self.calls
+        if self.error is not None:
+            raise self.error
+        return f"{key}-{calls}"
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.01)
+
+
+def test_value_is_cached_until_ttl(clock):
+    fetch = Fetcher()
+    cache = SecretCache(fetch, ttl=300, refresh_ahead=0)
+    assert cache.get('token') == 'token-1'
+    clock.now += 299
+    assert cache.get('token') == 'token-1'
+    assert (fetch.calls, cache.hits, cache.misses) == (1, 1, 1)
+
+    clock.now += 1
+    assert cache.get('token') == 'token-2'
+    assert fetch.calls == 2
+
+
+def test_keys_are_cached_separately(clock):
+    fetch = Fetcher()
+    cache = SecretCache(fetch, ttl=300, refresh_ahead=0)
+    assert cache.get('a') == 'a-1'
+    assert cache.get('b') == 'b-2'
+    assert cache.get('a') == 'a-1'
+
+
+def test_zero_ttl_disables_cache(clock):
+    fetch = Fetcher()
+    cache = SecretCache(fetch, ttl=0)
+    cache.get('token')
+    cache.get('token')
+    assert fetch.calls == 2
+
+
+def test_invalidate_forces_refetch(clock):
+    fetch = Fetcher()
+    cache = SecretCache(fetch, ttl=300, refresh_ahead=0)
+    cache.get('token')
+    cache.invalidate('token')
+    assert cache.get('token') == 'token-2'
+
+
+def test_stale_value_is_served_when_refetch_fails(clock):
+    fetch = Fetcher()
+    cache = SecretCache(fetch, ttl=300, refresh_ahead=0)
+    cache.get('token')
+    clock.now += 301
+    fetch.error = RuntimeError('secret manager unavailable')
+    assert cache.get('token') == 'token-1'
+
+
+def test_first_fetch_error_is_raised(clock):
+    fetch = Fetcher()
+    fetch.error = RuntimeError('secret manager unavailable')
+    cache = SecretCache(fetch, ttl=300)
+    with pytest.raises(RuntimeError):
+        cache.get('token')
+
+
+def test_concurrent_misses_fetch_once():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch(key):
+        calls.append(key)
+        started.set()
+        release.wait(5)
+        return 'value'
+
+    cache = SecretCache(fetch, ttl=300, refresh_ahead=0)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('token'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(5)
+    # 残りのスレッドがキーのロックで待つまで少し待ってから取得を終わらせる
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == ['token']
+    assert results == ['value'] * 8
+    assert cache.misses == 1
+
+
+def test_refresh_ahead_serves_cached_value_and_refreshes_in_background(clock):
+    fetch = Fetcher()
+    cache = SecretCache(fetch, ttl=300, refresh_ahead=60)
+    assert cache.get('token') == 'token-1'
+
+    clock.now += 250
+    # 更新の前後どちらでも、呼び出し側は待たずにキャッシュの値を受け取る
+    assert cache.get('token') == 'token-1'
+    wait_until(lambda: fetch.calls == 2 and not cache._key_lock('token').locked())
+    assert cache.refreshes == 1
+
+    assert cache.get('token') == 'token-2'
+    # 取得し直した時刻から数え直す
+    clock.now += 200
+    assert cache.get('token') == 'token-2'
+    assert fetch.calls == 2
+
+
+def test_refresh_ahead_starts_only_one_refresh():
+    release = threading.Event()
+    calls = []
+
+    def fetch(key):
+        calls.append(key)
+        if len(calls) > 1:
+            release.wait(5)
+        return f"value-{len(calls)}"
+
+    cache = SecretCache(fetch, ttl=300, refresh_ahead=300)
+    assert cache.get('token') == 'value-1'
+    for _ in range(5):
+        assert cache.get('token') == 'value-1'
+    release.set()
+    wait_until(lambda: not cache._key_lock('token').locked())
+    assert len(calls) == 2
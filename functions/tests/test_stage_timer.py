@@ -0,0 +1,89 @@
+"""stage_timer.StageTimer の集計と、フレーム単位の分布のメモリ上限、解析結果の timings"""
+
+import pickle
+import numpy as np
+import pytest
+from stage_timer import NUM_BUCKETS, StageTimer
+
+# ヒストグラムのバケット幅（1桁20分割）の半分
+RELATIVE_ERROR = 10 ** (0.5 / 20) - 1 + 1e-9
+
+
+def test_stage_and_add_accumulate_totals():
+    timer = StageTimer()
+    with timer.stage('download'):
+        pass
+    timer.add('dify', 0.25)
+    timer.add('dify', 0.5)
+    summary = timer.summary()
+    assert summary['dify'] == {'total_ms': 750.0, 'count': 2}
+    assert summary['download']['count'] == 1
+    assert 'p50_ms' not in summary['dify']
+
+
+def test_frame_percentiles_are_within_bucket_error():
+    rng = np.random.default_rng(0)
+    samples = rng.lognormal(mean=np.log(0.02), sigma=0.6, size=5000)
+    timer = StageTimer()
+    for seconds in samples:
+        timer.add_frame('inference', float(seconds))
+
+    summary = timer.summary()['inference']
+    for key, q in (('p50_ms', 50), ('p95_ms', 95)):
+        expected = np.percentile(samples, q) * 1000
+        assert summary[key] == pytest.approx(expected, rel=RELATIVE_ERROR + 0.01)
+    assert summary['max_ms'] == round(samples.max() * 1000, 2)
+    assert summary['count'] == 5000
+
+
+def test_single_sample_reports_its_own_value():
+    timer = StageTimer()
+    timer.add_frame('inference', 0.0123)
+    summary = timer.summary()['inference']
+    assert summary['max_ms'] == 12.3
+    assert summary['p50_ms'] == pytest.approx(12.3, rel=RELATIVE_ERROR)
+    assert summary['p50_ms'] <= 12.3
+
+
+def test_memory_does_not_grow_with_frames():
+    timer = StageTimer()
+    for i in range(20000):
+        timer.add_frame('decode', 0.001 + (i % 100) * 1e-5)
+    state = timer.state()
+    assert state['histograms']['decode'].shape == (NUM_BUCKETS,)
+    assert len(pickle.dumps(state)) < 4096
+
+
+def test_out_of_range_samples_are_clamped():
+    timer = StageTimer()
+    timer.add_frame('decode', 0.0)
+    timer.add_frame('decode', 1e4)
+    assert timer.histograms['decode'].sum() == 2
+    assert timer.summary()['decode']['max_ms'] == 1e7
+
+
+def test_merge_combines_segment_states():
+    first, second, whole = StageTimer(), StageTimer(), StageTimer()
+    for i in range(100):
+        seconds = 0.001 * (i + 1)
+        (first if i < 60 else second).add_frame('inference', seconds)
+        whole.add_frame('inference', seconds)
+    first.add('decode', 1.0)
+
+    merged = StageTimer()
+    merged.merge(pickle.loads(pickle.dumps(first.state())))
+    merged.merge(pickle.loads(pickle.dumps(second.state())))
+    assert merged.summary()['inference'] == whole.summary()['inference']
+    assert merged.summary()['decode'] == {'total_ms': 1000.0, 'count': 1}
+
+
+def test_analysis_result_reports_stage_timings(synthetic_clip):
+    from analyze import analyze_kickboxing_form
+
+    result = analyze_kickboxing_form(synthetic_clip(320, 240, 1.0), frame_stride=1)
+    timings = result['timings']
+    for name in ('decode', 'color', 'inference'):
+        assert timings[name]['count'] == 30
+        assert 0 < timings[name]['p50_ms'] <= timings[name]['p95_ms'] <= timings[name]['max_ms'] * (1 + RELATIVE_ERROR)
+        assert timings[name]['total_ms'] >= timings[name]['max_ms']
+    assert 'scoring' in timings
@@ -0,0 +1,41 @@
+"""tune_threads の推論スレッド数（CPU数をワーカー数・同時に使うPoseの数で分け合う）"""
+
+import pytest
+import pose_pool
+import thread_tuning
+
+
+@pytest.fixture
+def tune(monkeypatch):
+    """CPU数を固定し、毎回決め直す tune_threads"""
+    def run(cpus, pool_size=0, **kwargs):
+        monkeypatch.setattr(thread_tuning, '_tuned', None)
+        monkeypatch.setattr(thread_tuning, 'available_cpus', lambda: cpus)
+        monkeypatch.setattr(pose_pool, 'available_cpus', lambda: cpus)
+        monkeypatch.setattr(pose_pool, 'POSE_POOL_SIZE', pool_size)
+        return thread_tuning.tune_threads(**kwargs)
+
+    monkeypatch.setattr(thread_tuning, 'ANALYSIS_CV_THREADS', 0)
+    monkeypatch.setattr(thread_tuning, 'POSE_INFERENCE_THREADS', 0)
+    monkeypatch.setattr(thread_tuning, 'ANALYSIS_THREAD_CALIBRATION', False)
+    monkeypatch.setattr(thread_tuning.cv2, 'setNumThreads', lambda threads: None)
+    return run
+
+
+def test_default_pool_shares_cpus_between_poses(tune):
+    # POSE_POOL_SIZE 未設定ではプールはCPU数ぶんのPoseを持つため、1つあたり1スレッド
+    assert tune(8)['inference_threads'] == 1
+    assert tune(8, pool_size=2)['inference_threads'] == 4
+
+
+def test_single_pose_uses_all_cpus(tune):
+    result = tune(8, concurrent_poses=1)
+    assert result['cv_threads'] == 8
+    assert result['inference_threads'] == 8
+
+
+def test_workers_share_cpus(tune):
+    result = tune(8, share=4, concurrent_poses=1)
+    assert result['cpus'] == 2
+    assert result['inference_threads'] == 2
+    assert tune(3, share=4, concurrent_poses=1)['inference_threads'] == 1
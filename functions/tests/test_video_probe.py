@@ -0,0 +1,100 @@
+"""video_probe のmvhd解析とGCSオブジェクトのプローブ"""
+
+import struct
+import pytest
+import video_probe
+from video_probe import NotFound, parse_mvhd_duration, probe_blob
+
+
+def box(box_type, body):
+    return struct.pack('>I4s', 8 + len(body), box_type.encode('latin-1')) + body
+
+
+def mvhd_v0(timescale, duration):
+    # version/flags(4) + creation(4) + modification(4) + timescale(4) + duration(4) + 残り
+    return box('mvhd', b'\x00\x00\x00\x00' + b'\x00' * 8 + struct.pack('>II', timescale, duration) + b'\x00' * 80)
+
+
+def mvhd_v1(timescale, duration):
+    # version/flags(4) + creation(8) + modification(8) + timescale(4) + duration(8) + 残り
+    return box('mvhd', b'\x01\x00\x00\x00' + b'\x00' * 16 + struct.pack('>IQ', timescale, duration) + b'\x00' * 80)
+
+
+def mp4(*boxes):
+    return box('ftyp', b'isom\x00\x00\x02\x00') + b''.join(boxes)
+
+
+class FakeBlob:
+    """download_as_bytes の範囲読み込みだけを持つGCSオブジェクトの代わり"""
+
+    def __init__(self, data, error=None):
+        self.data = data
+        self.size = len(data)
+        self.error = error
+        self.reads = []
+
+    def download_as_bytes(self, start, end):
+        if self.error is not None:
+            raise self.error
+        self.reads.append((start, end))
+        return self.data[start:end + 1]
+
+
+def test_probe_reads_duration_from_leading_moov():
+    blob = FakeBlob(mp4(box('moov', mvhd_v0(1000, 12500)), box('mdat', b'\x00' * 1000)))
+    info = probe_blob(blob)
+    assert info == {'size': blob.size, 'duration_seconds': 12.5, 'streamable': True}
+
+
+def test_probe_skips_mdat_to_read_trailing_moov(monkeypatch):
+    monkeypatch.setattr(video_probe, 'HEADER_PROBE_BYTES', 64)
+    blob = FakeBlob(mp4(box('mdat', b'\x00' * 5000), box('moov', mvhd_v0(600, 1800))))
+    info = probe_blob(blob)
+    assert info['duration_seconds'] == 3.0
+    assert info['streamable'] is False
+    # mdat の中身は読まない
+    assert sum(end - start + 1 for start, end in blob.reads) < 1000
+
+
+def test_probe_treats_header_read_errors_as_unknown_duration():
+    blob = FakeBlob(mp4(box('moov', mvhd_v0(1000, 1000))), error=RuntimeError('connection reset'))
+    info = probe_blob(blob)
+    assert info['duration_seconds'] is None
+
+
+def test_probe_raises_when_object_is_missing():
+    blob = FakeBlob(mp4(box('moov', mvhd_v0(1000, 1000))), error=NotFound('No such object'))
+    with pytest.raises(NotFound):
+        probe_blob(blob)
+
+
+@pytest.mark.parametrize('make_mvhd', [mvhd_v0, mvhd_v1])
+def test_mvhd_duration(make_mvhd):
+    assert parse_mvhd_duration(box('moov', make_mvhd(90000, 900000))) == 10.0
+
+
+def test_mvhd_v1_uses_64bit_duration():
+    duration = 2 ** 33
+    assert parse_mvhd_duration(box('moov', mvhd_v1(2 ** 20, duration))) == duration / 2 ** 20
+
+
+def test_mvhd_is_found_after_other_boxes():
+    moov = box('moov', box('udta', b'\x00' * 20) + mvhd_v0(1000, 4000) + box('trak', b'\x00' * 40))
+    assert parse_mvhd_duration(moov) == 4.0
+
+
+@pytest.mark.parametrize('make_mvhd', [mvhd_v0, mvhd_v1])
+def test_truncated_mvhd_returns_none(make_mvhd):
+    moov = box('moov', make_mvhd(1000, 4000))
+    # mvhd の途中（duration の手前）で切れたデータ
+    for length in (8, 16, 24, 30):
+        assert parse_mvhd_duration(moov[:length]) is None
+
+
+def test_zero_timescale_returns_none():
+    assert parse_mvhd_duration(box('moov', mvhd_v0(0, 4000))) is None
+
+
+def test_non_moov_input_returns_none():
+    assert parse_mvhd_duration(box('free', mvhd_v0(1000, 4000))) is None
+    assert parse_mvhd_duration(b'') is None
@@ -0,0 +1,181 @@
+"""
+OpenCV と MediaPipe（TFLite / XNNPACK）のスレッド数の自動調整
+
+どちらも既定ではホストのコア数ぶんのスレッドを使おうとするため、CPUを制限したコンテナ（Cloud Run など）では
+割り当て以上のスレッドが奪い合い、逆にコア数の多いマシンでは推論が1スレッドのまま余らせることがある。
+プロセスの起動後最初の解析の前に一度だけ、cgroupのCPU割り当てからスレッド数を決めて設定する。
+
+- cv2.setNumThreads: 縮小・色変換などOpenCV内部の並列処理のスレッド数
+- 推論スレッド数: Pose の推論ノード（InferenceCalculator）の XNNPACK のスレッド数
+
+ANALYSIS_THREAD_CALIBRATION=true の場合は、合成フレームで候補のスレッド数を実際に計測して最速のものを選ぶ
+（起動時に数秒かかるため既定では無効）。
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+import cv2
+import numpy as np
+import mediapipe as mp
+from mediapipe.calculators.tensor import inference_calculator_pb2
+
+logger = logging.getLogger(__name__)
+
+# ANALYSIS_CV_THREADS: OpenCVのスレッド数（0 = 自動）
+# POSE_INFERENCE_THREADS: Poseの推論スレッド数（0 = 自動）
+# ANALYSIS_THREAD_CALIBRATION: true の場合、起動時に合成フレームで計測して決める
+ANALYSIS_CV_THREADS = int(os.environ.get('ANALYSIS_CV_THREADS', '0'))
+POSE_INFERENCE_THREADS = int(os.environ.get('POSE_INFERENCE_THREADS', '0'))
+ANALYSIS_THREAD_CALIBRATION = os.environ.get('ANALYSIS_THREAD_CALIBRATION', 'false').lower() in ('1', 'true', 'yes')
+
+_tuned = None
+_tune_lock = threading.Lock()
+
+
+def _cgroup_cpu_limit():
+    """cgroupのCPU割り当て（コア数、小数は切り上げ）。制限がなければNone"""
+    try:
+        # cgroup v2: "<quota> <period>" または "max <period>"
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        if quota != 'max':
+            return max(1, math.ceil(int(quota) / int(period)))
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus():
+    """このプロセスが使えるCPU数（CPUアフィニティとcgroupのCPU割り当ての小さい方）"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, limit)
+    return max(1, cpus)
+
+
+class ThreadedPose(mp.solutions.pose.Pose):
+    """推論スレッド数を指定できる mp.solutions.pose.Pose"""
+
+    def __init__(self, inference_threads=0, **kwargs):
+        self._inference_threads = inference_threads
+        super().__init__(**kwargs)
+
+    def _modify_calculator_options(self, calculator_graph_config, calculator_params):
+        # 旧Solutions APIは推論ノードの設定を引数で受け付けないため、グラフを生成する直前のフックで書き換える
+        if self._inference_threads > 0:
+            for node in calculator_graph_config.node:
+                if node.calculator.startswith('InferenceCalculator'):
+                    options = node.options.Extensions[inference_calculator_pb2.InferenceCalculatorOptions.ext]
+                    options.delegate.xnnpack.num_threads = self._inference_threads
+        super()._modify_calculator_options(calculator_graph_config, calculator_params)
+
+
+def _candidates(cpus):
+    """計測するスレッド数の候補（1, 2, 4, ... とCPU数）"""
+    candidates = {cpus}
+    n = 1
+    while n < cpus:
+        candidates.add(n)
+        n *= 2
+    return sorted(candidates)
+
+
+def _calibrate_cv(cpus):
+    """フルHDの合成フレームの縮小・色変換が最速になるOpenCVのスレッド数"""
+    frame = np.random.default_rng(0).integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+    timings = {}
+    for threads in _candidates(cpus):
+        cv2.setNumThreads(threads)
+        start = time.perf_counter()
+        for _ in range(10):
+            small = cv2.resize(frame, (960, 540), interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        timings[threads] = time.perf_counter() - start
+    return min(timings, key=timings.get)
+
+
+def _calibrate_inference(cpus):
+    """
+    合成フレームの推論が最速になる推論スレッド数
+
+    人物のいないフレームでは毎フレーム人物検出モデルが動くため、
+    モデルの読み込みを除いた推論時間を安定して比べられる。
+    """
+    frame = np.random.default_rng(0).integers(0, 256, (360, 640, 3), dtype=np.uint8)
+    timings = {}
+    for threads in _candidates(cpus):
+        with ThreadedPose(inference_threads=threads) as pose:
+            for _ in range(2):
+                pose.process(frame)
+            start = time.perf_counter()
+            for _ in range(5):
+                pose.process(frame)
+            timings[threads] = time.perf_counter() - start
+    return min(timings, key=timings.get)
+
+
+def tune_threads(share=1, concurrent_poses=None):
+    """
+    OpenCVと推論のスレッド数を決めて設定（プロセスごとに最初の1回だけ実行し、以降は結果を返す）
+
+    Args:
+        share: CPUを分け合うプロセス数（区間並列・バッチのワーカーではワーカー数）。
+               2回目以降の呼び出しでは無視される
+        concurrent_poses: このプロセスで同時に推論するPoseの数（推論スレッドはこの数で分け合う）。
+                          省略時はPoseプールのサイズ（pose_pool.default_pool_size()）。
+                          1本ずつ推論するワーカーやCLIでは 1 を渡す
+
+    Returns:
+        dict: cpus（このプロセスに割り当てたCPU数）/ cv_threads / inference_threads / calibrated
+    """
+    global _tuned
+    with _tune_lock:
+        if _tuned is not None:
+            return _tuned
+
+        cpus = max(1, available_cpus() // max(1, int(share)))
+        calibrated = ANALYSIS_THREAD_CALIBRATION and cpus > 1
+        if concurrent_poses is None:
+            # pose_pool は create_pose のために thread_tuning を import するため、ここで import する
+            from pose_pool import default_pool_size
+            concurrent_poses = default_pool_size()
+        inference_cpus = max(1, cpus // max(1, int(concurrent_poses)))
+
+        cv_threads = ANALYSIS_CV_THREADS
+        if cv_threads <= 0:
+            cv_threads = _calibrate_cv(cpus) if calibrated else cpus
+        cv2.setNumThreads(cv_threads)
+
+        inference_threads = POSE_INFERENCE_THREADS
+        if inference_threads <= 0:
+            inference_threads = _calibrate_inference(inference_cpus) if calibrated else inference_cpus
+
+        _tuned = {
+            'cpus': cpus,
+            'cv_threads': cv_threads,
+            'inference_threads': inference_threads,
+            'calibrated': calibrated,
+        }
+        logger.info(
+            f"🧵 スレッド数を設定: CPU={cpus} OpenCV={cv_threads} 推論={inference_threads}"
+            f"{'（計測して決定）' if calibrated else ''}"
+        )
+        return _tuned
@@ -0,0 +1,174 @@
+"""
+動画のプローブ（ダウンロード前の事前チェック）
+
+GCSオブジェクトのメタデータ（サイズ）と、コンテナヘッダー（moov/mvhd）の
+範囲読み込みだけで、ファイルサイズ・動画の長さ・ストリーミング可否を判定する。
+制限を超える動画はダウンロードする前に拒否できる。
+"""
+
+import os
+import struct
+import logging
+
+try:
+    from google.api_core.exceptions import NotFound
+except ImportError:
+    # google-cloud-storage を使わない場合（ローカルのファイルを解析する場合など）
+    class NotFound(Exception):
+        pass
+
+logger = logging.getLogger(__name__)
+
+# 先頭から一度に読むバイト数（ftyp/moovが先頭にあれば大抵これで足りる）
+HEADER_PROBE_BYTES = int(os.environ.get('HEADER_PROBE_BYTES', str(64 * 1024)))
+# moovの読み込み上限（これより大きいmoovは解析しない）
+MAX_MOOV_BYTES = int(os.environ.get('MAX_MOOV_BYTES', str(8 * 1024 * 1024)))
+# 先頭から辿るトップレベルボックスの最大数
+MAX_TOP_LEVEL_BOXES = 64
+
+
+def parse_box_header(data, offset=0):
+    """
+    ボックスヘッダーを解析
+
+    Returns:
+        tuple: (type, size, header_size)、ヘッダーが不完全ならNone
+               size=0（ファイル末尾まで）の場合は0のまま返す
+    """
+    if offset + 8 > len(data):
+        return None
+    size, box_type = struct.unpack('>I4s', data[offset:offset + 8])
+    header_size = 8
+    if size == 1:
+        if offset + 16 > len(data):
+            return None
+        size = struct.unpack('>Q', data[offset + 8:offset + 16])[0]
+        header_size = 16
+    return box_type.decode('latin-1'), size, header_size
+
+
+def iter_boxes(data, offset=0, end=None):
+    """
+    ISO BMFF（MP4/MOV）のボックスを (type, offset, size, header_size) として順に返す
+
+    dataが途中までしかなくても、ヘッダーが読める範囲のボックスは返す。
+    """
+    if end is None:
+        end = len(data)
+    while offset + 8 <= end:
+        header = parse_box_header(data, offset)
+        if header is None or offset + header[2] > end:
+            return
+        box_type, size, header_size = header
+        if size == 0:
+            # 0 = ファイル末尾まで
+            size = end - offset
+        if size < header_size:
+            return
+        yield box_type, offset, size, header_size
+        offset += size
+
+
+def parse_mvhd_duration(moov):
+    """
+    moovボックスの中身からmvhdを探し、動画の長さ（秒）を返す
+
+    Args:
+        moov: moovボックス全体（ヘッダーを含む）のバイト列
+
+    Returns:
+        float: 長さ（秒）、見つからなければNone
+    """
+    header = parse_box_header(moov)
+    if header is None or header[0] != 'moov':
+        return None
+    for box_type, offset, size, header_size in iter_boxes(moov, header[2], len(moov)):
+        if box_type != 'mvhd':
+            continue
+        body = moov[offset + header_size:offset + size]
+        if len(body) < 4:
+            return None
+        version = body[0]
+        if version == 1:
+            if len(body) < 32:
+                return None
+            timescale, duration = struct.unpack('>IQ', body[20:32])
+        else:
+            if len(body) < 20:
+                return None
+            timescale, duration = struct.unpack('>II', body[12:20])
+        if timescale == 0:
+            return None
+        return duration / timescale
+    return None
+
+
+def _read_range(blob, start, length):
+    return blob.download_as_bytes(start=start, end=start + length - 1)
+
+
+def probe_blob(blob, size=None):
+    """
+    GCSオブジェクトを範囲読み込みだけでプローブ
+
+    先頭を読み、トップレベルボックスをサイズに従って辿ってmoovの位置を探す
+    （moovが末尾にある場合も、mdatを飛ばして末尾のmoovだけを読む）。
+
+    Args:
+        blob: google.cloud.storage.Blob
+        size: オブジェクトのサイズ（CloudEventに含まれていればメタデータ取得を省略できる）
+
+    Returns:
+        dict: size（バイト）/ duration_seconds（不明ならNone）/ streamable（moovがmdatより前か）
+
+    Raises:
+        NotFound: オブジェクトが存在しない場合（ヘッダーの読み込みで分かった場合も含む）
+        その他: メタデータの取得に失敗した場合。ヘッダーの読み込み・解析の失敗は長さ不明として続行する
+    """
+    if size is None:
+        if blob.size is None:
+            blob.reload()
+        size = blob.size or 0
+    info = {'size': size, 'duration_seconds': None, 'streamable': False}
+    if size <= 0:
+        return info
+
+    try:
+        header = _read_range(blob, 0, min(size, HEADER_PROBE_BYTES))
+        offset = 0
+        seen_mdat = False
+        for _ in range(MAX_TOP_LEVEL_BOXES):
+            if offset + 8 > size:
+                break
+            if offset + 16 <= len(header):
+                box_header = parse_box_header(header, offset)
+            else:
+                box_header = parse_box_header(_read_range(blob, offset, min(16, size - offset)))
+            if box_header is None:
+                break
+            box_type, box_size, header_size = box_header
+            if box_size == 0:
+                box_size = size - offset
+            if box_size < header_size:
+                break
+
+            if box_type == 'mdat':
+                seen_mdat = True
+            elif box_type == 'moov':
+                info['streamable'] = not seen_mdat
+                if box_size > MAX_MOOV_BYTES:
+                    logger.warning(f"⚠️ moovが大きすぎるため長さの事前判定をスキップ: {box_size} bytes")
+                    break
+                if offset + box_size <= len(header):
+                    moov = header[offset:offset + box_size]
+                else:
+                    moov = _read_range(blob, offset, box_size)
+                info['duration_seconds'] = parse_mvhd_duration(moov)
+                break
+            offset += box_size
+    except NotFound:
+        raise
+    except Exception as e:
+        logger.warning(f"⚠️ 動画ヘッダーのプローブに失敗（ダウンロード後に判定します）: {str(e)}")
+
+    return info
@@ -0,0 +1,117 @@
+"""
+GCSからのストリーミング取り込み
+
+動画を一時ファイルに全部ダウンロードしてから解析するのではなく、
+チャンク単位で読み込んだバイト列を名前付きパイプ（FIFO）に流し、
+OpenCV（FFmpeg）がダウンロード中の動画をそのままデコードできるようにする。
+
+FIFOはシークできないため、moovボックス（インデックス）がmdatより前にある
+「faststart」形式のMP4/MOVだけが対象（判定は video_probe.probe_blob）。
+それ以外は従来どおり全体をダウンロードする。
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+VIDEO_STREAMING_INGEST = os.environ.get('VIDEO_STREAMING_INGEST', 'false').lower() in ('1', 'true', 'yes')
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', str(1024 * 1024)))  # 1MB
+
+
+class BlobFifoStream:
+    """
+    GCSオブジェクトをチャンク単位で読み込み、FIFOに書き込むバックグラウンドストリーム
+
+    使い方:
+        stream = BlobFifoStream(blob, max_bytes)
+        stream.start()
+        try:
+            cap = cv2.VideoCapture(stream.path)  # 読み込み側
+            ...
+        finally:
+            stream.close()
+
+    max_bytes を超えた時点で書き込みを打ち切り、size_exceeded をTrueにする
+    （読み込み側にはEOFとして見える）。
+    """
+
+    def __init__(self, blob, max_bytes, chunk_size=None):
+        self.blob = blob
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size or STREAM_CHUNK_SIZE
+        self.bytes_written = 0
+        self.size_exceeded = False
+        self.error = None
+        self._cancel = threading.Event()
+        self._dir = tempfile.mkdtemp(prefix='video_stream_')
+        self.path = os.path.join(self._dir, 'video.mp4')
+        os.mkfifo(self.path)
+        self._thread = threading.Thread(target=self._run, name='blob-fifo-writer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            # 読み込み側がFIFOを開くまでここでブロックする
+            with open(self.path, 'wb', buffering=0) as fifo:
+                with self.blob.open('rb', chunk_size=self.chunk_size) as reader:
+                    while not self._cancel.is_set():
+                        chunk = reader.read(self.chunk_size)
+                        if not chunk:
+                            break
+                        if self.bytes_written + len(chunk) > self.max_bytes:
+                            self.size_exceeded = True
+                            logger.error(f"❌ ストリーミング中にサイズ上限を超過: {self.max_bytes / 1024 / 1024:.0f}MB")
+                            break
+                        fifo.write(chunk)
+                        self.bytes_written += len(chunk)
+        except BrokenPipeError:
+            # 読み込み側が先に閉じた（キャッシュヒットや解析の中断）
+            pass
+        except Exception as e:
+            self.error = e
+            logger.error(f"❌ ストリーミングダウンロードエラー: {str(e)}")
+        finally:
+            self._release_late_readers()
+
+    def _release_late_readers(self):
+        # 書き込み終了後にFIFOを開き直す読み込み側（FFmpegが失敗した後の別バックエンドなど）は
+        # 書き込み側がいないとopen()から戻らないため、close()まで開いてすぐ閉じてEOFを返し続ける
+        while not self._cancel.wait(0.05):
+            try:
+                fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+                os.close(fd)
+            except OSError:
+                pass
+
+    def close(self):
+        """書き込みを止めてスレッドを回収し、FIFOを削除"""
+        self._cancel.set()
+        if self._thread.is_alive():
+            # 読み込み側がFIFOを開いていない場合、書き込み側はopen()やwrite()で止まったままになる。
+            # こちらで読み込み側として開き、スレッドが終わるまで残りを読み捨ててブロックを解除する
+            fd = None
+            try:
+                fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+                deadline = time.monotonic() + 30
+                while self._thread.is_alive() and time.monotonic() < deadline:
+                    try:
+                        os.read(fd, 65536)
+                    except BlockingIOError:
+                        pass
+                    self._thread.join(timeout=0.05)
+            except OSError:
+                pass
+            finally:
+                if fd is not None:
+                    os.close(fd)
+            self._thread.join(timeout=30)
+        shutil.rmtree(self._dir, ignore_errors=True)
+
@@ -0,0 +1,91 @@
+// Landmark payload decoder (.lmq / .lmq.gz written by analyze_video.py)
+// Format details: functions/landmark_format.py
+
+const MAGIC = 'LMQ1';
+const NUM_LANDMARKS = 33;
+const RECORD_SIZE = 2 + NUM_LANDMARKS * 3 * 2 + NUM_LANDMARKS + 1;
+const VISIBILITY_SCALE = 255;
+
+/**
+ * Decode an uncompressed .lmq payload.
+ * Returns { fps, width, height, count, frameIndices: Int32Array, landmarks: Float32Array }
+ * where landmarks is laid out as [frame][landmark][x, y, z, visibility].
+ */
+export function decodeLandmarks(buffer) {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== MAGIC) {
+    throw new Error('not a quantized landmark file');
+  }
+  const headerSize = view.getUint16(6, true);
+  const fps = view.getFloat32(16, true);
+  const width = view.getUint32(20, true);
+  const height = view.getUint32(24, true);
+  const scale = view.getFloat32(28, true);
+  // Derive the count from the byte length so a partially written file still decodes
+  const count = Math.floor((buffer.byteLength - headerSize) / RECORD_SIZE);
+
+  const frameIndices = new Int32Array(count);
+  const landmarks = new Float32Array(count * NUM_LANDMARKS * 4);
+  // Running quantized values; deltas wrap at 16 / 8 bits just like the encoder
+  const coords = new Int16Array(NUM_LANDMARKS * 3);
+  const visibility = new Uint8Array(NUM_LANDMARKS);
+  let frame = 0;
+
+  for (let i = 0; i < count; i++) {
+    let offset = headerSize + i * RECORD_SIZE;
+    frame += view.getUint16(offset, true);
+    frameIndices[i] = frame;
+    offset += 2;
+    for (let j = 0; j < NUM_LANDMARKS * 3; j++) {
+      coords[j] += view.getInt16(offset + j * 2, true);
+    }
+    offset += NUM_LANDMARKS * 3 * 2;
+    const base = i * NUM_LANDMARKS * 4;
+    for (let k = 0; k < NUM_LANDMARKS; k++) {
+      visibility[k] += view.getUint8(offset + k);
+      landmarks[base + k * 4] = coords[k * 3] / scale;
+      landmarks[base + k * 4 + 1] = coords[k * 3 + 1] / scale;
+      landmarks[base + k * 4 + 2] = coords[k * 3 + 2] / scale;
+      landmarks[base + k * 4 + 3] = visibility[k] / VISIBILITY_SCALE;
+    }
+  }
+
+  return { fps, width, height, count, frameIndices, landmarks };
+}
+
+/**
+ * Fetch and decode a .lmq or .lmq.gz payload.
+ * gzip is unpacked with DecompressionStream when the server did not already do it.
+ */
+export async function fetchLandmarks(url) {
+  const response = await fetch(url);
+  if (!response.ok) {
+    throw new Error(`landmark fetch failed: ${response.status}`);
+  }
+  let buffer = await response.arrayBuffer();
+  const head = new Uint8Array(buffer, 0, Math.min(2, buffer.byteLength));
+  if (head[0] === 0x1f && head[1] === 0x8b) {
+    const stream = new Blob([buffer]).stream().pipeThrough(new DecompressionStream('gzip'));
+    buffer = await new Response(stream).arrayBuffer();
+  }
+  return decodeLandmarks(buffer);
+}
+
+/**
+ * Landmarks of one frame as [{ x, y, z, visibility }, ...] (same shape as the old landmarks.json).
+ */
+export function getFrameLandmarks(decoded, index) {
+  const points = [];
+  const base = index * NUM_LANDMARKS * 4;
+  for (let k = 0; k < NUM_LANDMARKS; k++) {
+    const o = base + k * 4;
+    points.push({
+      x: decoded.landmarks[o],
+      y: decoded.landmarks[o + 1],
+      z: decoded.landmarks[o + 2],
+      visibility: decoded.landmarks[o + 3],
+    });
+  }
+  return points;
+}